@@ -0,0 +1,128 @@
+"""
+Benchmark of the responses acknowledging chunks (see
+`CHUNKED_UPLOAD_ACK_MODE`): the time to build the response of each mode
+(and of the default mode with the orjson encoder), and the throughput of
+small chunks uploaded through `ChunkedUploadView` with each mode, with
+Django's test client and a SQLite database.
+
+Usage::
+
+    python benchmarks/acks.py --repeat 100000 --chunks 2000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from uploads import setup, get_client, percentile, urlpatterns  # noqa: E402
+
+MODES = (None, 'json', 'headers')
+
+
+def bench_build(repeat):
+    """
+    Returns the average time (in µs) to build the response of each mode.
+    """
+    from django.http import HttpResponse
+    from django.utils import timezone
+    from chunked_upload.encoders import orjson_encode
+    from chunked_upload.models import ChunkedUpload
+    from chunked_upload.response import Response, ack_response
+    from chunked_upload.settings import CONTENT_TYPE
+    from chunked_upload.views import ChunkedUploadView
+
+    chunked_upload = ChunkedUpload(offset=1024 ** 2, total_size=8 * 1024 ** 2,
+                                   expires_on=timezone.now())
+    view = ChunkedUploadView()
+
+    builders = {
+        'default': lambda: Response(
+            view.get_response_data(chunked_upload, None), status=200),
+        'default (orjson)': lambda: HttpResponse(
+            orjson_encode(view.get_response_data(chunked_upload, None)),
+            content_type=CONTENT_TYPE),
+        'json': lambda: ack_response(chunked_upload, 'json'),
+        'headers': lambda: ack_response(chunked_upload, 'headers'),
+    }
+    return {name: timeit.timeit(build, number=repeat) / repeat * 10 ** 6
+            for name, build in builders.items()}
+
+
+def bench_upload(chunks, chunk_size):
+    """
+    Returns the throughput (chunks/s) and p50/p99 latency (in ms) of each
+    mode, appending `chunks` chunks of `chunk_size` bytes to an upload.
+    """
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.urls import path
+    from chunked_upload.views import ChunkedUploadView
+
+    for mode in MODES:
+        urlpatterns.append(path('ack/%s/' % mode,
+                                ChunkedUploadView.as_view(ack_mode=mode)))
+    client = get_client()
+    data = os.urandom(chunk_size)
+    total = chunks * chunk_size
+    results = {}
+    for mode in MODES:
+        upload_id = None
+        latencies = []
+        start_time = time.perf_counter()
+        for i in range(chunks):
+            post = {'file': SimpleUploadedFile('benchmark.bin', data)}
+            if upload_id:
+                post['upload_id'] = upload_id
+            start = time.perf_counter()
+            response = client.post(
+                '/ack/%s/' % mode, post, HTTP_CONTENT_RANGE='bytes %i-%i/%i' % (
+                    i * chunk_size, (i + 1) * chunk_size - 1, total))
+            latencies.append(time.perf_counter() - start)
+            if response.status_code not in (200, 204):
+                raise RuntimeError(response.content)
+            if upload_id is None:
+                upload_id = (response['Upload-Id'] if mode == 'headers'
+                             else response.json()['upload_id'])
+        elapsed = time.perf_counter() - start_time
+        results[str(mode)] = {
+            'chunks_per_s': chunks / elapsed,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=100000,
+                        help='Responses built per mode (default: 100000)')
+    parser.add_argument('--chunks', type=int, default=2000,
+                        help='Chunks uploaded per mode (default: 2000)')
+    parser.add_argument('--chunk-size', type=int, default=1024)
+    parser.add_argument('--json', action='store_true',
+                        help='Print the results as JSON')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='chunked_upload_benchmark_')
+    setup(os.path.join(workdir, 'db.sqlite3'), os.path.join(workdir, 'media'),
+          {})
+    results = {'build_us': bench_build(args.repeat),
+               'upload': bench_upload(args.chunks, args.chunk_size)}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print('Response building (µs per response)')
+    for name, us in results['build_us'].items():
+        print('  %-20s %8.2f' % (name, us))
+    print('Upload of %i chunks of %i bytes' % (args.chunks, args.chunk_size))
+    for mode, result in results['upload'].items():
+        print('  %-20s %8.0f chunks/s  p50 %.2f ms  p99 %.2f ms' % (
+            mode, result['chunks_per_s'], result['p50_ms'], result['p99_ms']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Benchmark of the queries run on the chunked uploads table: the lookup of
+each chunk request, the listing of the in progress uploads of a user and
+the batches of `delete_expired_uploads`. Prints the query plan and average
+time of each query on a SQLite database filled with `--rows` uploads.
+
+Usage::
+
+    python benchmarks/queries.py --rows 10000000
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+
+def setup(path):
+    settings.configure(
+        DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3',
+                               'NAME': path}},
+        INSTALLED_APPS=['django.contrib.auth', 'django.contrib.contenttypes',
+                        'chunked_upload'],
+        USE_TZ=True,
+    )
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def fill(rows, users, expired_ratio):
+    """
+    Inserts `rows` uploads of `users` users, `expired_ratio` of them
+    expired. Returns a sample of (user_id, upload_id).
+    """
+    from django.contrib.auth.models import User
+    from django.db import connection, transaction
+
+    User.objects.bulk_create(
+        [User(username='user%i' % i) for i in range(users)])
+    user_ids = list(User.objects.values_list('pk', flat=True))
+    now = datetime.datetime.now(datetime.timezone.utc)
+    sample = []
+    columns = ('upload_id, file, filename, offset, created_on, expires_on, '
+               'status, user_id, checksum_algorithm, chunk_checksums, '
+               'received_ranges, assembly_state, completion_result, '
+               'chunk_manifest, chunk_refs')
+    sql = ('INSERT INTO chunked_upload_chunkedupload (%s) VALUES (%s)'
+           % (columns, ', '.join(['%s'] * 15)))
+    batch = 100000
+    with connection.cursor() as cursor:
+        for start in range(0, rows, batch):
+            values = []
+            for i in range(start, min(start + batch, rows)):
+                upload_id = uuid.uuid4().hex
+                user_id = random.choice(user_ids)
+                expired = random.random() < expired_ratio
+                created_on = now - datetime.timedelta(
+                    days=2 if expired else 0, seconds=random.randint(0, 80000))
+                values.append((
+                    upload_id, 'chunked_uploads/%s.part' % upload_id, 'f', 0,
+                    created_on, created_on + datetime.timedelta(days=1),
+                    random.choice((1, 1, 1, 2)), user_id, 'md5', '', '', '',
+                    '', '', ''))
+                if i % (rows // 100 or 1) == 0:
+                    sample.append((user_id, upload_id))
+            with transaction.atomic():
+                cursor.executemany(sql, values)
+        cursor.execute('ANALYZE')
+    return sample
+
+
+def measure(queryset, repeat):
+    """
+    Returns the query plan and average time (in ms) of `queryset`.
+    """
+    from django.db import connection
+
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        plan = ' / '.join(row[-1] for row in cursor.fetchall())
+        start = time.perf_counter()
+        for _ in range(repeat):
+            cursor.execute(sql, params)
+            cursor.fetchall()
+        elapsed = time.perf_counter() - start
+    return plan, elapsed / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=10000000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--expired-ratio', type=float, default=0.1)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--db', help='SQLite file (a temporary one if not '
+                                     'given), reused if already filled')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the results as JSON')
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+    setup(path)
+    from django.utils import timezone
+    from chunked_upload.constants import UPLOADING
+    from chunked_upload.models import ChunkedUpload
+
+    start = time.perf_counter()
+    if ChunkedUpload.objects.exists():  # Reusing the database of --db
+        sample = list(ChunkedUpload.objects.values_list(
+            'user_id', 'upload_id')[:100])
+        args.rows = ChunkedUpload.objects.count()
+    else:
+        sample = fill(args.rows, args.users, args.expired_ratio)
+    fill_time = time.perf_counter() - start
+
+    objects = ChunkedUpload.objects
+    user_id, upload_id = random.choice(sample)
+    now = timezone.now()
+    expired = objects.filter(expires_on__lte=now).order_by('expires_on', 'pk')
+    last = expired[min(args.batch_size * 10, expired.count() - 1)]
+    queries = {
+        # ChunkedUploadView/ChunkedUploadCompleteView
+        'lookup': objects.filter(user_id=user_id, upload_id=upload_id),
+        # In progress uploads of a user
+        'user_uploading': objects.filter(
+            user_id=user_id, status=UPLOADING).order_by('created_on'),
+        # delete_expired_uploads, first and following batches
+        'purge_first_batch': expired[:args.batch_size],
+        'purge_next_batch': expired.filter(
+            expires_on__gte=last.expires_on
+        ).exclude(
+            expires_on=last.expires_on, pk__lte=last.pk
+        )[:args.batch_size],
+        # Nothing expired yet (e.g. frequent runs of delete_expired_uploads)
+        'purge_none_expired': objects.filter(
+            expires_on__lte=now - datetime.timedelta(days=30)
+        ).order_by('expires_on', 'pk')[:args.batch_size],
+        # Same, with the previous filter of delete_expired_uploads (there is
+        # no index on created_on)
+        'purge_none_expired_created_on': objects.filter(
+            created_on__lt=now - datetime.timedelta(days=31)
+        ).order_by('pk')[:args.batch_size],
+    }
+    results = {'rows': args.rows, 'fill_seconds': round(fill_time, 1),
+               'queries': {}}
+    for name, queryset in queries.items():
+        plan, ms = measure(queryset, args.repeat)
+        results['queries'][name] = {'plan': plan, 'ms': round(ms, 3)}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print('%i rows (filled in %.1fs)' % (args.rows, fill_time))
+    for name, result in results['queries'].items():
+        print('%-30s %10.3f ms  %s' % (name, result['ms'], result['plan']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+"""
+Benchmark of the upload, completion and purge paths, with Django's test
+client, a SQLite database and a local storage: `ChunkedUploadView` with
+several chunk sizes and numbers of concurrent uploads,
+`ChunkedUploadCompleteView` with and without md5 check for several file sizes,
+and `delete_expired_uploads` with many rows. Reports the throughput (MB/s or
+uploads/s), the p50/p99 latency of the requests, the peak RSS and the number
+of queries. Each case runs in its own process (so its peak RSS is its own).
+
+Usage::
+
+    python benchmarks/uploads.py --output results.json
+    python benchmarks/uploads.py --compare results.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+SIZE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+# Metrics where lower is better (the others are throughputs)
+LOWER_IS_BETTER = ('p50_ms', 'p99_ms', 'peak_rss_mb', 'queries_per_request',
+                   'queries', 'seconds')
+
+urlpatterns = []
+
+
+def parse_size(value):
+    value = value.strip().upper()
+    if value[-1:] in SIZE_UNITS:
+        return int(float(value[:-1]) * SIZE_UNITS[value[-1]])
+    return int(value)
+
+
+def parse_sizes(value):
+    return [parse_size(size) for size in value.split(',')]
+
+
+def setup(path, media_root, extra_settings):
+    database = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path,
+                'OPTIONS': {'timeout': 60}}
+    if django.VERSION >= (5, 1):
+        # Writers wait for the lock instead of failing (concurrent uploads)
+        database['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
+    settings.configure(
+        DATABASES={'default': database},
+        INSTALLED_APPS=['django.contrib.auth', 'django.contrib.contenttypes',
+                        'django.contrib.sessions', 'chunked_upload'],
+        MIDDLEWARE=['django.contrib.sessions.middleware.SessionMiddleware',
+                    'django.contrib.auth.middleware.AuthenticationMiddleware'],
+        ROOT_URLCONF=__name__,
+        MEDIA_ROOT=media_root,
+        SECRET_KEY='benchmark',
+        ALLOWED_HOSTS=['*'],
+        USE_TZ=True,
+        **extra_settings
+    )
+    django.setup()
+    from django.core.management import call_command
+    from django.urls import path as url_path
+    from chunked_upload.views import (ChunkedUploadView,
+                                      ChunkedUploadCompleteView)
+    call_command('migrate', verbosity=0)
+    urlpatterns[:] = [
+        url_path('upload/', ChunkedUploadView.as_view()),
+        url_path('complete/', ChunkedUploadCompleteView.as_view()),
+        url_path('complete_no_md5/',
+                 ChunkedUploadCompleteView.as_view(do_md5_check=False)),
+    ]
+
+
+def get_client():
+    from django.contrib.auth.models import User
+    from django.test import Client
+    user, _ = User.objects.get_or_create(username='benchmark')
+    client = Client()
+    client.force_login(user)
+    return client
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    if not values:
+        return 0
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on Linux
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+class Uploader(object):
+    """
+    Uploads a file of `file_size` bytes in chunks of `chunk_size` bytes,
+    timing each request.
+    """
+
+    def __init__(self, file_size, chunk_size):
+        self.file_size = file_size
+        self.chunk_size = chunk_size
+        self.latencies = []
+        self.queries = 0
+        self.md5 = hashlib.md5()
+
+    def post(self, client, url, data, **extra):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = client.post(url, data, **extra)
+            self.latencies.append(time.perf_counter() - start)
+        self.queries += len(queries)
+        if response.status_code != 200:
+            raise RuntimeError('%s %s' % (response.status_code,
+                                          response.content))
+        return response.json()
+
+    def upload(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from django.db import connection
+        client = get_client()
+        data = os.urandom(min(self.chunk_size, self.file_size))
+        upload_id = None
+        for start in range(0, self.file_size, self.chunk_size):
+            chunk = data[:min(self.chunk_size, self.file_size - start)]
+            self.md5.update(chunk)
+            post = {'file': SimpleUploadedFile('benchmark.bin', chunk)}
+            if upload_id:
+                post['upload_id'] = upload_id
+            upload_id = self.post(
+                client, '/upload/', post,
+                HTTP_CONTENT_RANGE='bytes %i-%i/%i' % (
+                    start, start + len(chunk) - 1, self.file_size)
+            )['upload_id']
+        connection.close()
+        return upload_id
+
+
+def run_upload(file_size, chunk_size, concurrency):
+    uploaders = [Uploader(file_size, chunk_size) for _ in range(concurrency)]
+    errors = []
+
+    def upload(uploader):
+        try:
+            uploader.upload()
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=upload, args=(uploader,))
+               for uploader in uploaders]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise errors[0]
+    latencies = [latency for uploader in uploaders
+                 for latency in uploader.latencies]
+    return {
+        'mb_per_s': file_size * concurrency / elapsed / 1024 ** 2,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'queries_per_request': (sum(uploader.queries for uploader in uploaders)
+                                / len(latencies)),
+    }
+
+
+def run_complete(file_size, md5_check):
+    uploader = Uploader(file_size, min(file_size, 8 * 1024 ** 2))
+    upload_id = uploader.upload()
+    uploader.latencies, uploader.queries = [], 0
+    client = get_client()
+    if md5_check:
+        uploader.post(client, '/complete/', {
+            'upload_id': upload_id, 'md5': uploader.md5.hexdigest()})
+    else:
+        uploader.post(client, '/complete_no_md5/', {'upload_id': upload_id})
+    latency = uploader.latencies[0]
+    return {
+        'mb_per_s': file_size / latency / 1024 ** 2,
+        'p50_ms': latency * 1000,
+        'p99_ms': latency * 1000,
+        'queries_per_request': uploader.queries,
+    }
+
+
+def run_purge(rows, batch_size):
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from queries import fill
+
+    fill(rows, 100, 1.0)
+    with open(os.devnull, 'w') as devnull:
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            call_command('delete_expired_uploads', batch_size=batch_size,
+                         stdout=devnull)
+            elapsed = time.perf_counter() - start
+    return {
+        'uploads_per_s': rows / elapsed,
+        'seconds': elapsed,
+        'queries': len(queries),
+    }
+
+
+def run_case(case):
+    """
+    Runs a single case (in this process) and returns its results.
+    """
+    workdir = tempfile.mkdtemp(prefix='chunked_upload_benchmark_')
+    setup(os.path.join(workdir, 'db.sqlite3'), os.path.join(workdir, 'media'),
+          case.get('settings', {}))
+    if case['kind'] == 'upload':
+        results = run_upload(case['file_size'], case['chunk_size'],
+                             case['concurrency'])
+    elif case['kind'] == 'complete':
+        results = run_complete(case['file_size'], case['md5_check'])
+    else:
+        results = run_purge(case['rows'], case['batch_size'])
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+def get_cases(args):
+    cases = []
+    if 'upload' in args.only:
+        for chunk_size in args.chunk_sizes:
+            for concurrency in args.concurrency:
+                cases.append({
+                    'name': 'upload chunk=%iK concurrency=%i' % (
+                        chunk_size // 1024, concurrency),
+                    'kind': 'upload', 'file_size': args.file_size,
+                    'chunk_size': chunk_size, 'concurrency': concurrency})
+    if 'complete' in args.only:
+        for file_size in args.complete_sizes:
+            for name, md5_check, extra in (
+                    ('md5', True, {}),
+                    ('md5 (not incremental)', True,
+                     {'CHUNKED_UPLOAD_INCREMENTAL_MD5': False}),
+                    ('no md5 check', False, {})):
+                cases.append({
+                    'name': 'complete size=%iM %s' % (file_size // 1024 ** 2,
+                                                      name),
+                    'kind': 'complete', 'file_size': file_size,
+                    'md5_check': md5_check, 'settings': extra})
+    if 'purge' in args.only:
+        for rows in args.purge_rows:
+            cases.append({
+                'name': 'purge rows=%i' % rows, 'kind': 'purge',
+                'rows': rows, 'batch_size': args.batch_size})
+    return cases
+
+
+def compare(results, baseline):
+    """
+    Prints the change of each metric from the `baseline` results.
+    """
+    previous = {case['name']: case['results'] for case in baseline['cases']}
+    for case in results['cases']:
+        if case['name'] not in previous:
+            continue
+        changes = []
+        for metric, value in case['results'].items():
+            old = previous[case['name']].get(metric)
+            if not old:
+                continue
+            change = (value - old) / old * 100
+            better = (change < 0) == (metric in LOWER_IS_BETTER)
+            changes.append('%s %+.1f%%%s' % (metric, change,
+                                             '' if better else ' (worse)'))
+        print('%-45s %s' % (case['name'], ', '.join(changes)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--only', default='upload,complete,purge',
+                        type=lambda value: value.split(','),
+                        help='Paths to benchmark (default: all)')
+    parser.add_argument('--file-size', type=parse_size, default='64M',
+                        help='Size of the uploaded files (default: 64M)')
+    parser.add_argument('--chunk-sizes', type=parse_sizes,
+                        default='64K,1M,8M')
+    parser.add_argument('--concurrency', default='1,4',
+                        type=lambda value: [int(n) for n in value.split(',')],
+                        help='Numbers of concurrent uploads (default: 1,4)')
+    parser.add_argument('--complete-sizes', type=parse_sizes,
+                        default='16M,256M')
+    parser.add_argument('--purge-rows', default='100000',
+                        type=lambda value: [int(n) for n in value.split(',')])
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Compare with the results of this '
+                                          'JSON file')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the results as JSON')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:  # Child process
+        print(json.dumps(run_case(json.loads(args.case))))
+        return
+
+    results = {'python': sys.version.split()[0],
+               'django': django.get_version(), 'cases': []}
+    for case in get_cases(args):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--case',
+             json.dumps(case)], check=True, stdout=subprocess.PIPE,
+            universal_newlines=True).stdout
+        case['results'] = json.loads(output.strip().splitlines()[-1])
+        results['cases'].append(case)
+        if not args.json:
+            print('%-45s %s' % (case['name'], ', '.join(
+                '%s %.2f' % item for item in case['results'].items())))
+            sys.stdout.flush()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(results, json.load(baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,568 @@
+"""
+Assemblers put the chunks of an upload together into the final file.
+
+`LocalFileAssembler` writes the chunks into a local file (the storage of the
+`file` field must be a local file system storage), and `CompressedFileAssembler`
+compresses them into it. `S3MultipartAssembler` uploads each chunk as a part
+of an S3 multipart upload, assembled server side on completion, so no shared
+file system is needed between app servers.
+"""
+import io
+import json
+import os
+import struct
+import tempfile
+import zlib
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+
+from .constants import http_status
+from .exceptions import ChunkedUploadError
+from .files import (chunk_written, hard_link, preallocate, read_file,
+                    sync_file, write_chunk)
+from .settings import BUFFER_SIZE, FSYNC
+
+
+class BaseAssembler(object):
+    """
+    Base assembler. Its state (if any) is kept in the `assembly_state` field
+    of the chunked upload.
+    """
+
+    # True if the file can be written directly (e.g. by ChunkedUploadHandler)
+    local = False
+
+    def __init__(self, chunked_upload):
+        self.chunked_upload = chunked_upload
+
+    def get_state(self):
+        state = self.chunked_upload.assembly_state
+        return json.loads(state) if state else {}
+
+    def set_state(self, state):
+        self.chunked_upload.assembly_state = json.dumps(state)
+
+    def create(self, save=False):
+        """
+        Called when the chunked upload is created.
+        """
+        raise NotImplementedError
+
+    def append(self, chunk, offset, hashers=(), size=None):
+        """
+        Appends `chunk` (`size` bytes, if known) at `offset`, updating the
+        hash objects in `hashers` with its data. Returns the number of bytes
+        appended.
+        """
+        raise NotImplementedError
+
+    def write_at(self, chunk, start, hashers=()):
+        """
+        Writes `chunk` at position `start`, for chunks received out of order.
+        Returns the number of bytes written.
+        """
+        raise ChunkedUploadError(
+            status=http_status.HTTP_400_BAD_REQUEST,
+            detail='Out of order chunks are not supported')
+
+    def preallocate(self, size, keep_size=False):
+        """
+        Allocates space for `size` bytes, if supported. With `keep_size`,
+        the size of the file isn't changed (for chunks received in order).
+        """
+
+    def read(self, start, size):
+        """
+        Yields the `size` bytes of data written at `start`.
+        """
+        raise NotImplementedError
+
+    def discard(self, start):
+        """
+        Discards the data written after `start`.
+        """
+        raise NotImplementedError
+
+    def assemble(self):
+        """
+        Called when the upload is complete, puts the final file together.
+        """
+
+    def open(self):
+        """
+        Opens the (assembled) file for reading.
+        """
+        file = self.chunked_upload.file
+        file.close()
+        file.open(mode='rb')  # mode = read+binary
+        return file
+
+    def finalize_to(self, storage, name):
+        """
+        Stores the assembled file in `storage` as `name` (or an available
+        name based on it). Returns the name of the stored file. By default,
+        its data is copied.
+        """
+        with self.chunked_upload.get_uploaded_file() as uploaded_file:
+            return storage.save(name, uploaded_file)
+
+    def delete(self):
+        """
+        Deletes the file (and any other data) of the chunked upload.
+        """
+        raise NotImplementedError
+
+
+class LocalFileAssembler(BaseAssembler):
+    """
+    Writes the chunks into the (local) file of the chunked upload.
+    """
+
+    local = True
+
+    def create(self, save=False):
+        # file starts empty
+        self.chunked_upload.file.save(name='tmp', content=ContentFile(''),
+                                      save=save)
+
+    def open_for_write(self):
+        """
+        Opens the file for writing, without truncating it.
+        """
+        self.chunked_upload.file.close()
+        # Not opened in append mode, the kernel can't copy into O_APPEND files
+        fd = os.open(self.chunked_upload.file.path, os.O_WRONLY | os.O_CREAT,
+                     0o666)
+        # mode = write+binary, doesn't truncate
+        return open(fd, mode='wb', buffering=BUFFER_SIZE)
+
+    def truncate(self, file_obj):
+        """
+        Discards the data after the current position (of previous failed
+        writes), keeping the space preallocated past the end of the file.
+        """
+        file_obj.flush()
+        if os.fstat(file_obj.fileno()).st_size > file_obj.tell():
+            file_obj.truncate()
+
+    def append(self, chunk, offset, hashers=(), size=None):
+        with self.open_for_write() as file_obj:
+            file_obj.seek(offset)
+            written = write_chunk(chunk, file_obj, hashers=hashers)
+            self.truncate(file_obj)
+            chunk_written(file_obj, offset)
+        return written
+
+    def write_at(self, chunk, start, hashers=()):
+        with self.open_for_write() as file_obj:
+            file_obj.seek(start)
+            written = write_chunk(chunk, file_obj, hashers=hashers)
+            chunk_written(file_obj, start)
+        return written
+
+    def preallocate(self, size, keep_size=False):
+        with self.open_for_write() as file_obj:
+            preallocate(file_obj, size, keep_size=keep_size)
+
+    def read(self, start, size):
+        with open(self.chunked_upload.file.path, mode='rb') as file_obj:
+            file_obj.seek(start)
+            for data in read_file(file_obj, size):
+                yield data
+
+    def discard(self, start):
+        with self.open_for_write() as file_obj:
+            file_obj.truncate(start)
+
+    def assemble(self):
+        if FSYNC == 'complete':
+            with self.open_for_write() as file_obj:
+                sync_file(file_obj)
+
+    def finalize_to(self, storage, name):
+        """
+        Hard links the file into `storage` if it's a storage of the same
+        (local) file system, so no data is copied. Deleting the upload then
+        only removes its link.
+        """
+        try:
+            storage.path(name)
+        except NotImplementedError:
+            return super(LocalFileAssembler, self).finalize_to(storage, name)
+        source = self.chunked_upload.file.path
+        while True:
+            name = storage.get_available_name(name)
+            path = storage.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                if not hard_link(source, path):
+                    return super(LocalFileAssembler, self).finalize_to(
+                        storage, name)
+            except FileExistsError:
+                continue  # Created meanwhile, with another name
+            mode = getattr(storage, 'file_permissions_mode', None)
+            if mode is not None:
+                os.chmod(path, mode)
+            return name
+
+    def delete(self):
+        file = self.chunked_upload.file
+        if file:
+            file.storage.delete(file.name)
+
+
+class IterStream(io.RawIOBase):
+    """
+    Read-only file object with the data yielded by `iterable`.
+    """
+
+    def __init__(self, iterable):
+        self.iterator = iter(iterable)
+        self.leftover = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.leftover:
+            try:
+                self.leftover = next(self.iterator)
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self.leftover))
+        buffer[:size] = self.leftover[:size]
+        self.leftover = self.leftover[size:]
+        return size
+
+
+class CompressedFileAssembler(LocalFileAssembler):
+    """
+    Writes the chunks compressed into the (local) file of the chunked upload,
+    each one as a frame decodable on its own: a header with its uncompressed
+    and compressed sizes, followed by its compressed data. The file is read
+    (e.g. by `get_uploaded_file`, or to compute the md5) decompressed.
+    `codec` is 'zlib' or 'zstd' (requires `zstandard`), `level` the
+    compression level (the default of the codec if `None`).
+    Chunks must be sent in order, and `ChunkedUploadHandler` is not used.
+    """
+
+    local = False  # Chunks can't be written directly
+    header = struct.Struct('>QQ')
+    codecs = ('zlib', 'zstd')
+
+    def __init__(self, chunked_upload, codec='zlib', level=None):
+        super(CompressedFileAssembler, self).__init__(chunked_upload)
+        if codec not in self.codecs:
+            raise ImproperlyConfigured('Unknown compression codec: %s' % codec)
+        self.codec = codec
+        self.level = level
+
+    def _zstd(self):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImproperlyConfigured(
+                "The 'zstandard' package is required to use the 'zstd' codec")
+        return zstandard
+
+    def compressor(self):
+        if self.codec == 'zstd':
+            level = 3 if self.level is None else self.level
+            return self._zstd().ZstdCompressor(level=level).compressobj()
+        level = zlib.Z_DEFAULT_COMPRESSION if self.level is None else self.level
+        return zlib.compressobj(level)
+
+    def decompressor(self):
+        if self.codec == 'zstd':
+            return self._zstd().ZstdDecompressor().decompressobj()
+        return zlib.decompressobj()
+
+    def frames(self, file_obj):
+        """
+        Yields the (start, size, position, compressed size) of the frames of
+        the file, `start` and `size` in uncompressed bytes and `position` of
+        the header in the file.
+        """
+        start = position = 0
+        file_obj.seek(0)
+        while True:
+            header = file_obj.read(self.header.size)
+            if len(header) < self.header.size:
+                return
+            size, compressed_size = self.header.unpack(header)
+            yield start, size, position, compressed_size
+            start += size
+            position += self.header.size + compressed_size
+            file_obj.seek(position)
+
+    def find_position(self, file_obj, offset):
+        """
+        Position in the file of the frame starting at the uncompressed
+        `offset`.
+        """
+        end = self.get_state().get('end')
+        if end is not None and end[0] == offset:
+            return end[1]
+        end_position = 0
+        for start, size, position, compressed_size in self.frames(file_obj):
+            if start >= offset:
+                return position
+            end_position = position + self.header.size + compressed_size
+        return end_position
+
+    def append(self, chunk, offset, hashers=(), size=None):
+        self.chunked_upload.file.close()
+        with open(self.chunked_upload.file.path, mode='r+b') as file_obj:
+            position = self.find_position(file_obj, offset)
+            file_obj.seek(position + self.header.size)
+            compressor = self.compressor()
+            written = compressed_size = 0
+            chunks = (chunk.chunks(BUFFER_SIZE) if hasattr(chunk, 'chunks')
+                      else read_file(chunk))
+            for data in chunks:
+                for hasher in hashers:
+                    hasher.update(data)
+                written += len(data)
+                compressed = compressor.compress(data)
+                file_obj.write(compressed)
+                compressed_size += len(compressed)
+            compressed = compressor.flush()
+            file_obj.write(compressed)
+            compressed_size += len(compressed)
+            file_obj.truncate()  # Discard data of previous failed writes
+            file_obj.seek(position)
+            file_obj.write(self.header.pack(written, compressed_size))
+            chunk_written(file_obj, position)
+        self.set_state({'end': [offset + written, position + self.header.size
+                                + compressed_size]})
+        return written
+
+    def write_at(self, chunk, start, hashers=()):
+        # Frames are written in order
+        return BaseAssembler.write_at(self, chunk, start, hashers=hashers)
+
+    def preallocate(self, size, keep_size=False):
+        pass  # The compressed size isn't known
+
+    def read_frames(self, file_obj, start=0):
+        """
+        Yields the decompressed data of the frames from the one containing
+        `start`, with the offset of the first one.
+        """
+        for frame_start, size, position, compressed_size in list(
+                self.frames(file_obj)):
+            if frame_start + size <= start:
+                continue
+            file_obj.seek(position + self.header.size)
+            decompressor = self.decompressor()
+            for data in read_file(file_obj, compressed_size):
+                data = decompressor.decompress(data)
+                if data:
+                    yield frame_start, data
+                    frame_start += len(data)
+
+    def read(self, start, size):
+        with open(self.chunked_upload.file.path, mode='rb') as file_obj:
+            for offset, data in self.read_frames(file_obj, start):
+                if offset < start:
+                    data = data[start - offset:]
+                if len(data) >= size:
+                    yield data[:size]
+                    return
+                size -= len(data)
+                yield data
+
+    def discard(self, start):
+        with open(self.chunked_upload.file.path, mode='r+b') as file_obj:
+            position = self.find_position(file_obj, start)
+            file_obj.truncate(position)
+        self.set_state({'end': [start, position]})
+
+    def open(self):
+        return io.BufferedReader(IterStream(self.read(
+            0, self.chunked_upload.offset)), buffer_size=BUFFER_SIZE)
+
+    def finalize_to(self, storage, name):
+        # Decompressed (copied)
+        return BaseAssembler.finalize_to(self, storage, name)
+
+
+class S3MultipartAssembler(BaseAssembler):
+    """
+    Uploads each chunk as a part of an S3 multipart upload, which is
+    completed (assembled by S3) when the upload is complete. Requires
+    `boto3`.
+    The object key is the name of the `file` field (prefixed by `location`).
+    To read the uploaded file (e.g. in `on_completion`), the storage of the
+    field must point to the same bucket (e.g. `storages.backends.s3.S3Storage`
+    from django-storages), whose `bucket_name` and `location` are used by
+    default.
+    S3 requires every part but the last one to be at least 5 MiB, and chunks
+    must be sent in order.
+    """
+
+    min_part_size = 5 * 1024 * 1024
+    _clients = {}
+
+    def __init__(self, chunked_upload, bucket_name=None, location=None,
+                 client_kwargs=None):
+        super(S3MultipartAssembler, self).__init__(chunked_upload)
+        storage = chunked_upload.file.storage
+        self.bucket_name = bucket_name or getattr(storage, 'bucket_name', None)
+        if not self.bucket_name:
+            raise ImproperlyConfigured(
+                "S3MultipartAssembler requires a 'bucket_name' option")
+        if location is None:
+            location = getattr(storage, 'location', '') if hasattr(
+                storage, 'bucket_name') else ''
+        self.location = location
+        self.client_kwargs = client_kwargs or {}
+
+    @property
+    def client(self):
+        key = json.dumps(self.client_kwargs, sort_keys=True)
+        if key not in self._clients:
+            try:
+                import boto3
+            except ImportError:
+                raise ImproperlyConfigured(
+                    "The 'boto3' package is required to use "
+                    "S3MultipartAssembler")
+            self._clients[key] = boto3.client('s3', **self.client_kwargs)
+        return self._clients[key]
+
+    @staticmethod
+    def get_key(location, name):
+        return '%s/%s' % (location.strip('/'), name) if location else name
+
+    @property
+    def key(self):
+        return self.get_key(self.location, self.chunked_upload.file.name)
+
+    def create(self, save=False):
+        file = self.chunked_upload.file
+        file.name = file.field.generate_filename(self.chunked_upload, 'tmp')
+        self.set_state({'parts': []})
+        if save:
+            self.chunked_upload.save()
+
+    def _spool(self, chunk, hashers, size):
+        """
+        Returns a seekable file with the data of `chunk` and its size,
+        updating `hashers` with the data.
+        """
+        if hasattr(chunk, 'chunks') and size is not None:
+            for data in chunk.chunks(BUFFER_SIZE):
+                for hasher in hashers:
+                    hasher.update(data)
+            chunk.seek(0)
+            return chunk, size
+        spooled = tempfile.SpooledTemporaryFile(max_size=BUFFER_SIZE)
+        size = 0
+        for data in read_file(chunk):
+            spooled.write(data)
+            for hasher in hashers:
+                hasher.update(data)
+            size += len(data)
+        spooled.seek(0)
+        return spooled, size
+
+    def check_part_size(self, offset, size, parts):
+        """
+        Raises `ChunkedUploadError` if the part of `size` bytes at `offset`
+        is too small and isn't the last one, before it's uploaded (S3 would
+        only reject it on completion).
+        """
+        total_size = self.chunked_upload.total_size
+        if total_size is None:
+            # Without the total size, a part is only known not to be the
+            # last one once it's followed by another one
+            too_small = bool(parts) and parts[-1][2] < self.min_part_size
+        else:
+            too_small = (offset + size < total_size
+                         and size < self.min_part_size)
+        if too_small:
+            raise ChunkedUploadError(
+                status=http_status.HTTP_400_BAD_REQUEST,
+                detail='Chunks must be at least %s bytes (except the last one)'
+                       % self.min_part_size)
+
+    def append(self, chunk, offset, hashers=(), size=None):
+        state = self.get_state()
+        parts = state.setdefault('parts', [])
+        if size is None:
+            size = getattr(chunk, 'size', None)
+        if size is not None:
+            self.check_part_size(offset, size, parts)
+        body, size = self._spool(chunk, hashers, size)
+        self.check_part_size(offset, size, parts)
+        if 'upload_id' not in state:
+            response = self.client.create_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key)
+            state['upload_id'] = response['UploadId']
+        part_number = len(parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucket_name, Key=self.key,
+            UploadId=state['upload_id'], PartNumber=part_number, Body=body,
+            ContentLength=size)
+        parts.append([part_number, response['ETag'], size])
+        self.set_state(state)
+        return size
+
+    def discard(self, start):
+        state = self.get_state()
+        parts, position = [], 0
+        for part in state.get('parts', []):
+            if position >= start:
+                break
+            parts.append(part)
+            position += part[2]
+        state['parts'] = parts
+        self.set_state(state)
+
+    def read(self, start, size):
+        raise NotImplementedError(
+            'Data of incomplete S3 multipart uploads cannot be read')
+
+    def assemble(self):
+        state = self.get_state()
+        if state.get('complete'):
+            return
+        if state.get('upload_id'):
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key,
+                UploadId=state['upload_id'],
+                MultipartUpload={'Parts': [
+                    {'PartNumber': number, 'ETag': etag}
+                    for number, etag, size in state['parts']
+                ]})
+        else:  # Empty file
+            self.client.put_object(Bucket=self.bucket_name, Key=self.key,
+                                   Body=b'')
+        state['complete'] = True
+        self.set_state(state)
+
+    def finalize_to(self, storage, name):
+        """
+        Copies the object server side (with a multipart copy for large
+        objects) if `storage` is an S3 storage, e.g. `S3Storage` from
+        django-storages.
+        """
+        bucket_name = getattr(storage, 'bucket_name', None)
+        if not bucket_name:
+            return super(S3MultipartAssembler, self).finalize_to(storage, name)
+        name = storage.get_available_name(name)
+        self.client.copy({'Bucket': self.bucket_name, 'Key': self.key},
+                         bucket_name,
+                         self.get_key(getattr(storage, 'location', ''), name))
+        return name
+
+    def delete(self):
+        state = self.get_state()
+        if state.get('complete'):
+            self.client.delete_object(Bucket=self.bucket_name, Key=self.key)
+        elif state.get('upload_id'):
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key,
+                UploadId=state['upload_id'])
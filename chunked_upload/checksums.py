@@ -0,0 +1,155 @@
+"""
+Checksum backends used to verify chunks and complete uploads.
+
+A backend is any class whose instances have a `name` and a `new()` method
+returning a hash object with `update(data)`, `digest()` and `hexdigest()`
+(like the ones in `hashlib`). Backends are registered by name in the
+`CHUNKED_UPLOAD_CHECKSUM_BACKENDS` setting.
+"""
+import hashlib
+import zlib
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from .settings import CHECKSUM_BACKENDS
+
+
+class BaseChecksum(object):
+    """
+    Base checksum backend. Subclasses must implement `new()`.
+    """
+
+    name = None
+
+    def new(self):
+        raise NotImplementedError
+
+    def checksum(self, chunks):
+        """
+        Returns the hex digest of the data in the iterable `chunks`.
+        """
+        hasher = self.new()
+        for chunk in chunks:
+            hasher.update(chunk)
+        return hasher.hexdigest()
+
+
+class HashlibChecksum(BaseChecksum):
+    """
+    Checksum backend using an algorithm from `hashlib`.
+    """
+
+    def new(self):
+        try:
+            # Not used for security, allows md5/sha1 on FIPS enabled hosts
+            return hashlib.new(self.name, usedforsecurity=False)
+        except TypeError:  # Python < 3.9
+            return hashlib.new(self.name)
+
+
+class MD5Checksum(HashlibChecksum):
+    name = 'md5'
+
+
+class SHA1Checksum(HashlibChecksum):
+    name = 'sha1'
+
+
+class SHA256Checksum(HashlibChecksum):
+    name = 'sha256'
+
+
+class BLAKE2bChecksum(HashlibChecksum):
+    name = 'blake2b'
+
+
+class _CRCHasher(object):
+    """
+    hashlib-like wrapper around a CRC function `func(data, value)`.
+    """
+
+    digest_size = 4
+
+    def __init__(self, func):
+        self._func = func
+        self._value = 0
+
+    def update(self, data):
+        self._value = self._func(data, self._value)
+
+    def digest(self):
+        return self._value.to_bytes(self.digest_size, 'big')
+
+    def hexdigest(self):
+        return self.digest().hex()
+
+
+class CRC32Checksum(BaseChecksum):
+    name = 'crc32'
+
+    def new(self):
+        return _CRCHasher(zlib.crc32)
+
+
+class CRC32CChecksum(BaseChecksum):
+    """
+    CRC32C (Castagnoli), hardware accelerated. Requires the `crc32c` package.
+    """
+
+    name = 'crc32c'
+
+    def __init__(self):
+        try:
+            import crc32c
+        except ImportError:
+            raise ImproperlyConfigured(
+                "The 'crc32c' package is required to use crc32c checksums")
+        self._func = crc32c.crc32c
+
+    def new(self):
+        return _CRCHasher(self._func)
+
+
+class XXH64Checksum(BaseChecksum):
+    """
+    xxHash (64 bits). Requires the `xxhash` package.
+    """
+
+    name = 'xxh64'
+    algorithm = 'xxh64'
+
+    def __init__(self):
+        try:
+            import xxhash
+        except ImportError:
+            raise ImproperlyConfigured(
+                "The 'xxhash' package is required to use %s checksums"
+                % self.name)
+        self._new = getattr(xxhash, self.algorithm)
+
+    def new(self):
+        return self._new()
+
+
+class XXH3_64Checksum(XXH64Checksum):
+    name = 'xxh3_64'
+    algorithm = 'xxh3_64'
+
+
+_backends = {}
+
+
+def get_checksum_backend(name):
+    """
+    Returns the checksum backend instance registered as `name`.
+    """
+    if name not in _backends:
+        try:
+            backend = CHECKSUM_BACKENDS[name]
+        except KeyError:
+            raise ImproperlyConfigured('Unknown checksum algorithm: %s' % name)
+        if isinstance(backend, str):
+            backend = import_string(backend)
+        _backends[name] = backend()
+    return _backends[name]
@@ -0,0 +1,140 @@
+"""
+Executors completing uploads (verification and `on_completion`) in the
+background, see `ChunkedUploadCompleteView.completion_executor`.
+"""
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+from .constants import PROCESSING
+from .settings import COMPLETION_EXECUTOR_OPTIONS
+
+logger = logging.getLogger(__name__)
+
+_executors = {}
+
+
+def complete_upload(view_path, upload_id, md5=None, checksum=None):
+    """
+    Completes the upload `upload_id` with the view class `view_path` (dotted
+    path), calling its `process_completion` method. This is the job run by
+    the completion executors. The upload is locked while it's processed, and
+    only processed if it's still "processing", so a job run again (e.g. a
+    task retried or delivered twice by a task queue) doesn't complete it
+    twice.
+    """
+    close_old_connections()
+    try:
+        view = import_string(view_path)()
+        view.request, view.args, view.kwargs = None, (), {}
+        with transaction.atomic():
+            chunked_upload = view.model.objects.select_for_update().filter(
+                upload_id=upload_id).first()
+            if chunked_upload is None or chunked_upload.status != PROCESSING:
+                return
+            view.process_completion(chunked_upload, md5=md5,
+                                    checksum=checksum)
+    finally:
+        close_old_connections()
+
+
+def log_failure(future, upload_id):
+    """
+    Logs the exception of the completion of the upload `upload_id` run by
+    `future`, if it failed before handling its errors (e.g. the database
+    was unavailable, or the worker process died). The upload stays
+    "processing" until `CHUNKED_UPLOAD_PROCESSING_TIMEOUT`.
+    """
+    if future.cancelled():
+        logger.error('Completion of upload %s was cancelled', upload_id)
+        return
+    error = future.exception()
+    if error is not None:
+        logger.error('Completion of upload %s failed', upload_id,
+                     exc_info=(type(error), error, error.__traceback__))
+
+
+class BaseCompletionExecutor(object):
+    """
+    Base completion executor.
+    """
+
+    def submit(self, *args):
+        """
+        Runs `complete_upload(*args)` in the background. The arguments are
+        strings (or `None`).
+        """
+        raise NotImplementedError
+
+
+class ThreadPoolCompletionExecutor(BaseCompletionExecutor):
+    """
+    Completes uploads in a pool of threads of the web server process.
+    """
+
+    def __init__(self, max_workers=None):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='chunked_upload_completion')
+
+    def submit(self, *args):
+        future = self.executor.submit(complete_upload, *args)
+        future.add_done_callback(lambda future: log_failure(future, args[1]))
+
+
+def _setup_process():
+    django.setup()
+
+
+class ProcessPoolCompletionExecutor(BaseCompletionExecutor):
+    """
+    Completes uploads in a pool of processes (started with the `mp_context`
+    start method), e.g. for CPU bound processing.
+    """
+
+    def __init__(self, max_workers=None, mp_context='spawn'):
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context(mp_context),
+            initializer=_setup_process)
+
+    def submit(self, *args):
+        future = self.executor.submit(complete_upload, *args)
+        future.add_done_callback(lambda future: log_failure(future, args[1]))
+
+
+class TaskQueueCompletionExecutor(BaseCompletionExecutor):
+    """
+    Completes uploads with a task queue. `enqueue` is a function (or dotted
+    path to it) queueing a task calling `complete_upload` with the same
+    arguments, e.g. with Celery::
+
+        @shared_task
+        def complete_chunked_upload(*args):
+            complete_upload(*args)
+
+        def enqueue(*args):
+            complete_chunked_upload.delay(*args)
+    """
+
+    def __init__(self, enqueue):
+        if isinstance(enqueue, str):
+            enqueue = import_string(enqueue)
+        self.enqueue = enqueue
+
+    def submit(self, *args):
+        self.enqueue(*args)
+
+
+def get_completion_executor(path):
+    """
+    Returns the (shared) instance of the completion executor class `path`
+    (dotted path), created with `CHUNKED_UPLOAD_COMPLETION_EXECUTOR_OPTIONS`.
+    """
+    if path not in _executors:
+        _executors[path] = import_string(path)(**COMPLETION_EXECUTOR_OPTIONS)
+    return _executors[path]
@@ -3,15 +3,41 @@ from django.utils.translation import gettext as _
 
 class http_status:
     HTTP_200_OK = 200
+    HTTP_201_CREATED = 201
+    HTTP_202_ACCEPTED = 202
+    HTTP_204_NO_CONTENT = 204
+    HTTP_206_PARTIAL_CONTENT = 206
     HTTP_400_BAD_REQUEST = 400
     HTTP_403_FORBIDDEN = 403
+    HTTP_404_NOT_FOUND = 404
+    HTTP_409_CONFLICT = 409
     HTTP_410_GONE = 410
+    HTTP_411_LENGTH_REQUIRED = 411
+    HTTP_412_PRECONDITION_FAILED = 412
+    HTTP_413_REQUEST_ENTITY_TOO_LARGE = 413
+    HTTP_415_UNSUPPORTED_MEDIA_TYPE = 415
+    HTTP_416_RANGE_NOT_SATISFIABLE = 416
+    HTTP_429_TOO_MANY_REQUESTS = 429
+    HTTP_460_CHECKSUM_MISMATCH = 460  # tus protocol
+    HTTP_507_INSUFFICIENT_STORAGE = 507
 
 
 UPLOADING = 1
 COMPLETE = 2
+PROCESSING = 3  # Being verified and processed in the background
+FAILED = 4  # Background processing failed
 
 CHUNKED_UPLOAD_CHOICES = (
     (UPLOADING, _("Uploading")),
     (COMPLETE, _("Complete")),
+    (PROCESSING, _("Processing")),
+    (FAILED, _("Failed")),
 )
+
+# Names of the statuses in the responses
+STATUS_NAMES = {
+    UPLOADING: 'uploading',
+    COMPLETE: 'complete',
+    PROCESSING: 'processing',
+    FAILED: 'failed',
+}
@@ -1,6 +1,7 @@
 """
 Exceptions raised by django-chunked-upload.
 """
+from .constants import http_status
 
 
 class ChunkedUploadError(Exception):
@@ -8,6 +9,31 @@ class ChunkedUploadError(Exception):
     Exception raised if errors in the request/process.
     """
 
+    # Headers of the response
+    headers = {}
+
     def __init__(self, status, **data):
         self.status_code = status
         self.data = data
+
+
+class ChunkChecksumError(ChunkedUploadError):
+    """
+    Exception raised if the checksum of a chunk doesn't match its data.
+    """
+
+
+class UploadThrottled(ChunkedUploadError):
+    """
+    Exception raised if a request is throttled (see
+    `chunked_upload.throttling`). The client should retry after `wait`
+    seconds.
+    """
+
+    def __init__(self, wait, **data):
+        data.setdefault('detail', 'Request was throttled')
+        super(UploadThrottled, self).__init__(
+            status=http_status.HTTP_429_TOO_MANY_REQUESTS, retry_after=wait,
+            **data)
+        self.wait = wait
+        self.headers = {'Retry-After': str(wait)}
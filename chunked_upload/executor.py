@@ -0,0 +1,49 @@
+"""
+Bounded thread pool running the blocking work (database queries, file writes
+and hashing) of the async views, so the event loop is never blocked and the
+number of threads doesn't grow with the number of concurrent uploads.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+
+from .settings import ASYNC_MAX_WORKERS
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=ASYNC_MAX_WORKERS,
+                    thread_name_prefix='chunked_upload')
+    return _executor
+
+
+def _run(func, *args, **kwargs):
+    # Worker threads keep their database connection between calls, closed
+    # (like at the end of a request) if obsolete according to CONN_MAX_AGE
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_executor(func, *args, **kwargs):
+    """
+    Runs `func(*args, **kwargs)` in the bounded thread pool (with the current
+    context, e.g. the active language) and returns its result.
+    """
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, _run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(get_executor(),
+                                                            call)
@@ -0,0 +1,244 @@
+"""
+Helpers to write chunks into the upload files without loading them into
+memory.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+
+from django.core.files import File
+
+from .settings import BUFFER_SIZE, FSYNC, DROP_CACHE
+
+# Errors meaning the kernel can't copy between these files (another method
+# has to be used)
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EBADF,
+                    errno.EOPNOTSUPP, errno.ENOTSUP}
+
+
+# fallocate() flag allocating disk space without changing the file size
+_FALLOC_FL_KEEP_SIZE = 1
+
+
+def _load_fallocate():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        func = getattr(libc, 'fallocate64', None) or libc.fallocate
+    except (OSError, AttributeError, TypeError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64,
+                     ctypes.c_int64]
+    func.restype = ctypes.c_int
+    return func
+
+
+_fallocate = _load_fallocate()
+
+
+def preallocate(file_obj, size, keep_size=False):
+    """
+    Allocates disk space for the first `size` bytes of `file_obj` (extending
+    it if needed), so the file isn't fragmented when written.
+    With `keep_size`, the size of the file isn't changed (so chunks can still
+    be appended to it). This is only supported on Linux, and a no-op on other
+    platforms.
+    """
+    file_obj.flush()
+    fd = file_obj.fileno()
+    if keep_size:
+        if _fallocate is not None:
+            if _fallocate(fd, _FALLOC_FL_KEEP_SIZE, 0, size) != 0:
+                error = ctypes.get_errno()
+                if error not in _FALLBACK_ERRNOS:
+                    raise OSError(error, os.strerror(error))
+        return
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError as error:
+            if error.errno not in _FALLBACK_ERRNOS:
+                raise
+    if os.fstat(fd).st_size < size:
+        os.ftruncate(fd, size)
+
+
+def _copy_file_range(src_fd, dst_fd, src_offset, dst_offset, count):
+    return os.copy_file_range(src_fd, dst_fd, count, src_offset, dst_offset)
+
+
+def _sendfile(src_fd, dst_fd, src_offset, dst_offset, count):
+    os.lseek(dst_fd, dst_offset, os.SEEK_SET)
+    return os.sendfile(dst_fd, src_fd, src_offset, count)
+
+
+def _kernel_copy_methods(src_fd, dst_fd):
+    if (hasattr(os, 'copy_file_range')
+            and os.fstat(src_fd).st_dev == os.fstat(dst_fd).st_dev):
+        yield _copy_file_range
+    if hasattr(os, 'sendfile'):
+        yield _sendfile
+
+
+def sync_file(file_obj):
+    """
+    Flushes the data written into `file_obj` to disk.
+    """
+    file_obj.flush()
+    if hasattr(os, 'fdatasync'):
+        os.fdatasync(file_obj.fileno())
+    else:
+        os.fsync(file_obj.fileno())
+
+
+def chunk_written(file_obj, start):
+    """
+    Applies the `CHUNKED_UPLOAD_FSYNC` ('chunk') and
+    `CHUNKED_UPLOAD_DROP_CACHE` settings to the data just written into
+    `file_obj` from `start`.
+    """
+    file_obj.flush()
+    if FSYNC == 'chunk':
+        sync_file(file_obj)
+    if DROP_CACHE and hasattr(os, 'posix_fadvise'):
+        # Pages not written back yet (if not synced) are not dropped
+        os.posix_fadvise(file_obj.fileno(), start, file_obj.tell() - start,
+                         os.POSIX_FADV_DONTNEED)
+
+
+def hard_link(source, path):
+    """
+    Creates the hard link `path` to the file `source`. Returns `False` if the
+    file system can't link them (e.g. they are on different file systems).
+    Raises `FileExistsError` if `path` exists.
+    """
+    try:
+        os.link(source, path)
+    except OSError as error:
+        if error.errno in _FALLBACK_ERRNOS | {errno.EPERM, errno.EMLINK}:
+            return False
+        raise
+    return True
+
+
+def kernel_copy(src, dst):
+    """
+    Copies the whole content of the file object `src` at the current
+    position of the file object `dst` without passing the data through user
+    space (`copy_file_range` or `sendfile`). Returns the number of bytes
+    copied, which may be less than the size of `src` (or 0) if the kernel
+    can't copy between these files.
+    """
+    dst.flush()
+    src_fd, dst_fd = src.fileno(), dst.fileno()
+    position = dst.tell()
+    size = os.fstat(src_fd).st_size
+    copied = 0
+    for method in _kernel_copy_methods(src_fd, dst_fd):
+        try:
+            while copied < size:
+                count = method(src_fd, dst_fd, copied, position + copied,
+                               size - copied)
+                if not count:
+                    break
+                copied += count
+            break
+        except OSError as error:
+            if error.errno not in _FALLBACK_ERRNOS:
+                raise
+    dst.seek(position + copied)
+    return copied
+
+
+class DiskFile(File):
+    """
+    File on a local file system (e.g. a stored chunk, see `StoredChunk`),
+    copied by the kernel by `write_chunk` like temporary uploaded files.
+    """
+
+
+def read_file(file_obj, size=None, buffer_size=BUFFER_SIZE):
+    """
+    Reads up to `size` bytes (everything if `None`) from the current position
+    of `file_obj`, yielding at most `buffer_size` bytes at a time.
+    """
+    while size is None or size > 0:
+        data = file_obj.read(buffer_size if size is None
+                             else min(buffer_size, size))
+        if not data:
+            break
+        if size is not None:
+            size -= len(data)
+        yield data
+
+
+def write_chunk(chunk, file_obj, hashers=(), buffer_size=BUFFER_SIZE):
+    """
+    Writes the data of `chunk` (an `UploadedFile`) at the current position of
+    `file_obj`, updating the hash objects in `hashers` with it. Returns the
+    number of bytes written.
+    At most `buffer_size` bytes are kept in memory. Chunks spooled to a
+    temporary file (or `DiskFile`) are copied by the kernel when possible,
+    which reflinks them on file systems supporting it (e.g. Btrfs or XFS).
+    """
+    copied = 0
+    if hasattr(chunk, 'temporary_file_path') or isinstance(chunk, DiskFile):
+        copied = kernel_copy(chunk.file, file_obj)
+
+    if not copied:
+        if hasattr(chunk, 'chunks'):
+            chunks = chunk.chunks(buffer_size)
+        else:
+            chunks = read_file(chunk, buffer_size=buffer_size)
+        written = 0
+        for data in chunks:
+            file_obj.write(data)
+            for hasher in hashers:
+                hasher.update(data)
+            written += len(data)
+        return written
+
+    # Data copied by the kernel still has to be read to be hashed
+    chunk.seek(0)
+    if hashers:
+        for data in read_file(chunk, copied, buffer_size):
+            for hasher in hashers:
+                hasher.update(data)
+    else:
+        chunk.seek(copied)
+    written = copied
+    for data in read_file(chunk, buffer_size=buffer_size):
+        file_obj.write(data)
+        for hasher in hashers:
+            hasher.update(data)
+        written += len(data)
+    return written
+
+
+class FileRange(object):
+    """
+    File-like object reading the `size` bytes of the file object `file_obj`
+    from `start` (e.g. for `FileResponse`). Its `fileno()` is exposed, so
+    WSGI servers supporting `wsgi.file_wrapper` (e.g. gunicorn) send it
+    with `os.sendfile`, from the current position of the file descriptor
+    and up to the Content-Length of the response.
+    """
+
+    def __init__(self, file_obj, start, size):
+        self.file_obj = file_obj
+        self.file_obj.seek(start)
+        self.remaining = size
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file_obj.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file_obj.fileno()
+
+    def close(self):
+        self.file_obj.close()
@@ -0,0 +1,119 @@
+"""
+Upload handlers for django-chunked-upload.
+"""
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+
+from .exceptions import ChunkedUploadError
+from .files import chunk_written
+from .state import get_state_cache
+
+
+class WrittenChunk(UploadedFile):
+    """
+    Chunk already written into the file of `chunked_upload` (at its offset)
+    by `ChunkedUploadHandler`.
+    """
+
+    def __init__(self, chunked_upload, name, size, content_type=None,
+                 charset=None, content_type_extra=None, md5_hasher=None,
+                 digest=None):
+        super(WrittenChunk, self).__init__(
+            file=None, name=name, content_type=content_type, size=size,
+            charset=charset, content_type_extra=content_type_extra)
+        self.chunked_upload = chunked_upload
+        self.md5_hasher = md5_hasher
+        self.digest = digest
+
+
+class ChunkedUploadHandler(FileUploadHandler):
+    """
+    Writes the chunk sent to a `ChunkedUploadView` straight into the file of
+    the upload it belongs to, instead of copying it into memory or a temporary
+    file first.
+    Only used when the `upload_id` (and the chunk `checksum`, if any) is sent
+    in the query string, the start of the `Content-Range` header matches the
+    offset of the upload and its assembler writes into a local file.
+    Otherwise the chunk is left to the next handlers.
+    """
+
+    def __init__(self, request=None, view=None):
+        super(ChunkedUploadHandler, self).__init__(request)
+        self.view = view
+        self.chunked_upload = None
+        self.file_obj = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        view = self.view
+        if view.allow_out_of_order or get_state_cache() is not None:
+            return
+        upload_id = self.request.GET.get('upload_id')
+        match = view.content_range_pattern.match(
+            META.get(view.content_range_header, ''))
+        if not upload_id or not match:
+            return
+        start = int(match.group('start'))
+        total = int(match.group('total'))
+        max_bytes = view.get_max_bytes(self.request)
+        if max_bytes is not None and total > max_bytes:
+            return
+        try:
+            # Locked until the view is done with it (see ChunkedUploadView)
+            queryset = view.get_queryset(self.request).select_for_update()
+            chunked_upload = queryset.get(upload_id=upload_id)
+            view.is_valid_chunked_upload(chunked_upload)
+        except (ObjectDoesNotExist, ChunkedUploadError):
+            return
+        if chunked_upload.offset != start or not chunked_upload.assembler.local:
+            return
+        self.chunked_upload = chunked_upload
+
+    def new_file(self, field_name, *args, **kwargs):
+        super(ChunkedUploadHandler, self).new_file(field_name, *args, **kwargs)
+        if self.chunked_upload is None or field_name != self.view.field_name:
+            return
+        self.md5_hasher = self.chunked_upload.get_md5_hasher()
+        self.checksum_hasher = None
+        if self.request.GET.get(self.view.checksum_field_name):
+            self.checksum_hasher = self.chunked_upload.checksum_backend.new()
+        self.file_obj = self.chunked_upload.assembler.open_for_write()
+        self.file_obj.seek(self.chunked_upload.offset)
+        self.chunked_upload.assembler.truncate(self.file_obj)
+        self.size = 0
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.file_obj is None:
+            return raw_data
+        self.file_obj.write(raw_data)
+        for hasher in (self.md5_hasher, self.checksum_hasher):
+            if hasher is not None:
+                hasher.update(raw_data)
+        self.size += len(raw_data)
+
+    def file_complete(self, file_size):
+        if self.file_obj is None:
+            return None
+        chunk_written(self.file_obj, self.chunked_upload.offset)
+        self.file_obj.close()
+        self.file_obj = None
+        chunked_upload, self.chunked_upload = self.chunked_upload, None
+        digest = None
+        if self.checksum_hasher is not None:
+            digest = self.checksum_hasher.hexdigest()
+        return WrittenChunk(
+            chunked_upload, name=self.file_name, size=self.size,
+            content_type=self.content_type, charset=self.charset,
+            content_type_extra=self.content_type_extra,
+            md5_hasher=self.md5_hasher, digest=digest)
+
+    def upload_interrupted(self):
+        # Data written after the offset is discarded by the next append
+        if self.file_obj is not None:
+            self.file_obj.close()
+            self.file_obj = None
+
+    def upload_complete(self):
+        self.upload_interrupted()
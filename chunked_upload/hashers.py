@@ -0,0 +1,137 @@
+"""
+Hash objects whose internal state can be saved and restored between
+requests, so digests can be computed incrementally while chunks arrive.
+"""
+import ctypes
+import ctypes.util
+import struct
+import sys
+import threading
+
+# sizeof(MD5_CTX): A, B, C, D, Nl, Nh, data[16], num (32 bits each)
+MD5_STATE_SIZE = 92
+# Offset of Nl, Nh (the number of bits hashed)
+MD5_LENGTH_OFFSET = 16
+
+_libcrypto = None
+_loaded = False
+_load_lock = threading.Lock()
+
+
+def _self_test(lib):
+    """
+    Checks the MD5 functions of `lib` use the expected `MD5_CTX` layout:
+    nothing is written past `MD5_STATE_SIZE` bytes, the length is stored at
+    `MD5_LENGTH_OFFSET`, a state copied mid-way resumes correctly and the
+    digest is right.
+    """
+    padding = 256
+    data = b'abc' * 30  # Not a multiple of the block size
+    size = MD5_STATE_SIZE + padding
+    ctx = ctypes.create_string_buffer(b'\xa5' * size, size)
+    lib.MD5_Init(ctx)
+    lib.MD5_Update(ctx, data[:50], 50)
+    if ctx.raw[MD5_STATE_SIZE:] != b'\xa5' * padding:
+        return False
+    low, high = struct.unpack_from('=II', ctx.raw, MD5_LENGTH_OFFSET)
+    if ((high << 32) | low) >> 3 != 50:
+        return False
+    resumed = ctypes.create_string_buffer(
+        ctx.raw[:MD5_STATE_SIZE] + b'\xa5' * padding, size)
+    lib.MD5_Update(resumed, data[50:], len(data) - 50)
+    out = ctypes.create_string_buffer(16)
+    lib.MD5_Final(out, resumed)
+    return (resumed.raw[MD5_STATE_SIZE:] == b'\xa5' * padding
+            and out.raw.hex() == 'daa54284568d250dde2cc8578c2e116a')
+
+
+def _load_libcrypto():
+    name = ctypes.util.find_library('crypto')
+    if name is None:
+        return None
+    if sys.platform == 'darwin' and not name.startswith(('/usr/local/',
+                                                         '/opt/')):
+        # Loading the unversioned system libcrypto aborts the process
+        return None
+    try:
+        lib = ctypes.CDLL(name)
+        # Make sure the low level API is exported
+        lib.MD5_Init, lib.MD5_Update, lib.MD5_Final
+        if not _self_test(lib):
+            return None
+    except (OSError, AttributeError):
+        return None
+    return lib
+
+
+def get_libcrypto():
+    """
+    Returns OpenSSL's libcrypto (loaded on the first call), or `None` if it
+    isn't available or its `MD5_CTX` doesn't have the expected layout.
+    """
+    global _libcrypto, _loaded
+    if not _loaded:
+        with _load_lock:
+            if not _loaded:
+                _libcrypto = _load_libcrypto()
+                _loaded = True
+    return _libcrypto
+
+
+class ResumableMD5(object):
+    """
+    MD5 hash object backed by OpenSSL's MD5_CTX. Unlike `hashlib.md5`, its
+    state can be exported as bytes (see `state`) and restored later.
+    """
+
+    name = 'md5'
+    state_size = MD5_STATE_SIZE
+
+    def __init__(self, state=None):
+        self._lib = get_libcrypto()
+        if self._lib is None:
+            raise RuntimeError('libcrypto is not available')
+        if state is None:
+            self._ctx = ctypes.create_string_buffer(self.state_size)
+            self._lib.MD5_Init(self._ctx)
+        else:
+            state = bytes(state)
+            if len(state) != self.state_size:
+                raise ValueError('Invalid MD5 state')
+            self._ctx = ctypes.create_string_buffer(state, self.state_size)
+
+    def update(self, data):
+        data = bytes(data)
+        self._lib.MD5_Update(self._ctx, data, len(data))
+
+    def copy(self):
+        return self.__class__(state=self.state)
+
+    def digest(self):
+        out = ctypes.create_string_buffer(16)
+        ctx = ctypes.create_string_buffer(self.state, self.state_size)
+        self._lib.MD5_Final(out, ctx)
+        return out.raw
+
+    def hexdigest(self):
+        return self.digest().hex()
+
+    @property
+    def state(self):
+        return self._ctx.raw
+
+    @property
+    def length(self):
+        """
+        Number of bytes hashed so far.
+        """
+        low, high = struct.unpack_from('=II', self._ctx.raw, MD5_LENGTH_OFFSET)
+        return ((high << 32) | low) >> 3
+
+
+def is_resumable_md5_available():
+    """
+    Whether `ResumableMD5` can be used (loading libcrypto, see
+    `get_libcrypto`).
+    """
+    return get_libcrypto() is not None
@@ -1,10 +1,15 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.utils import timezone
 from django.utils.translation import gettext as _
 
-from chunked_upload.settings import EXPIRATION_DELTA
-from chunked_upload.models import ChunkedUpload
-from chunked_upload.constants import UPLOADING, COMPLETE
+from chunked_upload.models import ChunkedUpload, StoredChunk
+from chunked_upload.constants import UPLOADING, COMPLETE, PROCESSING, FAILED
+from chunked_upload.settings import PROCESSING_TIMEOUT
+from chunked_upload.state import get_state_cache
 
 prompt_msg = _(u'Do you want to delete {obj}?')
 
@@ -25,26 +30,150 @@ class Command(BaseCommand):
             default=False,
             help='Prompt confirmation before each deletion.',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of uploads deleted with each query (default: 1000).',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Number of threads deleting the files (default: 8).',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Max number of uploads to delete.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            default=False,
+            help='Only report the uploads that would be deleted.',
+        )
+
+    def get_queryset(self):
+        """
+        Expired uploads, in expiration order (except those being completed
+        in the background, unless stale, see
+        `CHUNKED_UPLOAD_PROCESSING_TIMEOUT`).
+        """
+        now = timezone.now()
+        qs = self.model.objects.filter(expires_on__lte=now).exclude(
+            status=PROCESSING, processing_on__gt=now - PROCESSING_TIMEOUT)
+        return qs.order_by('expires_on', 'pk')
+
+    def get_batches(self, qs, batch_size, limit=None):
+        """
+        Yields lists of (at most `batch_size`) uploads of `qs`, paginating
+        on (`expires_on`, `pk`) so each query is a range scan of the
+        `expires_on` index reading only the rows it returns.
+        """
+        last = None
+        count = 0
+        while limit is None or count < limit:
+            size = batch_size if limit is None else min(batch_size,
+                                                        limit - count)
+            batch_qs = qs
+            if last is not None:
+                batch_qs = qs.filter(
+                    expires_on__gte=last.expires_on
+                ).exclude(expires_on=last.expires_on, pk__lte=last.pk)
+            batch = list(batch_qs.defer('md5_state', 'chunk_checksums')[:size])
+            if not batch:
+                break
+            count += len(batch)
+            last = batch[-1]
+            yield batch
+
+    def get_stored_size(self, chunked_upload):
+        """
+        Bytes stored for the upload (files receiving chunks out of order are
+        preallocated with their total size).
+        """
+        if chunked_upload.received_ranges and chunked_upload.total_size:
+            return chunked_upload.total_size
+        return chunked_upload.offset
+
+    def delete_file(self, chunked_upload):
+        try:
+            chunked_upload.assembler.delete()
+        except Exception as error:
+            self.stderr.write('Could not delete the file of %s: %s' % (
+                chunked_upload, error))
+            return False
+        return True
 
     def handle(self, *args, **options):
         interactive = options.get('interactive')
+        dry_run = options.get('dry_run')
+
+        self.count = {UPLOADING: 0, COMPLETE: 0, PROCESSING: 0, FAILED: 0}
+        self.size = 0
+        start = time.monotonic()
+        qs = self.get_queryset()
+        if interactive:
+            self.delete_interactively(qs, options['limit'], dry_run)
+        else:
+            self.delete_batches(qs, options['batch_size'], options['workers'],
+                                options['limit'], dry_run)
+        elapsed = time.monotonic() - start
 
-        count = {UPLOADING: 0, COMPLETE: 0}
-        qs = self.model.objects.all()
-        qs = qs.filter(created_on__lt=(timezone.now() - EXPIRATION_DELTA))
+        deleted = 'would be deleted' if dry_run else 'were deleted'
+        self.stdout.write('%i complete uploads %s.' % (
+            self.count[COMPLETE], deleted))
+        self.stdout.write('%i incomplete uploads %s.' % (
+            self.count[UPLOADING] + self.count[PROCESSING]
+            + self.count[FAILED], deleted))
+        total = sum(self.count.values())
+        self.stdout.write('%i uploads (%i bytes) in %.2fs (%.1f uploads/s).' % (
+            total, self.size, elapsed, total / elapsed if elapsed else 0))
 
-        for chunked_upload in qs:
-            if interactive:
-                prompt = prompt_msg.format(obj=chunked_upload) + u' (y/n): '
+    def delete_interactively(self, qs, limit, dry_run):
+        for chunked_upload in qs.iterator():
+            if limit is not None and sum(self.count.values()) >= limit:
+                break
+            prompt = prompt_msg.format(obj=chunked_upload) + u' (y/n): '
+            answer = input(prompt).lower()
+            while answer not in ('y', 'n'):
                 answer = input(prompt).lower()
-                while answer not in ('y', 'n'):
-                    answer = input(prompt).lower()
-                if answer == 'n':
-                    continue
+            if answer == 'n':
+                continue
 
-            count[chunked_upload.status] += 1
-            # Deleting objects individually to call delete method explicitly
-            chunked_upload.delete()
+            self.count[chunked_upload.status] += 1
+            self.size += self.get_stored_size(chunked_upload)
+            if not dry_run:
+                # Deleting objects individually to call delete method
+                # explicitly
+                chunked_upload.delete()
 
-        print('%i complete uploads were deleted.' % count[COMPLETE])
-        print('%i incomplete uploads were deleted.' % count[UPLOADING])
+    def delete_batches(self, qs, batch_size, workers, limit, dry_run):
+        state_cache = get_state_cache()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch in self.get_batches(qs, batch_size, limit):
+                if not dry_run:
+                    # Rows are deleted first (with a single query), so no
+                    # upload is left without its file
+                    with transaction.atomic():
+                        self.model.objects.filter(
+                            pk__in=[chunked_upload.pk
+                                    for chunked_upload in batch]
+                        ).delete()
+                        # References to the chunks of deduplicated uploads
+                        StoredChunk.release([
+                            digest for chunked_upload in batch
+                            for digest in chunked_upload.get_chunk_refs()])
+                    if state_cache is not None:
+                        # Otherwise a cached state could be written back
+                        # (inserting the row again)
+                        state_cache.delete_many([
+                            chunked_upload.upload_id
+                            for chunked_upload in batch])
+                    # Files are deleted concurrently (one storage call each)
+                    list(executor.map(self.delete_file, batch))
+                for chunked_upload in batch:
+                    self.count[chunked_upload.status] += 1
+                    self.size += self.get_stored_size(chunked_upload)
@@ -0,0 +1,247 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+from chunked_upload.models import ChunkedUpload
+from chunked_upload.constants import CHUNKED_UPLOAD_CHOICES
+from chunked_upload.settings import UPLOAD_PATH, CHUNK_STORE_PATH
+
+PART_SUFFIX = '.part'
+
+
+def get_static_prefix(path):
+    """
+    Leading directories of `path` without strftime formatting (e.g.
+    'chunked_uploads' for 'chunked_uploads/%Y/%m/%d').
+    """
+    parts = []
+    for part in path.strip('/').split('/'):
+        if '%' in part:
+            break
+        parts.append(part)
+    return '/'.join(parts)
+
+
+class Command(BaseCommand):
+
+    # Has to be a ChunkedUpload subclass
+    model = ChunkedUpload
+    # Field of the user of the uploads (like in the views), for --usage
+    user_field_name = 'user'
+
+    help = ('Finds the upload files (.part) left without their chunked '
+            'upload, and reports the bytes staged by the uploads.')
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--path',
+            default=None,
+            help='Directory scanned, relative to the storage of the uploads '
+                 '(default: the leading directories of '
+                 'CHUNKED_UPLOAD_PATH).',
+        )
+        parser.add_argument(
+            '--delete',
+            action='store_true',
+            default=False,
+            help='Delete the orphaned files (they are only reported by '
+                 'default).',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=3600,
+            help='Files modified more recently (in seconds) are skipped, '
+                 'their upload may not be saved yet (default: 3600).',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of files matched with each query (default: 1000).',
+        )
+        parser.add_argument(
+            '--usage',
+            action='store_true',
+            default=False,
+            help='Report the bytes staged by the uploads, by status, user '
+                 'and day of creation.',
+        )
+        parser.add_argument(
+            '--skip-scan',
+            action='store_true',
+            default=False,
+            help="Don't scan the files (only with --usage).",
+        )
+
+    def get_storage(self):
+        return self.model._meta.get_field('file').storage
+
+    def get_root(self, storage, path):
+        """
+        Absolute path of the directory scanned.
+        """
+        if path is None:
+            path = get_static_prefix(UPLOAD_PATH)
+        try:
+            root = storage.path(path)
+        except NotImplementedError:
+            raise CommandError(
+                'The storage of the uploads has no local files to scan.')
+        if os.path.normpath(root) == os.path.normpath(storage.path('')):
+            # Files of other applications would be scanned (and deleted)
+            raise CommandError(
+                'Refusing to scan the whole storage of the uploads '
+                '(CHUNKED_UPLOAD_PATH has no leading directory without '
+                'formatting), set the directory of the uploads with --path.')
+        return root
+
+    def scan(self, root, exclude=()):
+        """
+        Yields the `os.DirEntry` of the files under `root` (depth first),
+        skipping the directories of `exclude`. Only the directories left to
+        scan are kept in memory (not the files).
+        """
+        stack = [root]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.path not in exclude:
+                                stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield entry
+            except FileNotFoundError:  # Removed meanwhile
+                continue
+
+    def get_batches(self, entries, batch_size, min_age):
+        """
+        Yields lists of (at most `batch_size`) (entry, size) pairs of the
+        `.part` files of `entries` not modified in the last `min_age`
+        seconds.
+        """
+        batch = []
+        for entry in entries:
+            if not entry.name.endswith(PART_SUFFIX):
+                self.count['other'] += 1
+                continue
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime > time.time() - min_age:
+                self.count['recent'] += 1
+                continue
+            batch.append((entry, stat.st_size))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def get_name(self, storage, path):
+        """
+        Name in `storage` of the file at `path` (like the names saved in the
+        `file` field).
+        """
+        name = os.path.relpath(path, storage.path(''))
+        return name.replace(os.sep, '/')
+
+    def find_orphans(self, storage, batch):
+        """
+        Returns the (entry, size) pairs of `batch` without an upload whose
+        `file` is that file, with one query.
+        """
+        names = {entry.path: self.get_name(storage, entry.path)
+                 for entry, _ in batch}
+        matched = set(self.model.objects.filter(
+            file__in=set(names.values())).values_list('file', flat=True))
+        return [(entry, size) for entry, size in batch
+                if names[entry.path] not in matched]
+
+    def delete_file(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            self.stderr.write('Could not delete %s: %s' % (path, error))
+            return False
+        return True
+
+    def handle(self, *args, **options):
+        if not options['skip_scan']:
+            self.reconcile(options)
+        if options['usage']:
+            self.report_usage()
+
+    def reconcile(self, options):
+        delete = options['delete']
+        storage = self.get_storage()
+        root = self.get_root(storage, options['path'])
+        exclude = {os.path.normpath(storage.path(CHUNK_STORE_PATH))}
+
+        self.count = {'matched': 0, 'orphaned': 0, 'recent': 0, 'other': 0}
+        self.size = {'matched': 0, 'orphaned': 0}
+        start = time.monotonic()
+        batches = self.get_batches(self.scan(root, exclude),
+                                   options['batch_size'], options['min_age'])
+        for batch in batches:
+            orphans = self.find_orphans(storage, batch)
+            for entry, size in orphans:
+                if options['verbosity'] >= 2:
+                    self.stdout.write(entry.path)
+                if delete and not self.delete_file(entry.path):
+                    continue
+                self.count['orphaned'] += 1
+                self.size['orphaned'] += size
+            self.count['matched'] += len(batch) - len(orphans)
+            self.size['matched'] += (sum(size for _, size in batch)
+                                     - sum(size for _, size in orphans))
+        elapsed = time.monotonic() - start
+
+        self.stdout.write('%i files (%i bytes) of uploads.' % (
+            self.count['matched'], self.size['matched']))
+        self.stdout.write('%i orphaned files (%i bytes) %s.' % (
+            self.count['orphaned'], self.size['orphaned'],
+            'were deleted' if delete else 'found'))
+        self.stdout.write('%i recent files and %i other files skipped.' % (
+            self.count['recent'], self.count['other']))
+        total = sum(self.count.values())
+        self.stdout.write('%i files scanned in %.2fs (%.1f files/s).' % (
+            total, elapsed, total / elapsed if elapsed else 0))
+
+    def get_usage_queryset(self):
+        """
+        Number of uploads and bytes received, by status, user (if the model
+        has a `user_field_name` field) and day of creation.
+        """
+        fields = ['status']
+        if any(field.name == self.user_field_name
+               for field in self.model._meta.fields):
+            fields.append(self.user_field_name)
+        return self.model.objects.annotate(
+            day=TruncDate('created_on')
+        ).values(*fields, 'day').annotate(
+            uploads=Count('pk'), size=Sum('offset')
+        ).order_by('day', *fields)
+
+    def report_usage(self):
+        statuses = dict(CHUNKED_UPLOAD_CHOICES)
+        total_uploads = total_size = 0
+        self.stdout.write('day         status      user        uploads'
+                          '             bytes')
+        for row in self.get_usage_queryset().iterator():
+            self.stdout.write('%-11s %-11s %-11s %7i %17i' % (
+                row['day'], statuses.get(row['status'], row['status']),
+                row.get(self.user_field_name) or '-', row['uploads'],
+                row['size'] or 0))
+            total_uploads += row['uploads']
+            total_size += row['size'] or 0
+        self.stdout.write('%i uploads (%i bytes).' % (total_uploads,
+                                                      total_size))
@@ -0,0 +1,241 @@
+"""
+Instrumentation of the phases of the processing of uploads: "request" (the
+whole POST request), "parse" (reading of the request body), "lookup" (of
+the upload in the database), "append" (writing of a chunk), "save",
+"assemble", "md5_check" (or "checksum_check") and "on_completion".
+
+The duration, size (bytes), `upload_id` and outcome of each phase are sent
+with the `phase_finished` signal, and recorded by the metrics backend of the
+`CHUNKED_UPLOAD_METRICS` setting (if any). When there is neither a backend
+nor receivers of the signal, phases aren't measured at all.
+"""
+import socket
+import threading
+import time
+from collections import defaultdict
+
+from django.utils.module_loading import import_string
+
+from .settings import METRICS, METRICS_OPTIONS
+from .signals import phase_finished
+
+SUCCESS = 'success'
+ERROR = 'error'
+
+
+class BaseMetrics(object):
+    """
+    Base metrics backend. Subclasses must implement `record()`.
+    """
+
+    def record(self, phase, duration, size=None, upload_id=None,
+               outcome=SUCCESS):
+        """
+        Records a phase that took `duration` seconds to process `size` bytes
+        (if known) of the upload `upload_id`.
+        """
+        raise NotImplementedError
+
+
+class PrometheusMetrics(BaseMetrics):
+    """
+    Keeps the metrics in memory (per process), rendered in the Prometheus
+    text format by `render()` (see `ChunkedUploadMetricsView`): a histogram
+    of the duration of the phases, and a counter of the bytes processed, by
+    phase and outcome.
+    """
+
+    buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+               10, 30, 60)
+
+    def __init__(self, prefix='chunked_upload', buckets=None):
+        self.prefix = prefix
+        if buckets is not None:
+            self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            # (phase, outcome) -> [count of each bucket, count, sum]
+            self.durations = {}
+            self.sizes = defaultdict(int)
+
+    def record(self, phase, duration, size=None, upload_id=None,
+               outcome=SUCCESS):
+        key = (phase, outcome)
+        with self.lock:
+            histogram = self.durations.get(key)
+            if histogram is None:
+                histogram = self.durations[key] = [
+                    [0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += 1
+            histogram[2] += duration
+            if size:
+                self.sizes[key] += size
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text format.
+        """
+        duration = self.prefix + '_phase_duration_seconds'
+        size = self.prefix + '_phase_bytes_total'
+        lines = [
+            '# HELP %s Duration of the phases of the uploads.' % duration,
+            '# TYPE %s histogram' % duration,
+        ]
+        with self.lock:
+            durations = sorted(self.durations.items())
+            sizes = sorted(self.sizes.items())
+        for (phase, outcome), (buckets, count, total) in durations:
+            labels = 'phase="%s",outcome="%s"' % (phase, outcome)
+            for bound, bucket_count in zip(self.buckets, buckets):
+                lines.append('%s_bucket{%s,le="%s"} %i' % (
+                    duration, labels, repr(float(bound)), bucket_count))
+            lines.append('%s_bucket{%s,le="+Inf"} %i' % (duration, labels,
+                                                         count))
+            lines.append('%s_sum{%s} %r' % (duration, labels, total))
+            lines.append('%s_count{%s} %i' % (duration, labels, count))
+        lines.append('# HELP %s Bytes processed by the phases of the '
+                     'uploads.' % size)
+        lines.append('# TYPE %s counter' % size)
+        for (phase, outcome), total in sizes:
+            lines.append('%s{phase="%s",outcome="%s"} %i' % (
+                size, phase, outcome, total))
+        return '\n'.join(lines) + '\n'
+
+
+class StatsdMetrics(BaseMetrics):
+    """
+    Sends the metrics to a statsd server over UDP: the duration of each
+    phase as a timer `<prefix>.<phase>.<outcome>` (in milliseconds), and the
+    bytes processed as a counter `<prefix>.<phase>.bytes`. With `tags`, the
+    phase and outcome are sent as DogStatsD tags instead
+    (`<prefix>.duration` and `<prefix>.bytes`).
+    """
+
+    def __init__(self, host='localhost', port=8125, prefix='chunked_upload',
+                 tags=False):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.tags = tags
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+
+    def get_lines(self, phase, duration, size, outcome):
+        """
+        Returns the lines (statsd datagrams) of a phase.
+        """
+        milliseconds = duration * 1000
+        if self.tags:
+            tags = '|#phase:%s,outcome:%s' % (phase, outcome)
+            lines = ['%s.duration:%.3f|ms%s' % (self.prefix, milliseconds,
+                                                tags)]
+            if size:
+                lines.append('%s.bytes:%i|c%s' % (self.prefix, size, tags))
+            return lines
+        lines = ['%s.%s.%s:%.3f|ms' % (self.prefix, phase, outcome,
+                                       milliseconds)]
+        if size:
+            lines.append('%s.%s.bytes:%i|c' % (self.prefix, phase, size))
+        return lines
+
+    def record(self, phase, duration, size=None, upload_id=None,
+               outcome=SUCCESS):
+        data = '\n'.join(self.get_lines(phase, duration, size, outcome))
+        try:
+            self.socket.sendto(data.encode(), self.address)
+        except OSError:
+            pass  # Metrics are lost rather than failing the upload
+
+
+_metrics = None
+
+
+def get_metrics():
+    """
+    Returns the (shared) instance of the `CHUNKED_UPLOAD_METRICS` backend,
+    created with `CHUNKED_UPLOAD_METRICS_OPTIONS`, or `None` if not set.
+    """
+    global _metrics
+    if METRICS is None:
+        return None
+    if _metrics is None:
+        metrics_class = METRICS
+        if isinstance(metrics_class, str):
+            metrics_class = import_string(metrics_class)
+        _metrics = metrics_class(**METRICS_OPTIONS)
+    return _metrics
+
+
+class Measure(object):
+    """
+    Measures a phase (used as a context manager). Its size, `upload_id` and
+    outcome may be set (with `set()`) once known, within the block. The
+    outcome is "error" if the block raises an exception.
+    """
+
+    def __init__(self, sender, phase, size=None, upload_id=None):
+        self.sender = sender
+        self.phase = phase
+        self.size = size
+        self.upload_id = upload_id
+        self.outcome = SUCCESS
+
+    def set(self, size=None, upload_id=None, outcome=None):
+        if size is not None:
+            self.size = size
+        if upload_id is not None:
+            self.upload_id = upload_id
+        if outcome is not None:
+            self.outcome = outcome
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.outcome = ERROR
+        metrics = get_metrics()
+        if metrics is not None:
+            metrics.record(self.phase, duration, size=self.size,
+                           upload_id=self.upload_id, outcome=self.outcome)
+        if phase_finished.receivers:
+            phase_finished.send(sender=self.sender, phase=self.phase,
+                                duration=duration, size=self.size,
+                                upload_id=self.upload_id,
+                                outcome=self.outcome)
+        return False
+
+
+class NullMeasure(object):
+    """
+    Measure doing nothing, when instrumentation is disabled.
+    """
+
+    def set(self, size=None, upload_id=None, outcome=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_null_measure = NullMeasure()
+
+
+def measure(sender, phase, size=None, upload_id=None):
+    """
+    Returns a context manager measuring the phase `phase` (see `Measure`),
+    or doing nothing if instrumentation is disabled.
+    """
+    if METRICS is None and not phase_finished.receivers:
+        return _null_measure
+    return Measure(sender, phase, size=size, upload_id=upload_id)
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:14
+
+import chunked_upload.settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chunked_upload', '0002_chunkedupload_md5_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='checksum_algorithm',
+            field=models.CharField(default=chunked_upload.settings.CHECKSUM_ALGORITHM, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='chunk_checksums',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chunked_upload', '0005_chunkedupload_received_ranges'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='assembly_state',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+    ]
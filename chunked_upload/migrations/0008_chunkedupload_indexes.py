@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:34
+
+import chunked_upload.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+def set_expires_on(apps, schema_editor):
+    from chunked_upload.settings import EXPIRATION_DELTA
+    ChunkedUpload = apps.get_model('chunked_upload', 'ChunkedUpload')
+    ChunkedUpload.objects.update(
+        expires_on=models.F('created_on') + EXPIRATION_DELTA)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chunked_upload', '0007_chunkedupload_completion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='expires_on',
+            field=models.DateTimeField(db_index=True, default=chunked_upload.models.default_expires_on, editable=False),
+        ),
+        migrations.RunPython(set_expires_on, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='chunkedupload',
+            index=models.Index(condition=models.Q(('status', 1)), fields=['user', 'created_on'], name='chunked_upload_user_uploading'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:01
+
+import chunked_upload.settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chunked_upload', '0008_chunkedupload_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredChunk',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('file', models.FileField(max_length=255, upload_to=chunked_upload.settings.CHUNK_STORE_PATH)),
+                ('size', models.BigIntegerField()),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='chunk_manifest',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='chunk_refs',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+    ]
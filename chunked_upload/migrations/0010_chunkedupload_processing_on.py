@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chunked_upload', '0009_chunkedupload_dedup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='processing_on',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,19 +1,35 @@
 import hashlib
+import json
 import uuid
+from collections import Counter
 
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.core.files.uploadedfile import UploadedFile
+from django.db.models.fields.files import FieldFile
 from django.utils import timezone
+from django.utils.module_loading import import_string
 
-from .settings import EXPIRATION_DELTA, UPLOAD_TO, STORAGE, DEFAULT_MODEL_USER_FIELD_NULL, DEFAULT_MODEL_USER_FIELD_BLANK
-from .constants import CHUNKED_UPLOAD_CHOICES, UPLOADING
+from .settings import EXPIRATION_DELTA, UPLOAD_TO, STORAGE, DEFAULT_MODEL_USER_FIELD_NULL, DEFAULT_MODEL_USER_FIELD_BLANK, \
+    INCREMENTAL_MD5, CHECKSUM_ALGORITHM, ASSEMBLER, ASSEMBLER_OPTIONS, CHUNK_STORE_PATH, \
+    PROCESSING_TIMEOUT
+from .constants import CHUNKED_UPLOAD_CHOICES, UPLOADING, PROCESSING, http_status
+from .checksums import get_checksum_backend
+from .exceptions import ChunkedUploadError, ChunkChecksumError
+from .files import DiskFile, read_file
+from .hashers import ResumableMD5, is_resumable_md5_available
+from .state import get_state_cache
+from .metrics import measure
 
 
 def generate_upload_id():
     return uuid.uuid4().hex
 
 
+def default_expires_on():
+    return timezone.now() + EXPIRATION_DELTA
+
+
 class AbstractChunkedUpload(models.Model):
     """
     Base chunked upload model. This model is abstract (doesn't create a table
@@ -27,60 +43,447 @@ class AbstractChunkedUpload(models.Model):
                             storage=STORAGE)
     filename = models.CharField(max_length=255)
     offset = models.BigIntegerField(default=0)
+    # Size of the whole file, if known (e.g. from the Content-Range header)
+    total_size = models.BigIntegerField(null=True, blank=True)
+    # JSON list of the [start, end) byte ranges received, only for uploads
+    # receiving chunks out of order (see `add_received_range`)
+    received_ranges = models.TextField(blank=True, default='', editable=False)
     created_on = models.DateTimeField(auto_now_add=True)
+    # Stored (and indexed) so expired uploads are found with a range scan
+    expires_on = models.DateTimeField(default=default_expires_on,
+                                      db_index=True, editable=False)
     status = models.PositiveSmallIntegerField(choices=CHUNKED_UPLOAD_CHOICES,
                                               default=UPLOADING)
     completed_on = models.DateTimeField(null=True, blank=True)
+    # When the upload was marked as "processing" (completed in the
+    # background, see `CHUNKED_UPLOAD_PROCESSING_TIMEOUT`)
+    processing_on = models.DateTimeField(null=True, blank=True,
+                                         editable=False)
+    # Serialized MD5 state of the first `offset` bytes (see `append_chunk`)
+    md5_state = models.BinaryField(null=True, blank=True, editable=False)
+    checksum_algorithm = models.CharField(max_length=32,
+                                          default=CHECKSUM_ALGORITHM)
+    # JSON list of [start, size, hexdigest] of the verified chunks
+    chunk_checksums = models.TextField(blank=True, default='', editable=False)
+    # JSON result of the completion processed in the background: data
+    # returned by `on_completion`, or the error if it failed
+    completion_result = models.TextField(blank=True, default='',
+                                         editable=False)
+    # State of the assembler (e.g. id and parts of a multipart upload)
+    assembly_state = models.TextField(blank=True, default='', editable=False)
+    # JSON list of [digest, size] of the chunks of deduplicated uploads, in
+    # order, and list of the digests of the stored chunks they reference
+    # (see `StoredChunk`)
+    chunk_manifest = models.TextField(blank=True, default='', editable=False)
+    chunk_refs = models.TextField(blank=True, default='', editable=False)
 
-    @property
-    def expires_on(self):
-        return self.created_on + EXPIRATION_DELTA
+    # Class (or dotted path to the class) putting the chunks together
+    assembler_class = ASSEMBLER
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(AbstractChunkedUpload, cls).from_db(db, field_names,
+                                                             values)
+        # Values in the database, so only the fields changed are saved
+        instance._loaded_values = instance.get_field_values()
+        return instance
+
+    def get_field_values(self):
+        """
+        Values of the (loaded) concrete fields, by attribute name.
+        """
+        values = {}
+        for field in self._meta.concrete_fields:
+            if field.attname not in self.__dict__:  # Deferred
+                continue
+            value = self.__dict__[field.attname]
+            if isinstance(value, FieldFile):
+                value = value.name
+            elif isinstance(value, memoryview):
+                value = bytes(value)
+            values[field.attname] = value
+        return values
+
+    def get_changed_fields(self):
+        """
+        Fields changed since the instance was loaded from (or saved to) the
+        database, `None` if unknown.
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return None
+        return [name for name, value in self.get_field_values().items()
+                if name not in loaded or loaded[name] != value]
+
+    def save(self, *args, **kwargs):
+        """
+        Saves only the fields changed (e.g. `offset` and `md5_state` when a
+        chunk is appended), unless `update_fields` is given.
+        """
+        update_fields = kwargs.get('update_fields')
+        if (update_fields is None and not self._state.adding
+                and not kwargs.get('force_insert')):
+            update_fields = self.get_changed_fields()
+            kwargs['update_fields'] = update_fields
+        super(AbstractChunkedUpload, self).save(*args, **kwargs)
+        values = self.get_field_values()
+        loaded = getattr(self, '_loaded_values', None)
+        if update_fields is None or loaded is None:
+            self._loaded_values = values
+        else:
+            for name in update_fields:
+                attname = self._meta.get_field(name).attname
+                loaded[attname] = values.get(attname)
 
     @property
     def expired(self):
         return self.expires_on <= timezone.now()
 
+    @property
+    def processing_stale(self):
+        """
+        Whether the upload is "processing" for longer than
+        `CHUNKED_UPLOAD_PROCESSING_TIMEOUT` (its completion job was lost).
+        """
+        return self.status == PROCESSING and (
+            self.processing_on is None
+            or self.processing_on <= timezone.now() - PROCESSING_TIMEOUT)
+
+    def get_md5_hasher(self):
+        """
+        Returns a resumable MD5 hasher holding the digest state of the bytes
+        received so far, or `None` if no valid state is stored.
+        """
+        if not INCREMENTAL_MD5 or not is_resumable_md5_available():
+            return None
+        if self.md5_state is None:
+            return ResumableMD5() if self.offset == 0 else None
+        try:
+            hasher = ResumableMD5(state=self.md5_state)
+        except ValueError:
+            return None
+        if hasher.length != self.offset:
+            # State is stale (e.g. file was modified outside append_chunk)
+            return None
+        return hasher
+
     @property
     def md5(self):
         if getattr(self, '_md5', None) is None:
-            md5 = hashlib.md5()
-            for chunk in self.file.chunks():
-                md5.update(chunk)
-            self._md5 = md5.hexdigest()
+            hasher = self.get_md5_hasher()
+            if hasher is None:
+                hasher = hashlib.md5()
+                with self.assembler.open() as file_obj:
+                    for chunk in read_file(file_obj):
+                        hasher.update(chunk)
+            self._md5 = hasher.hexdigest()
         return self._md5
 
+    @property
+    def checksum_backend(self):
+        return get_checksum_backend(self.checksum_algorithm)
+
+    @property
+    def checksum(self):
+        """
+        Checksum of the whole file, using `checksum_algorithm`.
+        """
+        if self.checksum_algorithm == 'md5':
+            return self.md5
+        if getattr(self, '_checksum', None) is None:
+            with self.assembler.open() as file_obj:
+                self._checksum = self.checksum_backend.checksum(
+                    read_file(file_obj))
+        return self._checksum
+
+    def get_completion_result(self):
+        if self.completion_result:
+            return json.loads(self.completion_result)
+        return None
+
+    def get_chunk_checksums(self):
+        return json.loads(self.chunk_checksums) if self.chunk_checksums else []
+
+    @property
+    def composite_checksum(self):
+        """
+        Checksum of the concatenated (binary) digests of all the chunks,
+        followed by '-' and the number of chunks. `None` if not every chunk
+        was verified when received.
+        """
+        chunk_checksums = sorted(self.get_chunk_checksums())
+        if not chunk_checksums:
+            return None
+        hasher = self.checksum_backend.new()
+        position = 0
+        for start, size, digest in chunk_checksums:
+            if start != position:
+                return None
+            hasher.update(bytes.fromhex(digest))
+            position += size
+        if position != self.offset:
+            return None
+        return '%s-%i' % (hasher.hexdigest(), len(chunk_checksums))
+
+    def verify_checksum(self, checksum):
+        """
+        Checks `checksum` against the uploaded data. Composite checksums (see
+        `composite_checksum`) are checked without reading the file.
+        """
+        checksum = checksum.lower()
+        if '-' in checksum:
+            return self.composite_checksum == checksum
+        return self.checksum == checksum
+
+    def get_chunk_manifest(self):
+        return json.loads(self.chunk_manifest) if self.chunk_manifest else []
+
+    def get_chunk_refs(self):
+        return json.loads(self.chunk_refs) if self.chunk_refs else []
+
+    def add_chunk_refs(self, digests):
+        """
+        Records the references to the stored chunks `digests`, added with
+        `StoredChunk.reference` or `StoredChunk.store`.
+        """
+        refs = self.get_chunk_refs()
+        refs.extend(digest for digest in digests if digest not in refs)
+        self.chunk_refs = json.dumps(refs)
+
+    def get_missing_chunks(self):
+        """
+        Digests of the chunks of the manifest not stored yet, in order.
+        """
+        refs = set(self.get_chunk_refs())
+        missing = []
+        for digest, size in self.get_chunk_manifest():
+            if digest not in refs and digest not in missing:
+                missing.append(digest)
+        return missing
+
+    def append_stored_chunks(self, save=True):
+        """
+        Appends the stored chunks of the manifest to the file (those not
+        appended yet). Raises `ChunkedUploadError` if some are missing.
+        """
+        missing = self.get_missing_chunks()
+        if missing:
+            raise ChunkedUploadError(status=http_status.HTTP_400_BAD_REQUEST,
+                                     detail='Chunks are missing',
+                                     missing=missing)
+        manifest = self.get_chunk_manifest()
+        stored = StoredChunk.objects.in_bulk([digest for digest, size
+                                              in manifest])
+        position = 0
+        for digest, size in manifest:
+            if position >= self.offset:
+                with stored[digest].open_file() as chunk:
+                    self.append_chunk(chunk, chunk_size=size, save=False)
+            position += size
+        if save:
+            self.save()
+
+    def release_chunks(self):
+        """
+        Removes the references of the upload to stored chunks.
+        """
+        StoredChunk.release(self.get_chunk_refs())
+        self.chunk_refs = ''
+
     def delete(self, delete_file=True, *args, **kwargs):
-        if self.file:
-            storage, path = self.file.storage, self.file.path
-        super(AbstractChunkedUpload, self).delete(*args, **kwargs)
-        if self.file and delete_file:
-            storage.delete(path)
+        assembler = self.assembler
+        if self.chunk_refs:
+            with transaction.atomic():
+                super(AbstractChunkedUpload, self).delete(*args, **kwargs)
+                self.release_chunks()
+        else:
+            super(AbstractChunkedUpload, self).delete(*args, **kwargs)
+        state_cache = get_state_cache()
+        if state_cache is not None:
+            state_cache.delete(self.upload_id)
+        if delete_file:
+            assembler.delete()
 
     def __str__(self):
         return u'<%s - upload_id: %s - bytes: %s - status: %s>' % (
             self.filename, self.upload_id, self.offset, self.status)
 
-    def append_chunk(self, chunk, chunk_size=None, save=True):
-        self.file.close()
-        with open(self.file.path, mode='ab') as file_obj:  # mode = append+binary
-            file_obj.write(chunk.read())  # We can use .read() safely because chunk is already in memory
+    @property
+    def assembler(self):
+        """
+        Assembler putting the chunks together (see `assembler_class`).
+        """
+        if getattr(self, '_assembler', None) is None:
+            assembler_class = self.assembler_class
+            if isinstance(assembler_class, str):
+                assembler_class = import_string(assembler_class)
+            self._assembler = assembler_class(self, **ASSEMBLER_OPTIONS)
+        return self._assembler
+
+    def create_file(self, save=False):
+        """
+        Creates the (empty) file of a new chunked upload.
+        """
+        self.assembler.create(save=save)
+
+    def assemble(self, save=True):
+        """
+        Puts the final file together, once all the chunks have been received.
+        """
+        self.assembler.assemble()
+        if save and self.pk is not None:
+            self.save(update_fields=['assembly_state'])
+
+    def append_chunk(self, chunk, chunk_size=None, save=True, checksum=None):
+        """
+        Appends `chunk` to the file. If `checksum` is given, it's verified
+        (using `checksum_algorithm`) against the data of the chunk. Raises
+        `ChunkChecksumError` if it doesn't match.
+        """
+        hasher = self.get_md5_hasher()
+        hashers = [hasher] if hasher is not None else []
+        digest = None
+        if checksum is not None:
+            checksum_hasher = self.checksum_backend.new()
+            hashers.append(checksum_hasher)
+        with measure(type(self), 'append', size=chunk_size,
+                     upload_id=self.upload_id) as measured:
+            size = self.assembler.append(chunk, self.offset, hashers=hashers,
+                                         size=chunk_size)
+            measured.set(size=size)
+        if checksum is not None:
+            digest = checksum_hasher.hexdigest()
+
+        if chunk_size is None:
+            chunk_size = size
+        self.chunk_written(chunk_size, md5_hasher=hasher, checksum=checksum,
+                           digest=digest, save=save)
+
+    def write_chunk_at(self, chunk, start, checksum=None):
+        """
+        Writes `chunk` at position `start` of the file, for chunks received
+        out of order. Returns the number of bytes written and, if `checksum`
+        is given, the digest of the chunk. The chunk has to be registered
+        with `chunk_written` afterwards.
+        """
+        hashers = []
+        if checksum is not None:
+            hashers.append(self.checksum_backend.new())
+        with measure(type(self), 'append',
+                     upload_id=self.upload_id) as measured:
+            size = self.assembler.write_at(chunk, start, hashers=hashers)
+            measured.set(size=size)
+        digest = hashers[0].hexdigest() if hashers else None
+        return size, digest
+
+    def preallocate(self, size, keep_size=False):
+        """
+        Allocates disk space for `size` bytes in the file (without changing
+        its size if `keep_size`).
+        """
+        self.assembler.preallocate(size, keep_size=keep_size)
+
+    def chunk_written(self, size, md5_hasher=None, checksum=None, digest=None,
+                      save=True, start=None):
+        """
+        Updates the upload after a chunk of `size` bytes was written at
+        `offset` in the file. `md5_hasher` must hold the md5 state of the file
+        including the chunk (if `None`, the md5 is computed on completion).
+        If `checksum` is given, it's verified against `digest` (computed
+        reading the chunk from the file if `None`). If it doesn't match, the
+        chunk is discarded and `ChunkChecksumError` raised.
+        Chunks received out of order (see `write_chunk_at`) are registered
+        passing their `start`, and their range added to `received_ranges`.
+        """
+        out_of_order = start is not None
+        if not out_of_order:
+            start = self.offset
+        if checksum is not None:
+            if digest is None:
+                digest = self.checksum_backend.checksum(
+                    self.assembler.read(start, size))
+            if digest != checksum.lower():
+                if not out_of_order:
+                    self.assembler.discard(start)
+                raise ChunkChecksumError(
+                    status=http_status.HTTP_400_BAD_REQUEST,
+                    detail='Chunk checksum does not match',
+                    offset=self.offset)
+            # A chunk sent again replaces the previous one
+            chunk_checksums = [c for c in self.get_chunk_checksums()
+                               if c[0] != start]
+            chunk_checksums.append([start, size, digest])
+            self.chunk_checksums = json.dumps(chunk_checksums)
 
-        if chunk_size is not None:
-            self.offset += chunk_size
-        elif hasattr(chunk, 'size'):
-            self.offset += chunk.size
+        if out_of_order:
+            self.add_received_range(start, start + size)
+            md5_hasher = None
         else:
-            self.offset = self.file.size
+            self.offset += size
+        # Keep the digest state in sync with the data written so far, so the
+        # md5 doesn't need to be computed reading the whole file again
+        self.md5_state = md5_hasher.state if md5_hasher is not None else None
         self._md5 = None  # Clear cached md5
+        self._checksum = None
         if save:
             self.save()
         self.file.close()  # Flush
 
+    def get_received_ranges(self):
+        """
+        Returns the sorted list of [start, end) byte ranges received.
+        """
+        if self.received_ranges:
+            return json.loads(self.received_ranges)
+        return [[0, self.offset]] if self.offset else []
+
+    def add_received_range(self, start, end):
+        """
+        Adds the [start, end) byte range to the received ones. `offset` is
+        updated to the number of contiguous bytes received from the start.
+        """
+        ranges = []
+        for range_start, range_end in sorted(self.get_received_ranges() + [[start, end]]):
+            if ranges and range_start <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], range_end)
+            else:
+                ranges.append([range_start, range_end])
+        self.received_ranges = json.dumps(ranges)
+        self.offset = ranges[0][1] if ranges[0][0] == 0 else 0
+
+    @property
+    def missing_ranges(self):
+        """
+        [start, end) byte ranges not received yet of uploads receiving chunks
+        out of order (always empty for uploads receiving them in order).
+        """
+        if not self.received_ranges or self.total_size is None:
+            return []
+        missing = []
+        position = 0
+        for start, end in self.get_received_ranges() + [[self.total_size, None]]:
+            if start > position:
+                missing.append([position, start])
+            position = end
+        return missing
+
     def get_uploaded_file(self):
+        uploaded_file = UploadedFile(file=self.assembler.open(),
+                                     name=self.filename, size=self.offset)
+        # E.g. to call `finalize_to` in `on_completion`
+        uploaded_file.chunked_upload = self
+        return uploaded_file
+
+    def finalize_to(self, storage, name):
+        """
+        Stores the uploaded file in `storage` as `name` (or an available name
+        based on it), and returns the name of the stored file. Its data isn't
+        copied when possible: the file is hard linked into storages of the
+        same file system, and copied server side between S3 buckets (see
+        the `finalize_to` method of the assemblers).
+        """
         self.file.close()
-        self.file.open(mode='rb')  # mode = read+binary
-        return UploadedFile(file=self.file, name=self.filename,
-                            size=self.offset)
+        return self.assembler.finalize_to(storage, name)
 
     class Meta:
         abstract = True
@@ -97,3 +500,108 @@ class ChunkedUpload(AbstractChunkedUpload):
         null=DEFAULT_MODEL_USER_FIELD_NULL,
         blank=DEFAULT_MODEL_USER_FIELD_BLANK
     )
+
+    class Meta:
+        indexes = [
+            # In progress uploads of a user (partial index on the backends
+            # supporting it, skipped on the others)
+            models.Index(fields=['user', 'created_on'],
+                         condition=models.Q(status=UPLOADING),
+                         name='chunked_upload_user_uploading'),
+        ]
+
+
+class StoredChunk(models.Model):
+    """
+    Chunk of deduplicated uploads (see `ChunkedUploadDedupView`), stored once
+    by its (sha256) digest. `ref_count` is the number of uploads referencing
+    it, and it's deleted when no longer referenced.
+    """
+    algorithm = 'sha256'
+
+    digest = models.CharField(max_length=64, primary_key=True)
+    file = models.FileField(max_length=255, upload_to=CHUNK_STORE_PATH,
+                            storage=STORAGE)
+    size = models.BigIntegerField()
+    ref_count = models.IntegerField(default=0)
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return u'<%s - bytes: %s - refs: %s>' % (self.digest, self.size,
+                                                 self.ref_count)
+
+    @classmethod
+    def get_name(cls, digest):
+        return '%s/%s/%s' % (CHUNK_STORE_PATH.rstrip('/'), digest[:2], digest)
+
+    @classmethod
+    def reference(cls, digests):
+        """
+        Adds a reference to the chunks of `digests` already stored. Returns
+        the set of their digests.
+        """
+        with transaction.atomic():
+            stored = set(cls.objects.select_for_update().filter(
+                digest__in=digests).values_list('digest', flat=True))
+            cls.objects.filter(digest__in=stored).update(
+                ref_count=models.F('ref_count') + 1)
+        return stored
+
+    @classmethod
+    def store(cls, chunk, digest):
+        """
+        Stores `chunk` (if not stored yet) and adds a reference to it.
+        Raises `ChunkChecksumError` if its data doesn't match `digest` (also
+        checked if it's already stored, so a reference is only added with
+        its data).
+        """
+        checksum = get_checksum_backend(cls.algorithm).checksum(chunk.chunks())
+        if checksum != digest:
+            raise ChunkChecksumError(status=http_status.HTTP_400_BAD_REQUEST,
+                                     detail='Chunk checksum does not match')
+        chunk.seek(0)
+        with transaction.atomic():
+            stored, created = cls.objects.select_for_update().get_or_create(
+                digest=digest, defaults={'size': chunk.size})
+            if created:
+                storage = stored.file.storage
+                name = cls.get_name(digest)
+                # Left by a failed transaction, or a stale one
+                storage.delete(name)
+                stored.file.name = storage.save(name, chunk)
+            stored.ref_count += 1
+            stored.save()
+        return stored
+
+    @classmethod
+    def release(cls, digests):
+        """
+        Removes a reference (for each occurrence in `digests`) to stored
+        chunks, deleting those no longer referenced.
+        """
+        by_count = {}
+        for digest, count in Counter(digests).items():
+            by_count.setdefault(count, []).append(digest)
+        with transaction.atomic():
+            for count, group in by_count.items():
+                cls.objects.filter(digest__in=group).update(
+                    ref_count=models.F('ref_count') - count)
+            unreferenced = list(cls.objects.select_for_update().filter(
+                digest__in=list(set(digests)), ref_count__lte=0))
+            # Files are deleted while the rows are locked, so the chunks
+            # can't be stored again meanwhile
+            for stored in unreferenced:
+                stored.file.storage.delete(stored.file.name)
+            cls.objects.filter(
+                pk__in=[stored.pk for stored in unreferenced]).delete()
+
+    def open_file(self):
+        """
+        Opens the file of the chunk for reading. Files of a local storage
+        are copied by the kernel (see `write_chunk`).
+        """
+        try:
+            path = self.file.path
+        except NotImplementedError:
+            return self.file.storage.open(self.file.name, 'rb')
+        return DiskFile(open(path, 'rb'), name=self.file.name)
@@ -1,7 +1,14 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.http import HttpResponse
+from django.utils.http import http_date
 
+from .encoders import orjson, orjson_encode
 from .settings import ENCODER, CONTENT_TYPE
 
+_encoder = DjangoJSONEncoder()
+
 
 class Response(HttpResponse):
     """
@@ -14,3 +21,54 @@ class Response(HttpResponse):
             status=status,
             *args, **kwargs
         )
+
+
+def error_response(error):
+    """
+    Response reporting the `ChunkedUploadError` `error`.
+    """
+    response = Response(error.data, status=error.status_code)
+    for name, value in error.headers.items():
+        response[name] = value
+    return response
+
+
+def ack_response(chunked_upload, mode, received_ranges=None):
+    """
+    Lightweight response acknowledging a chunk of `chunked_upload` (see
+    `CHUNKED_UPLOAD_ACK_MODE`), with its `upload_id`, `offset`, expiration
+    and `received_ranges` (if given). With `mode` 'json', the data is
+    encoded with orjson if installed, or formatted in a pre-serialized
+    template (like the default encoder would).
+    With `mode` 'headers', the response is 204 No Content, with the data in
+    the Upload-Id, Upload-Offset, Upload-Expires and Upload-Received-Ranges
+    (comma-separated inclusive ranges, e.g. "0-99,200-299") headers.
+    """
+    upload_id = chunked_upload.upload_id
+    if mode == 'headers':
+        response = HttpResponse(status=204)
+        del response['Content-Type']  # No content
+        response['Upload-Id'] = upload_id
+        response['Upload-Offset'] = chunked_upload.offset
+        response['Upload-Expires'] = http_date(
+            chunked_upload.expires_on.timestamp())
+        if received_ranges is not None:
+            response['Upload-Received-Ranges'] = ','.join(
+                '%i-%i' % (start, end - 1) for start, end in received_ranges)
+        return response
+    if mode != 'json':
+        raise ValueError('Invalid ack mode: %r' % mode)
+    if orjson is not None:
+        data = {'upload_id': upload_id, 'offset': chunked_upload.offset,
+                'expires': chunked_upload.expires_on}
+        if received_ranges is not None:
+            data['received_ranges'] = received_ranges
+        return HttpResponse(orjson_encode(data), content_type=CONTENT_TYPE)
+    if not upload_id.isalnum():
+        upload_id = json.dumps(upload_id)[1:-1]
+    content = '{"upload_id": "%s", "offset": %i, "expires": "%s"' % (
+        upload_id, chunked_upload.offset,
+        _encoder.default(chunked_upload.expires_on))
+    if received_ranges is not None:
+        content += ', "received_ranges": %s' % json.dumps(received_ranges)
+    return HttpResponse(content + '}', content_type=CONTENT_TYPE)
@@ -41,9 +41,12 @@ try:
 except TypeError:
     STORAGE = import_string(getattr(settings, 'CHUNKED_UPLOAD_STORAGE_CLASS', lambda: None))()
 
-# Function used to encode response data. Receives a dict and return a string
+# Function (or dotted path to it) used to encode response data. Receives a
+# dict and return a string, e.g. 'chunked_upload.encoders.orjson_encode'
 DEFAULT_ENCODER = DjangoJSONEncoder().encode
 ENCODER = getattr(settings, 'CHUNKED_UPLOAD_ENCODER', DEFAULT_ENCODER)
+if isinstance(ENCODER, str):
+    ENCODER = import_string(ENCODER)
 
 # Content-Type for the response data
 DEFAULT_CONTENT_TYPE = 'application/json'
@@ -57,3 +60,133 @@ MAX_BYTES = getattr(settings, 'CHUNKED_UPLOAD_MAX_BYTES', DEFAULT_MAX_BYTES)
 # determine the "null" and "blank" properties of "user" field in the "ChunkedUpload" model
 DEFAULT_MODEL_USER_FIELD_NULL = getattr(settings, 'CHUNKED_UPLOAD_MODEL_USER_FIELD_NULL', True)
 DEFAULT_MODEL_USER_FIELD_BLANK = getattr(settings, 'CHUNKED_UPLOAD_MODEL_USER_FIELD_BLANK', True)
+
+# Keep the md5 digest state up to date while chunks are appended, so the md5
+# doesn't need to be computed reading the whole file on completion.
+# Set to False on hosts where md5 can't be used (e.g. FIPS mode)
+DEFAULT_INCREMENTAL_MD5 = True
+INCREMENTAL_MD5 = getattr(settings, 'CHUNKED_UPLOAD_INCREMENTAL_MD5',
+                          DEFAULT_INCREMENTAL_MD5)
+
+# Available checksum backends (name -> class or dotted path to the class).
+# Backends in the setting are added to (or replace) the default ones
+DEFAULT_CHECKSUM_BACKENDS = {
+    'md5': 'chunked_upload.checksums.MD5Checksum',
+    'sha1': 'chunked_upload.checksums.SHA1Checksum',
+    'sha256': 'chunked_upload.checksums.SHA256Checksum',
+    'blake2b': 'chunked_upload.checksums.BLAKE2bChecksum',
+    'crc32': 'chunked_upload.checksums.CRC32Checksum',
+    'crc32c': 'chunked_upload.checksums.CRC32CChecksum',
+    'xxh64': 'chunked_upload.checksums.XXH64Checksum',
+    'xxh3_64': 'chunked_upload.checksums.XXH3_64Checksum',
+}
+CHECKSUM_BACKENDS = dict(DEFAULT_CHECKSUM_BACKENDS,
+                         **getattr(settings, 'CHUNKED_UPLOAD_CHECKSUM_BACKENDS', {}))
+
+# Checksum algorithm used to verify chunks and uploads (see CHECKSUM_BACKENDS)
+DEFAULT_CHECKSUM_ALGORITHM = 'md5'
+CHECKSUM_ALGORITHM = getattr(settings, 'CHUNKED_UPLOAD_CHECKSUM_ALGORITHM',
+                             DEFAULT_CHECKSUM_ALGORITHM)
+
+# Size of the buffer (in bytes) used when writing chunks into the upload file
+DEFAULT_BUFFER_SIZE = 256 * 1024
+BUFFER_SIZE = getattr(settings, 'CHUNKED_UPLOAD_BUFFER_SIZE',
+                      DEFAULT_BUFFER_SIZE)
+
+# Preallocate the file of new uploads with the total size in the
+# Content-Range header (without changing the size of the file, on Linux), so
+# it isn't fragmented
+DEFAULT_PREALLOCATE = False
+PREALLOCATE = getattr(settings, 'CHUNKED_UPLOAD_PREALLOCATE',
+                      DEFAULT_PREALLOCATE)
+
+# Max size (in bytes) of the files preallocated (in order with
+# CHUNKED_UPLOAD_PREALLOCATE, or out of order): larger uploads aren't
+# preallocated, so a client can't reserve more space than it sends. `None`
+# means no limit
+DEFAULT_MAX_PREALLOCATE = 1024 ** 3
+MAX_PREALLOCATE = getattr(settings, 'CHUNKED_UPLOAD_MAX_PREALLOCATE',
+                          DEFAULT_MAX_PREALLOCATE)
+
+# When the data written into local upload files is flushed to disk: 'chunk'
+# (after each chunk, before its offset is saved), 'complete' (when the upload
+# is completed) or 'never' (left to the OS)
+DEFAULT_FSYNC = 'never'
+FSYNC = getattr(settings, 'CHUNKED_UPLOAD_FSYNC', DEFAULT_FSYNC)
+
+# Drop the data written into local upload files from the page cache
+# (`posix_fadvise` DONTNEED), so uploads don't evict more useful pages
+DEFAULT_DROP_CACHE = False
+DROP_CACHE = getattr(settings, 'CHUNKED_UPLOAD_DROP_CACHE', DEFAULT_DROP_CACHE)
+
+# Class (dotted path) putting the chunks together into the file, and the
+# options (keyword arguments) passed to it
+DEFAULT_ASSEMBLER = 'chunked_upload.assemblers.LocalFileAssembler'
+ASSEMBLER = getattr(settings, 'CHUNKED_UPLOAD_ASSEMBLER', DEFAULT_ASSEMBLER)
+ASSEMBLER_OPTIONS = getattr(settings, 'CHUNKED_UPLOAD_ASSEMBLER_OPTIONS', {})
+
+# Max number of threads running the blocking work (database queries, file
+# writes and hashing) of the async views. `None` uses the default of
+# `ThreadPoolExecutor`
+DEFAULT_ASYNC_MAX_WORKERS = None
+ASYNC_MAX_WORKERS = getattr(settings, 'CHUNKED_UPLOAD_ASYNC_MAX_WORKERS',
+                            DEFAULT_ASYNC_MAX_WORKERS)
+
+# Executor (dotted path) running the completion of uploads (verification
+# and `on_completion`) in the background, and the options (keyword
+# arguments) passed to it. `None` completes uploads within the request
+DEFAULT_COMPLETION_EXECUTOR = None
+COMPLETION_EXECUTOR = getattr(settings, 'CHUNKED_UPLOAD_COMPLETION_EXECUTOR',
+                              DEFAULT_COMPLETION_EXECUTOR)
+COMPLETION_EXECUTOR_OPTIONS = getattr(
+    settings, 'CHUNKED_UPLOAD_COMPLETION_EXECUTOR_OPTIONS', {})
+
+# How long an upload may stay "processing" (completed in the background)
+# before it's considered stale (the job was lost): it can then be completed
+# again, and deleted once expired
+DEFAULT_PROCESSING_TIMEOUT = timedelta(hours=1)
+PROCESSING_TIMEOUT = getattr(settings, 'CHUNKED_UPLOAD_PROCESSING_TIMEOUT',
+                             DEFAULT_PROCESSING_TIMEOUT)
+
+# Cache (alias) keeping the state of the uploads being appended to, so the
+# database is only written every `STATE_WRITE_BACK_INTERVAL` seconds (and
+# not read) while the chunks are received. `None` disables it
+DEFAULT_STATE_CACHE = None
+STATE_CACHE = getattr(settings, 'CHUNKED_UPLOAD_STATE_CACHE',
+                      DEFAULT_STATE_CACHE)
+DEFAULT_STATE_WRITE_BACK_INTERVAL = 10
+STATE_WRITE_BACK_INTERVAL = getattr(
+    settings, 'CHUNKED_UPLOAD_STATE_WRITE_BACK_INTERVAL',
+    DEFAULT_STATE_WRITE_BACK_INTERVAL)
+
+# Path where the chunks of deduplicated uploads are stored (see
+# `ChunkedUploadDedupView`), in the storage of the uploads
+DEFAULT_CHUNK_STORE_PATH = 'chunked_uploads/chunks'
+CHUNK_STORE_PATH = getattr(settings, 'CHUNKED_UPLOAD_CHUNK_STORE_PATH',
+                           DEFAULT_CHUNK_STORE_PATH)
+
+# Metrics backend (class or dotted path, see `chunked_upload.metrics`)
+# recording the duration and size of the phases of the uploads, and the
+# options (keyword arguments) passed to it. `None` disables it
+DEFAULT_METRICS = None
+METRICS = getattr(settings, 'CHUNKED_UPLOAD_METRICS', DEFAULT_METRICS)
+METRICS_OPTIONS = getattr(settings, 'CHUNKED_UPLOAD_METRICS_OPTIONS', {})
+
+# Throttles (see `chunked_upload.throttling`) checked by the upload views, as
+# (class or dotted path, options) pairs, e.g.
+# [('chunked_upload.throttling.ByteRateThrottle', {'rate': 10 * 1024 ** 2})]
+DEFAULT_THROTTLES = []
+THROTTLES = getattr(settings, 'CHUNKED_UPLOAD_THROTTLES', DEFAULT_THROTTLES)
+
+# Cache (alias) keeping the state of the throttles
+DEFAULT_THROTTLE_CACHE = 'default'
+THROTTLE_CACHE = getattr(settings, 'CHUNKED_UPLOAD_THROTTLE_CACHE',
+                         DEFAULT_THROTTLE_CACHE)
+
+# How `ChunkedUploadView` acknowledges the chunks received: `None` (the data
+# of `get_response_data`, encoded by `ENCODER`), 'json' (the same data
+# pre-serialized, without calling `get_response_data`) or 'headers' (204 No
+# Content, with the offset and expiration in the Upload-Offset and
+# Upload-Expires headers)
+DEFAULT_ACK_MODE = None
+ACK_MODE = getattr(settings, 'CHUNKED_UPLOAD_ACK_MODE', DEFAULT_ACK_MODE)
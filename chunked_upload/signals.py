@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+# Sent when a phase of the processing of an upload is finished (see
+# `chunked_upload.metrics`). Arguments: `phase`, `duration` (in seconds),
+# `size` (bytes processed, or `None`), `upload_id` (or `None`) and `outcome`
+# ("success" or "error"). The sender is the view (or model) class
+phase_finished = Signal()
@@ -0,0 +1,238 @@
+"""
+Cache of the state of the uploads being appended to, so the chunks of an
+upload are appended without reading (and locking) its row in the database,
+which is only written every `CHUNKED_UPLOAD_STATE_WRITE_BACK_INTERVAL`
+seconds. See `get_state_cache`.
+"""
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.core.cache import caches
+
+from .constants import http_status
+from .exceptions import ChunkedUploadError
+from .settings import (STATE_CACHE, STATE_WRITE_BACK_INTERVAL,
+                       EXPIRATION_DELTA)
+
+
+class CacheLock(object):
+    """
+    Lock held by adding `key` to `cache`, which expires after `timeout`
+    seconds unless it's refreshed (see `refresh` and `keep_alive`).
+    """
+
+    def __init__(self, cache, key, timeout):
+        self.cache = cache
+        self.key = key
+        self.timeout = timeout
+        self.token = uuid.uuid4().hex
+
+    def acquire(self, wait, detail='Resource is locked'):
+        """
+        Waits for at most `wait` seconds for the lock, then raises a 409
+        `ChunkedUploadError` with `detail`.
+        """
+        deadline = time.monotonic() + wait
+        delay = 0.001
+        while not self.cache.add(self.key, self.token, self.timeout):
+            if time.monotonic() > deadline:
+                raise ChunkedUploadError(
+                    status=http_status.HTTP_409_CONFLICT, detail=detail)
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def release(self):
+        if self.is_held():
+            self.cache.delete(self.key)
+
+    def is_held(self):
+        return self.cache.get(self.key) == self.token
+
+    def refresh(self):
+        """
+        Resets the timeout of the lock, if it's still held. Returns whether
+        it is.
+        """
+        return self.is_held() and self.cache.touch(self.key, self.timeout)
+
+    def check(self, detail='Lock was lost'):
+        """
+        Refreshes the lock, or raises a 409 `ChunkedUploadError` with
+        `detail` if it expired (it may be held by another request by now).
+        """
+        if not self.refresh():
+            raise ChunkedUploadError(status=http_status.HTTP_409_CONFLICT,
+                                     detail=detail)
+
+    @contextmanager
+    def keep_alive(self):
+        """
+        Refreshes the lock in a thread (every third of its timeout) while the
+        block runs, so it doesn't expire while it's still used.
+        """
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(self.timeout / 3):
+                if not self.refresh():
+                    break
+
+        thread = threading.Thread(target=run, daemon=True,
+                                  name='chunked_upload_lock')
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+
+@contextmanager
+def cache_lock(cache, key, timeout, wait, detail='Resource is locked',
+               keep_alive=False):
+    """
+    `CacheLock` of `key` held (at most `timeout` seconds, or refreshed while
+    held with `keep_alive`) by adding `key` to `cache`, waited for at most
+    `wait` seconds (then raising a 409 `ChunkedUploadError` with `detail`).
+    """
+    lock = CacheLock(cache, key, timeout)
+    lock.acquire(wait, detail=detail)
+    try:
+        if keep_alive:
+            with lock.keep_alive():
+                yield lock
+        else:
+            yield lock
+    finally:
+        lock.release()
+
+
+class UploadStateCache(object):
+    """
+    Keeps the field values of the uploads in the cache `alias`, along with
+    the values last written to the database. Uploads are locked with an
+    atomic `cache.add()` (the cache backend must implement it atomically
+    across processes, e.g. Redis or Memcached).
+    """
+
+    key_prefix = 'chunked_upload:state:'
+    # Seconds a lock is held at most unless refreshed (it's refreshed while
+    # the request holding it runs), and waited for at most
+    lock_timeout = 60
+    lock_wait = 30
+
+    def __init__(self, alias, write_back_interval=STATE_WRITE_BACK_INTERVAL):
+        self.cache = caches[alias]
+        self.write_back_interval = write_back_interval
+        self.timeout = int(EXPIRATION_DELTA.total_seconds())
+
+    def get_key(self, upload_id):
+        return self.key_prefix + upload_id
+
+    @contextmanager
+    def lock(self, upload_id):
+        """
+        Serializes the appends to the upload `upload_id` (like the row lock
+        of the database). The lock is refreshed while it's held, and yielded
+        (see `CacheLock.check`).
+        """
+        with cache_lock(self.cache, self.get_key(upload_id) + ':lock',
+                        self.lock_timeout, self.lock_wait,
+                        detail='Upload is locked by another request',
+                        keep_alive=True) as lock:
+            yield lock
+
+    def get(self, model, upload_id):
+        """
+        Returns the instance of `model` with the cached state of the upload
+        `upload_id`, or `None` if it isn't cached.
+        """
+        entry = self.cache.get(self.get_key(upload_id))
+        if entry is None:
+            return None
+        return self.load(model, entry)
+
+    def get_many(self, model, upload_ids):
+        """
+        Returns the instances of `model` with the cached state of the uploads
+        `upload_ids` (those cached), by `upload_id`.
+        """
+        keys = {self.get_key(upload_id): upload_id for upload_id in upload_ids}
+        entries = self.cache.get_many(list(keys))
+        return {keys[key]: self.load(model, entry)
+                for key, entry in entries.items()}
+
+    def load(self, model, entry):
+        # Loaded with the values in the database, so the fields changed
+        # since they were written are saved on the next write back
+        saved = entry['saved']
+        instance = model.from_db(entry['db'], list(saved), list(saved.values()))
+        for name, value in entry['values'].items():
+            setattr(instance, name, value)
+        instance._state_saved_at = entry['saved_at']
+        return instance
+
+    def set(self, chunked_upload):
+        """
+        Caches the state of `chunked_upload`.
+        """
+        if not hasattr(chunked_upload, '_state_saved_at'):
+            chunked_upload._state_saved_at = time.time()
+        entry = {
+            'db': chunked_upload._state.db,
+            'values': chunked_upload.get_field_values(),
+            'saved': dict(chunked_upload._loaded_values),
+            'saved_at': chunked_upload._state_saved_at,
+        }
+        self.cache.set(self.get_key(chunked_upload.upload_id), entry,
+                       self.timeout)
+
+    def delete(self, upload_id):
+        self.cache.delete(self.get_key(upload_id))
+
+    def delete_many(self, upload_ids):
+        self.cache.delete_many([self.get_key(upload_id)
+                                for upload_id in upload_ids])
+
+    def needs_write_back(self, chunked_upload):
+        """
+        Whether the state of `chunked_upload` has to be written to the
+        database.
+        """
+        saved_at = getattr(chunked_upload, '_state_saved_at', None)
+        return (saved_at is None
+                or time.time() - saved_at >= self.write_back_interval
+                or chunked_upload.offset == chunked_upload.total_size)
+
+    def flush(self, model, upload_id, lock=None):
+        """
+        Writes the cached state of the upload `upload_id` (if any) to the
+        database, and removes it from the cache, under its `lock` (taken if
+        `None`).
+        """
+        if lock is None:
+            with self.lock(upload_id) as lock:
+                return self.flush(model, upload_id, lock=lock)
+        chunked_upload = self.get(model, upload_id)
+        if chunked_upload is not None:
+            lock.check(detail='Upload lock was lost')
+            chunked_upload.save()
+            self.delete(upload_id)
+
+
+_state_cache = None
+
+
+def get_state_cache():
+    """
+    Returns the `UploadStateCache` of the `CHUNKED_UPLOAD_STATE_CACHE` cache,
+    or `None` if not set.
+    """
+    global _state_cache
+    if STATE_CACHE is None:
+        return None
+    if _state_cache is None:
+        _state_cache = UploadStateCache(STATE_CACHE)
+    return _state_cache
@@ -1,2 +0,0 @@
-# Tests for chunked_upload should be created on the app where it is being used,
-# with its own views and models.
@@ -0,0 +1,91 @@
+"""
+Base test case of the tests of chunked_upload.
+"""
+import hashlib
+import os
+import shutil
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+
+from chunked_upload import state
+from chunked_upload.models import ChunkedUpload
+
+
+class UploadTestCase(TestCase):
+    """
+    Test case with a logged in client (`client`) of the user `user`.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user', password='password')
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def use_state_cache(self, **options):
+        """
+        Keeps the state of the uploads in the default cache (as with
+        `CHUNKED_UPLOAD_STATE_CACHE`), with the `UploadStateCache` `options`.
+        Returns it.
+        """
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        for patcher in (mock.patch.object(state, 'STATE_CACHE', 'default'),
+                        mock.patch.object(state, '_state_cache', None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        state_cache = state.get_state_cache()
+        for name, value in options.items():
+            setattr(state_cache, name, value)
+        return state_cache
+
+    def post_chunk(self, url, data, start, total, upload_id=None,
+                   query=False, client=None, **extra):
+        """
+        Posts the chunk `data` starting at `start` (of `total` bytes) of the
+        upload `upload_id` (a new one if `None`), sent in the query string
+        with `query`.
+        """
+        post = {'file': SimpleUploadedFile('file.bin', data)}
+        if upload_id and query:
+            url += '?upload_id=%s' % upload_id
+        elif upload_id:
+            post['upload_id'] = upload_id
+        extra.setdefault('HTTP_CONTENT_RANGE', 'bytes %i-%i/%i' % (
+            start, start + len(data) - 1, total))
+        return (client or self.client).post(url, post, **extra)
+
+    def upload(self, url, data, chunk_size, **extra):
+        """
+        Uploads `data` in chunks of `chunk_size` bytes. Returns the
+        `upload_id`.
+        """
+        upload_id = None
+        for start in range(0, len(data), chunk_size):
+            response = self.post_chunk(url, data[start:start + chunk_size],
+                                       start, len(data), upload_id, **extra)
+            self.assertEqual(response.status_code, 200, response.content)
+            upload_id = response.json()['upload_id']
+        return upload_id
+
+    def complete(self, upload_id, data, url='/complete/'):
+        return self.client.post(url, {
+            'upload_id': upload_id, 'md5': hashlib.md5(data).hexdigest()})
+
+    def get_upload(self, upload_id):
+        return ChunkedUpload.objects.get(upload_id=upload_id)
+
+    def read_file(self, chunked_upload):
+        with chunked_upload.assembler.open() as file_obj:
+            return file_obj.read()
+
+
+def random_data(size):
+    return os.urandom(size)
@@ -0,0 +1,38 @@
+"""
+Settings of the test project running the tests of chunked_upload (see
+`runtests.py`).
+"""
+import tempfile
+
+SECRET_KEY = 'chunked-upload-tests'
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'chunked_upload',
+]
+
+MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+]
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+ROOT_URLCONF = 'chunked_upload.tests.urls'
+MEDIA_ROOT = tempfile.mkdtemp(prefix='chunked_upload_tests_')
+USE_TZ = True
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
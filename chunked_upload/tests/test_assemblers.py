@@ -0,0 +1,248 @@
+import errno
+import io
+import os
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import FileSystemStorage, Storage
+
+from chunked_upload.assemblers import (CompressedFileAssembler,
+                                       S3MultipartAssembler)
+from chunked_upload.models import ChunkedUpload
+
+from .base import UploadTestCase, random_data
+
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+BUCKET = 'chunked-upload-tests'
+MiB = 1024 * 1024
+
+
+class S3Storage(Storage):
+    """
+    Minimal storage of the objects of the test bucket.
+    """
+
+    bucket_name = BUCKET
+    location = ''
+
+    def _open(self, name, mode='rb'):
+        body = boto3.client('s3').get_object(Bucket=BUCKET, Key=name)['Body']
+        return File(io.BytesIO(body.read()), name)
+
+    def exists(self, name):
+        return False
+
+    def delete(self, name):
+        boto3.client('s3').delete_object(Bucket=BUCKET, Key=name)
+
+
+class MemoryStorage(Storage):
+    """
+    Storage keeping the files in memory (without local paths).
+    """
+
+    def __init__(self):
+        self.files = {}
+
+    def _save(self, name, content):
+        self.files[name] = content.read()
+        return name
+
+    def _open(self, name, mode='rb'):
+        return File(io.BytesIO(self.files[name]), name)
+
+    def exists(self, name):
+        return name in self.files
+
+
+class LocalFileAssemblerTests(UploadTestCase):
+
+    def setUp(self):
+        super(LocalFileAssemblerTests, self).setUp()
+        self.storage = FileSystemStorage(
+            location=os.path.join(settings.MEDIA_ROOT, 'documents'))
+
+    def upload_file(self, data):
+        upload_id = self.upload('/upload/', data, 1000)
+        response = self.complete(upload_id, data)
+        self.assertEqual(response.status_code, 200, response.content)
+        return self.get_upload(upload_id)
+
+    def read(self, storage, name):
+        with storage.open(name) as file_obj:
+            return file_obj.read()
+
+    def test_finalize_to_hard_links(self):
+        data = random_data(2000)
+        chunked_upload = self.upload_file(data)
+        name = chunked_upload.finalize_to(self.storage, 'document.bin')
+        self.assertEqual(name, 'document.bin')
+        self.assertTrue(os.path.samefile(self.storage.path(name),
+                                         chunked_upload.file.path))
+        # Deleting the upload only removes its link
+        chunked_upload.delete()
+        self.assertEqual(self.read(self.storage, name), data)
+
+    def test_finalize_to_existing_name(self):
+        self.storage.save('document.bin', ContentFile(b'existing'))
+        data = random_data(2000)
+        chunked_upload = self.upload_file(data)
+        name = chunked_upload.finalize_to(self.storage, 'document.bin')
+        self.assertNotEqual(name, 'document.bin')
+        self.assertEqual(self.read(self.storage, name), data)
+        self.assertEqual(self.read(self.storage, 'document.bin'), b'existing')
+
+    def test_finalize_to_other_file_system(self):
+        data = random_data(2000)
+        chunked_upload = self.upload_file(data)
+        with mock.patch('os.link', side_effect=OSError(
+                errno.EXDEV, os.strerror(errno.EXDEV))):
+            name = chunked_upload.finalize_to(self.storage, 'document.bin')
+        # Copied
+        self.assertFalse(os.path.samefile(self.storage.path(name),
+                                          chunked_upload.file.path))
+        self.assertEqual(self.read(self.storage, name), data)
+
+    def test_finalize_to_non_local_storage(self):
+        storage = MemoryStorage()
+        data = random_data(2000)
+        chunked_upload = self.upload_file(data)
+        name = chunked_upload.finalize_to(storage, 'document.bin')
+        self.assertEqual(storage.files, {name: data})
+
+
+class S3MultipartAssemblerTests(UploadTestCase):
+    """
+    `S3MultipartAssembler` against moto's S3.
+    """
+
+    def setUp(self):
+        if mock_aws is None:
+            self.skipTest('moto is not installed')
+        super(S3MultipartAssemblerTests, self).setUp()
+        for patcher in (
+                mock.patch.dict(os.environ, {
+                    'AWS_ACCESS_KEY_ID': 'testing',
+                    'AWS_SECRET_ACCESS_KEY': 'testing',
+                    'AWS_DEFAULT_REGION': 'us-east-1'}),
+                mock_aws(),
+                mock.patch.object(ChunkedUpload, 'assembler_class',
+                                  S3MultipartAssembler),
+                mock.patch('chunked_upload.models.ASSEMBLER_OPTIONS', {}),
+                mock.patch.object(ChunkedUpload._meta.get_field('file'),
+                                  'storage', S3Storage()),
+                mock.patch.object(S3MultipartAssembler, '_clients', {})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.s3 = boto3.client('s3')
+        self.s3.create_bucket(Bucket=BUCKET)
+
+    def get_object(self, chunked_upload):
+        return self.s3.get_object(Bucket=BUCKET, Key=chunked_upload.file.name)[
+            'Body'].read()
+
+    def test_upload(self):
+        data = random_data(2 * 5 * MiB + 1000)
+        upload_id = self.upload('/upload/', data, 5 * MiB)
+        chunked_upload = self.get_upload(upload_id)
+        self.assertEqual(
+            [size for number, etag, size
+             in chunked_upload.assembler.get_state()['parts']],
+            [5 * MiB, 5 * MiB, 1000])
+        response = self.complete(upload_id, data)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.get_object(self.get_upload(upload_id)), data)
+
+    def test_small_file(self):
+        data = random_data(1000)
+        upload_id = self.upload('/upload/', data, 1000)
+        response = self.complete(upload_id, data)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.get_object(self.get_upload(upload_id)), data)
+
+    def test_finalize_to_copies_server_side(self):
+        data = random_data(1000)
+        upload_id = self.upload('/upload/', data, 1000)
+        self.complete(upload_id, data)
+        # Not saved through the storage (which can't save files)
+        name = self.get_upload(upload_id).finalize_to(S3Storage(),
+                                                      'document.bin')
+        self.assertEqual(self.s3.get_object(Bucket=BUCKET, Key=name)[
+            'Body'].read(), data)
+
+    def test_small_chunk_rejected_before_upload(self):
+        data = random_data(5 * MiB + 2000)
+        upload_id = self.post_chunk('/upload/', data[:5 * MiB], 0,
+                                    len(data)).json()['upload_id']
+        with mock.patch.object(self.s3.__class__, 'upload_part') as upload:
+            response = self.post_chunk('/upload/',
+                                       data[5 * MiB:5 * MiB + 1000],
+                                       5 * MiB, len(data), upload_id)
+        self.assertEqual(response.status_code, 400)
+        upload.assert_not_called()
+        chunked_upload = self.get_upload(upload_id)
+        self.assertEqual(chunked_upload.offset, 5 * MiB)
+        self.assertEqual(len(chunked_upload.assembler.get_state()['parts']), 1)
+        # The upload can still be finished
+        response = self.post_chunk('/upload/', data[5 * MiB:], 5 * MiB,
+                                   len(data), upload_id)
+        self.assertEqual(response.status_code, 200, response.content)
+        response = self.complete(upload_id, data)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.get_object(self.get_upload(upload_id)), data)
+
+    def test_small_first_chunk_rejected(self):
+        response = self.post_chunk('/upload/', random_data(1000), 0, 3000)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertEqual(
+            self.s3.list_multipart_uploads(Bucket=BUCKET).get('Uploads', []),
+            [])
+
+    def test_delete_aborts_multipart_upload(self):
+        data = random_data(5 * MiB + 1000)
+        upload_id = self.post_chunk('/upload/', data[:5 * MiB], 0,
+                                    len(data)).json()['upload_id']
+        self.assertEqual(len(self.s3.list_multipart_uploads(
+            Bucket=BUCKET).get('Uploads', [])), 1)
+        self.get_upload(upload_id).delete()
+        self.assertEqual(
+            self.s3.list_multipart_uploads(Bucket=BUCKET).get('Uploads', []),
+            [])
+
+
+class CompressedFileAssemblerTests(UploadTestCase):
+
+    def setUp(self):
+        super(CompressedFileAssemblerTests, self).setUp()
+        for patcher in (
+                mock.patch.object(ChunkedUpload, 'assembler_class',
+                                  CompressedFileAssembler),
+                mock.patch('chunked_upload.models.ASSEMBLER_OPTIONS', {})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_upload(self):
+        data = b'chunked upload ' * 200
+        upload_id = self.upload('/upload/', data, 1000)
+        chunked_upload = self.get_upload(upload_id)
+        self.assertLess(os.path.getsize(chunked_upload.file.path), len(data))
+        self.assertEqual(self.read_file(chunked_upload), data)
+        response = self.complete(upload_id, data)
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_out_of_order_rejected(self):
+        data = random_data(2000)
+        for start in (1000, 0):
+            response = self.post_chunk('/unordered/',
+                                       data[start:start + 1000], start, 2000)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['detail'],
+                             'Out of order chunks are not supported')
+        self.assertFalse(ChunkedUpload.objects.exists())
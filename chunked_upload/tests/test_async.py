@@ -0,0 +1,65 @@
+import hashlib
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TransactionTestCase
+
+from chunked_upload.constants import COMPLETE
+from chunked_upload.models import ChunkedUpload
+
+from .base import random_data
+
+
+class AsyncViewsTests(TransactionTestCase):
+    """
+    The async views run the blocking work in the thread pool, whose threads
+    have their own database connections (so the data must be committed).
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user', password='password')
+        self.async_client.force_login(self.user)
+
+    def post(self, url, data, **extra):
+        return async_to_sync(self.async_client.post)(url, data, **extra)
+
+    def test_upload(self):
+        data = random_data(3000)
+        upload_id = None
+        for start in (0, 1000, 2000):
+            post = {'file': SimpleUploadedFile('file.bin',
+                                               data[start:start + 1000])}
+            if upload_id:
+                post['upload_id'] = upload_id
+            response = self.post('/async/', post, headers={
+                'Content-Range': 'bytes %i-%i/3000' % (start, start + 999)})
+            self.assertEqual(response.status_code, 200, response.content)
+            upload_id = response.json()['upload_id']
+        self.assertEqual(response.json()['offset'], 3000)
+        response = self.post('/async/complete/', {
+            'upload_id': upload_id, 'md5': hashlib.md5(data).hexdigest()})
+        self.assertEqual(response.status_code, 200, response.content)
+        chunked_upload = ChunkedUpload.objects.get(upload_id=upload_id)
+        self.assertEqual(chunked_upload.status, COMPLETE)
+        with chunked_upload.assembler.open() as file_obj:
+            self.assertEqual(file_obj.read(), data)
+
+    def test_state(self):
+        response = self.post('/async/', {
+            'file': SimpleUploadedFile('file.bin', random_data(1000))},
+            headers={'Content-Range': 'bytes 0-999/3000'})
+        upload_id = response.json()['upload_id']
+        response = async_to_sync(self.async_client.get)('/async/')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([upload['upload_id']
+                          for upload in response.json()['uploads']],
+                         [upload_id])
+
+    def test_error(self):
+        response = self.post('/async/', {
+            'file': SimpleUploadedFile('file.bin', random_data(1000)),
+            'upload_id': 'missing'},
+            headers={'Content-Range': 'bytes 0-999/3000'})
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,84 @@
+import json
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from .base import UploadTestCase, random_data
+
+
+class BatchTests(UploadTestCase):
+
+    def post_batch(self, chunks, url='/batch/'):
+        """
+        Posts the `chunks` (tuples of their upload_id, data, start and
+        total) with a single request. Returns the result of each chunk.
+        """
+        listed, post = [], {}
+        for index, (upload_id, data, start, total) in enumerate(chunks):
+            name = 'c%i' % index
+            listed.append({'file': name, 'upload_id': upload_id,
+                           'content_range': 'bytes %i-%i/%i' % (
+                               start, start + len(data) - 1, total)})
+            post[name] = SimpleUploadedFile('file.bin', data)
+        post['chunks'] = json.dumps(listed)
+        response = self.client.post(url, post)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['chunks']
+
+    def start_upload(self, data, size):
+        result, = self.post_batch([(None, data[:size], 0, len(data))])
+        self.assertEqual(result['status'], 200, result)
+        return result['upload_id']
+
+    def test_chunks_in_order(self):
+        data = random_data(4000)
+        upload_id = self.start_upload(data, 1000)
+        # Appended in order of their range
+        results = self.post_batch([
+            (upload_id, data[start:start + 1000], start, 4000)
+            for start in (3000, 1000, 2000)])
+        self.assertEqual([result['status'] for result in results], [200] * 3)
+        self.assertEqual([result['offset'] for result in results], [4000] * 3)
+        response = self.complete(upload_id, data)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.read_file(self.get_upload(upload_id)), data)
+
+    def test_several_uploads(self):
+        first, second = random_data(2000), random_data(3000)
+        first_id = self.start_upload(first, 1000)
+        second_id = self.start_upload(second, 1000)
+        results = self.post_batch([
+            (second_id, second[1000:2000], 1000, 3000),
+            (first_id, first[1000:], 1000, 2000),
+            (second_id, second[2000:], 2000, 3000)])
+        self.assertEqual(
+            [(result['upload_id'], result['offset']) for result in results],
+            [(second_id, 3000), (first_id, 2000), (second_id, 3000)])
+        for upload_id, data in ((first_id, first), (second_id, second)):
+            self.assertEqual(self.read_file(self.get_upload(upload_id)), data)
+
+    def test_new_uploads(self):
+        first, second = random_data(1000), random_data(2000)
+        results = self.post_batch([(None, first, 0, 1000),
+                                   (None, second[:1000], 0, 2000)])
+        self.assertEqual([result['status'] for result in results], [200] * 2)
+        first_id, second_id = [result['upload_id'] for result in results]
+        self.assertNotEqual(first_id, second_id)
+        self.assertEqual(self.read_file(self.get_upload(first_id)), first)
+        self.assertEqual(self.get_upload(second_id).offset, 1000)
+
+    def test_errors(self):
+        data = random_data(3000)
+        upload_id = self.start_upload(data, 1000)
+        results = self.post_batch([
+            (upload_id, data[1000:2000], 1000, 3000),
+            ('unknown', data[:1000], 0, 3000),
+            # Already appended by the first chunk
+            (upload_id, data[1500:2000], 1500, 3000),
+            (upload_id, data[2000:], 2000, 3000)])
+        self.assertEqual([result['status'] for result in results],
+                         [200, 404, 400, 200])
+        self.assertEqual(results[1]['detail'], 'Upload not found')
+        self.assertEqual(results[2]['detail'], 'Offsets do not match')
+        self.assertEqual(results[2]['offset'], 2000)
+        # The other chunks are still appended
+        self.assertEqual(self.read_file(self.get_upload(upload_id)), data)
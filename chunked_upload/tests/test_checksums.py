@@ -0,0 +1,144 @@
+import hashlib
+import os
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from chunked_upload.constants import COMPLETE
+from chunked_upload.models import ChunkedUpload
+
+from .base import UploadTestCase, random_data
+
+
+def digest(data):
+    return hashlib.md5(data).hexdigest()
+
+
+def composite_checksum(chunks):
+    hasher = hashlib.md5()
+    for chunk in chunks:
+        hasher.update(hashlib.md5(chunk).digest())
+    return '%s-%i' % (hasher.hexdigest(), len(chunks))
+
+
+class ChecksumTestCase(UploadTestCase):
+
+    def post_checked_chunk(self, data, start, total, upload_id=None,
+                           checksum=None, url='/upload/'):
+        """
+        Posts the chunk `data` with its `checksum` (its md5 if `None`).
+        """
+        post = {'file': SimpleUploadedFile('file.bin', data),
+                'checksum': checksum or digest(data)}
+        if upload_id:
+            post['upload_id'] = upload_id
+        return self.client.post(url, post, HTTP_CONTENT_RANGE='bytes %i-%i/%i'
+                                % (start, start + len(data) - 1, total))
+
+    def upload_checked(self, chunks, url='/upload/'):
+        upload_id, start, total = None, 0, sum(map(len, chunks))
+        for chunk in chunks:
+            response = self.post_checked_chunk(chunk, start, total,
+                                               upload_id, url=url)
+            self.assertEqual(response.status_code, 200, response.content)
+            upload_id = response.json()['upload_id']
+            start += len(chunk)
+        return upload_id
+
+
+class ChunkChecksumTests(ChecksumTestCase):
+
+    def test_chunks_verified(self):
+        data = random_data(3000)
+        upload_id = self.upload_checked([data[:1000], data[1000:]])
+        chunked_upload = self.get_upload(upload_id)
+        self.assertEqual(chunked_upload.get_chunk_checksums(), [
+            [0, 1000, digest(data[:1000])],
+            [1000, 2000, digest(data[1000:])]])
+
+    def test_mismatch_discards_chunk(self):
+        data = random_data(3000)
+        upload_id = self.upload_checked([data[:1000]])
+        path = self.get_upload(upload_id).file.path
+        response = self.post_checked_chunk(data[1000:2000], 1000, 3000,
+                                           upload_id, checksum='0' * 32)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {
+            'detail': 'Chunk checksum does not match', 'offset': 1000})
+        chunked_upload = self.get_upload(upload_id)
+        self.assertEqual(chunked_upload.offset, 1000)
+        self.assertEqual(os.path.getsize(path), 1000)
+        # Sent again
+        for start in (1000, 2000):
+            response = self.post_checked_chunk(data[start:start + 1000],
+                                               start, 3000, upload_id)
+            self.assertEqual(response.status_code, 200, response.content)
+        response = self.complete(upload_id, data)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.read_file(self.get_upload(upload_id)), data)
+
+    def test_mismatch_of_first_chunk(self):
+        response = self.post_checked_chunk(random_data(1000), 0, 2000,
+                                           checksum='0' * 32)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_out_of_order_mismatch(self):
+        data = random_data(2000)
+        response = self.post_checked_chunk(data[1000:], 1000, 2000,
+                                           url='/unordered/')
+        upload_id = response.json()['upload_id']
+        response = self.post_checked_chunk(data[:1000], 0, 2000, upload_id,
+                                           checksum='0' * 32,
+                                           url='/unordered/')
+        self.assertEqual(response.status_code, 400)
+        # Not registered
+        self.assertEqual(self.get_upload(upload_id).get_received_ranges(),
+                         [[1000, 2000]])
+
+
+class CompositeChecksumTests(ChecksumTestCase):
+
+    def complete_with_checksum(self, upload_id, checksum, url='/complete/'):
+        return self.client.post(url, {'upload_id': upload_id,
+                                      'checksum': checksum})
+
+    def test_complete(self):
+        chunks = [random_data(1000), random_data(1000), random_data(500)]
+        upload_id = self.upload_checked(chunks)
+        checksum = composite_checksum(chunks)
+        self.assertEqual(self.get_upload(upload_id).composite_checksum,
+                         checksum)
+        response = self.complete_with_checksum(upload_id, checksum)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.get_upload(upload_id).status, COMPLETE)
+
+    def test_complete_in_background(self):
+        chunks = [random_data(1000), random_data(500)]
+        upload_id = self.upload_checked(chunks)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.complete_with_checksum(
+                upload_id, composite_checksum(chunks),
+                url='/complete/background/')
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(self.get_upload(upload_id).status, COMPLETE)
+
+    def test_mismatch(self):
+        chunks = [random_data(1000), random_data(500)]
+        upload_id = self.upload_checked(chunks)
+        # Chunks in another order
+        response = self.complete_with_checksum(
+            upload_id, composite_checksum(chunks[::-1]))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['detail'], 'checksum does not match')
+        self.assertNotEqual(self.get_upload(upload_id).status, COMPLETE)
+
+    def test_unverified_chunk(self):
+        data = random_data(2000)
+        upload_id = self.upload_checked([data[:1000]])
+        response = self.post_chunk('/upload/', data[1000:], 1000, 2000,
+                                   upload_id)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertIsNone(self.get_upload(upload_id).composite_checksum)
+        response = self.complete_with_checksum(
+            upload_id, composite_checksum([data[:1000], data[1000:]]))
+        self.assertEqual(response.status_code, 400)
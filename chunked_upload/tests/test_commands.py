@@ -0,0 +1,141 @@
+import datetime
+import os
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+
+from chunked_upload.constants import PROCESSING
+from chunked_upload.models import ChunkedUpload
+
+from .base import UploadTestCase, random_data
+
+
+class DeleteExpiredUploadsTests(UploadTestCase):
+
+    def expire(self, upload_id, **fields):
+        ChunkedUpload.objects.filter(upload_id=upload_id).update(
+            expires_on=timezone.now() - datetime.timedelta(seconds=1),
+            **fields)
+
+    def delete_expired_uploads(self, *args):
+        out = StringIO()
+        call_command('delete_expired_uploads', *args, stdout=out)
+        return out.getvalue()
+
+    def test_delete(self):
+        data = random_data(1000)
+        expired_id = self.upload('/upload/', data, 1000)
+        kept_id = self.upload('/upload/', data, 1000)
+        self.expire(expired_id)
+        path = self.get_upload(expired_id).file.path
+
+        out = self.delete_expired_uploads('--dry-run')
+        self.assertIn('1 incomplete uploads would be deleted', out)
+        self.assertTrue(os.path.exists(path))
+
+        out = self.delete_expired_uploads('--batch-size', '1')
+        self.assertIn('1 incomplete uploads were deleted', out)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(ChunkedUpload.objects.filter(
+            upload_id=expired_id).exists())
+        self.get_upload(kept_id)
+
+    def test_processing_kept(self):
+        upload_id = self.upload('/upload/', random_data(1000), 1000)
+        stale_id = self.upload('/upload/', random_data(1000), 1000)
+        self.expire(upload_id, status=PROCESSING,
+                    processing_on=timezone.now())
+        self.expire(stale_id, status=PROCESSING,
+                    processing_on=timezone.now() - datetime.timedelta(days=1))
+        out = self.delete_expired_uploads()
+        self.assertIn('1 incomplete uploads were deleted', out)
+        self.assertEqual(self.get_upload(upload_id).status, PROCESSING)
+        self.assertFalse(ChunkedUpload.objects.filter(
+            upload_id=stale_id).exists())
+
+    def test_cached_state_deleted(self):
+        state_cache = self.use_state_cache(write_back_interval=3600)
+        data = random_data(3000)
+        response = self.post_chunk('/upload/', data[:1000], 0, 3000)
+        upload_id = response.json()['upload_id']
+        self.post_chunk('/upload/', data[1000:2000], 1000, 3000, upload_id)
+        self.assertIsNotNone(state_cache.get(ChunkedUpload, upload_id))
+        self.expire(upload_id)
+
+        self.delete_expired_uploads()
+        self.assertIsNone(state_cache.get(ChunkedUpload, upload_id))
+        # Not inserted again by a write back
+        state_cache.flush(ChunkedUpload, upload_id)
+        self.assertFalse(ChunkedUpload.objects.filter(
+            upload_id=upload_id).exists())
+
+
+class ReconcileTests(UploadTestCase):
+
+    def reconcile(self, *args):
+        out = StringIO()
+        call_command('reconcile_chunked_uploads', '--min-age', '0',
+                     '--verbosity', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def create_file(self, name, size=100):
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file_obj:
+            file_obj.write(b'x' * size)
+        return path
+
+    def test_orphans(self):
+        upload_id = self.upload('/upload/', random_data(1000), 1000)
+        path = self.get_upload(upload_id).file.path
+        # Named after an upload, but not its file
+        orphan = self.create_file('chunked_uploads/%s_1.part' % upload_id)
+        other = self.create_file('chunked_uploads/other.txt')
+        # File of an upload named otherwise (e.g. by CHUNKED_UPLOAD_TO)
+        renamed_id = self.upload('/upload/', random_data(500), 500)
+        renamed = os.path.join(settings.MEDIA_ROOT,
+                               'chunked_uploads/renamed.part')
+        os.rename(self.get_upload(renamed_id).file.path, renamed)
+        ChunkedUpload.objects.filter(upload_id=renamed_id).update(
+            file='chunked_uploads/renamed.part')
+
+        out = self.reconcile()
+        self.assertIn('%s\n' % orphan, out)
+        self.assertIn('2 files (1500 bytes) of uploads.', out)
+        self.assertIn('1 orphaned files (100 bytes) found.', out)
+        self.assertIn('0 recent files and 1 other files skipped.', out)
+        self.assertTrue(os.path.exists(orphan))
+
+        out = self.reconcile('--delete', '--batch-size', '1')
+        self.assertIn('1 orphaned files (100 bytes) were deleted.', out)
+        self.assertFalse(os.path.exists(orphan))
+        for kept in (path, other, renamed):
+            self.assertTrue(os.path.exists(kept), kept)
+
+    def test_recent_files_skipped(self):
+        self.create_file('chunked_uploads/orphan.part')
+        out = StringIO()
+        call_command('reconcile_chunked_uploads', '--delete', stdout=out)
+        self.assertIn('1 recent files and 0 other files skipped.',
+                      out.getvalue())
+
+    def test_whole_storage_refused(self):
+        self.create_file('other_app.part')
+        module = 'chunked_upload.management.commands.reconcile_chunked_uploads'
+        with mock.patch(module + '.UPLOAD_PATH', '%Y/%m/%d'):
+            with self.assertRaises(CommandError):
+                self.reconcile('--delete')
+        with self.assertRaises(CommandError):
+            self.reconcile('--delete', '--path', '')
+        self.assertTrue(os.path.exists(
+            os.path.join(settings.MEDIA_ROOT, 'other_app.part')))
+
+    def test_usage(self):
+        self.upload('/upload/', random_data(1000), 1000)
+        out = self.reconcile('--usage', '--skip-scan')
+        self.assertIn('Uploading   %-11s       1              1000'
+                      % self.user.pk, out)
+        self.assertIn('1 uploads (1000 bytes).', out)
@@ -0,0 +1,142 @@
+import datetime
+import hashlib
+import threading
+from unittest import mock
+
+from django.utils import timezone
+
+from chunked_upload.completion import (ThreadPoolCompletionExecutor,
+                                       complete_upload)
+from chunked_upload.constants import COMPLETE, PROCESSING, UPLOADING
+from chunked_upload.models import ChunkedUpload
+
+from .base import UploadTestCase, random_data
+from .views import completed
+
+VIEW_PATH = 'chunked_upload.tests.views.BackgroundCompleteView'
+
+
+class BackgroundCompletionTests(UploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        del completed[:]
+
+    def complete_in_background(self, upload_id, md5):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/complete/background/', {
+                'upload_id': upload_id, 'md5': md5})
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(response.json()['status'], 'processing')
+        return self.client.get('/status/%s/' % upload_id).json()
+
+    def test_complete(self):
+        data = random_data(2000)
+        upload_id = self.upload('/upload/', data, 1000)
+        status = self.complete_in_background(
+            upload_id, hashlib.md5(data).hexdigest())
+        self.assertEqual(status['status'], 'complete')
+        self.assertEqual(status['result'], {'size': 2000})
+        self.assertEqual(completed, [upload_id])
+        self.assertEqual(self.get_upload(upload_id).status, COMPLETE)
+
+    def test_verification_failure_is_retryable(self):
+        data = random_data(2000)
+        upload_id = self.upload('/upload/', data, 1000)
+        status = self.complete_in_background(upload_id, '0' * 32)
+        self.assertEqual(status['status'], 'uploading')
+        self.assertIn('detail', status)
+        self.assertEqual(self.get_upload(upload_id).status, UPLOADING)
+        self.assertEqual(completed, [])
+
+        status = self.complete_in_background(
+            upload_id, hashlib.md5(data).hexdigest())
+        self.assertEqual(status['status'], 'complete')
+        self.assertNotIn('detail', status)
+        self.assertEqual(completed, [upload_id])
+
+    def test_completed_once(self):
+        data = random_data(1000)
+        upload_id = self.upload('/upload/', data, 1000)
+        chunked_upload = self.get_upload(upload_id)
+        chunked_upload.status = PROCESSING
+        chunked_upload.save()
+        md5 = hashlib.md5(data).hexdigest()
+        # E.g. a task delivered twice
+        complete_upload(VIEW_PATH, upload_id, md5)
+        complete_upload(VIEW_PATH, upload_id, md5)
+        self.assertEqual(completed, [upload_id])
+        self.assertEqual(self.get_upload(upload_id).status, COMPLETE)
+
+    def test_not_processing(self):
+        data = random_data(1000)
+        upload_id = self.upload('/upload/', data, 1000)
+        complete_upload(VIEW_PATH, upload_id, hashlib.md5(data).hexdigest())
+        self.assertEqual(completed, [])
+        self.assertEqual(self.get_upload(upload_id).status, UPLOADING)
+        complete_upload(VIEW_PATH, 'missing', None)
+
+    def test_completed_once_in_background(self):
+        data = random_data(1000)
+        upload_id = self.upload('/upload/', data, 1000)
+        md5 = hashlib.md5(data).hexdigest()
+        self.assertEqual(self.complete_in_background(upload_id, md5)['status'],
+                         'complete')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/complete/background/', {
+                'upload_id': upload_id, 'md5': md5})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get_upload(upload_id).status, COMPLETE)
+        self.assertEqual(completed, [upload_id])
+
+    def test_stale_processing(self):
+        data = random_data(1000)
+        upload_id = self.upload('/upload/', data, 1000)
+        md5 = hashlib.md5(data).hexdigest()
+        ChunkedUpload.objects.filter(upload_id=upload_id).update(
+            status=PROCESSING, processing_on=timezone.now())
+        response = self.client.post('/complete/background/', {
+            'upload_id': upload_id, 'md5': md5})
+        self.assertEqual(response.status_code, 400)
+
+        # The job was lost
+        ChunkedUpload.objects.filter(upload_id=upload_id).update(
+            processing_on=timezone.now() - datetime.timedelta(hours=2))
+        status = self.complete_in_background(upload_id, md5)
+        self.assertEqual(status['status'], 'complete')
+        self.assertEqual(completed, [upload_id])
+
+    def test_failure_logged(self):
+        executor = ThreadPoolCompletionExecutor(max_workers=1)
+        self.addCleanup(executor.executor.shutdown)
+        done = threading.Event()
+
+        def fail(*args):
+            done.set()
+            raise RuntimeError('Database is unavailable')
+
+        with self.assertLogs('chunked_upload.completion', 'ERROR') as logs, \
+                mock.patch('chunked_upload.completion.complete_upload', fail):
+            executor.submit(VIEW_PATH, 'upload', None, None)
+            executor.executor.shutdown(wait=True)
+        self.assertTrue(done.is_set())
+        self.assertIn('Completion of upload upload failed', logs.output[0])
+        self.assertIn('Database is unavailable', logs.output[0])
+
+
+class CompletionTests(UploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        del completed[:]
+
+    def test_completed_once(self):
+        data = random_data(1000)
+        upload_id = self.upload('/upload/', data, 1000)
+        response = self.complete(upload_id, data)
+        self.assertEqual(response.status_code, 200, response.content)
+        response = self.complete(upload_id, data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['detail'],
+                         'Upload has already been marked as complete')
+        self.assertEqual(completed, [upload_id])
@@ -0,0 +1,85 @@
+import hashlib
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client
+
+from chunked_upload.models import StoredChunk
+
+from .base import UploadTestCase, random_data
+
+
+class DedupTests(UploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.chunks = [random_data(1000), random_data(500)]
+        self.data = b''.join(self.chunks)
+        self.digests = [hashlib.sha256(chunk).hexdigest()
+                        for chunk in self.chunks]
+        other = get_user_model().objects.create_user('other',
+                                                     password='password')
+        self.other_client = Client()
+        self.other_client.force_login(other)
+
+    def send_manifest(self, client=None):
+        manifest = [[digest, len(chunk)]
+                    for digest, chunk in zip(self.digests, self.chunks)]
+        response = (client or self.client).post('/dedup/', {
+            'chunks': json.dumps(manifest), 'filename': 'file.bin'})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def send_chunk(self, upload_id, index, data=None, client=None):
+        return (client or self.client).post('/dedup/', {
+            'upload_id': upload_id, 'digest': self.digests[index],
+            'file': SimpleUploadedFile('file.bin',
+                                       data or self.chunks[index])})
+
+    def upload(self, client=None):
+        data = self.send_manifest(client)
+        for digest in data['missing']:
+            response = self.send_chunk(data['upload_id'],
+                                       self.digests.index(digest),
+                                       client=client)
+            self.assertEqual(response.status_code, 200, response.content)
+        return data['upload_id']
+
+    def test_upload(self):
+        upload_id = self.upload()
+        response = self.complete(upload_id, self.data)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.read_file(self.get_upload(upload_id)),
+                         self.data)
+
+    def test_chunks_of_user_not_sent_again(self):
+        self.upload()
+        data = self.send_manifest()
+        self.assertEqual(data['missing'], [])
+        response = self.complete(data['upload_id'], self.data)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(StoredChunk.objects.get(
+            digest=self.digests[0]).ref_count, 2)
+
+    def test_chunks_of_other_user_sent(self):
+        self.upload()
+        # Knowing the digests doesn't give access to the data
+        data = self.send_manifest(self.other_client)
+        self.assertEqual(data['missing'], self.digests)
+        upload_id = data['upload_id']
+        response = self.send_chunk(upload_id, 0, data=random_data(1000),
+                                   client=self.other_client)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(StoredChunk.objects.get(
+            digest=self.digests[0]).ref_count, 1)
+
+        for index in range(2):
+            response = self.send_chunk(upload_id, index,
+                                       client=self.other_client)
+            self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['missing'], [])
+        # Still stored once
+        self.assertEqual(StoredChunk.objects.count(), 2)
+        self.assertEqual(StoredChunk.objects.get(
+            digest=self.digests[0]).ref_count, 2)
@@ -0,0 +1,97 @@
+import os
+
+from chunked_upload.models import ChunkedUpload
+
+from .base import UploadTestCase, random_data
+
+
+class DownloadTests(UploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.data = random_data(3000)
+
+    def upload_complete(self):
+        upload_id = self.upload('/upload/', self.data, 1000)
+        response = self.complete(upload_id, self.data)
+        self.assertEqual(response.status_code, 200, response.content)
+        return upload_id
+
+    def download(self, upload_id, byte_range=None, url='/download/%s/'):
+        extra = {}
+        if byte_range is not None:
+            extra['HTTP_RANGE'] = byte_range
+        return self.client.get(url % upload_id, **extra)
+
+    def test_download(self):
+        response = self.download(self.upload_complete())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Length'], '3000')
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+
+    def test_range(self):
+        upload_id = self.upload_complete()
+        for byte_range, start, end in (('bytes=100-199', 100, 199),
+                                       ('bytes=2500-', 2500, 2999),
+                                       ('bytes=2500-9999', 2500, 2999),
+                                       ('bytes=-500', 2500, 2999),
+                                       ('bytes=-5000', 0, 2999)):
+            response = self.download(upload_id, byte_range)
+            self.assertEqual(response.status_code, 206, byte_range)
+            self.assertEqual(response['Content-Range'],
+                             'bytes %i-%i/3000' % (start, end))
+            self.assertEqual(response['Content-Length'],
+                             str(end - start + 1))
+            self.assertEqual(b''.join(response.streaming_content),
+                             self.data[start:end + 1])
+
+    def test_range_not_satisfiable(self):
+        upload_id = self.upload_complete()
+        response = self.download(upload_id, 'bytes=3000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */3000')
+
+    def test_invalid_range_ignored(self):
+        upload_id = self.upload_complete()
+        for byte_range in ('bytes=200-100', 'bytes=0-1,5-6', 'items=0-1'):
+            response = self.download(upload_id, byte_range)
+            self.assertEqual(response.status_code, 200, byte_range)
+            self.assertEqual(b''.join(response.streaming_content), self.data)
+
+    def test_offload(self):
+        upload_id = self.upload_complete()
+        chunked_upload = self.get_upload(upload_id)
+        name = os.path.join(os.path.dirname(chunked_upload.file.name),
+                            'my file #1.part')
+        os.rename(chunked_upload.file.path,
+                  chunked_upload.file.storage.path(name))
+        ChunkedUpload.objects.filter(upload_id=upload_id).update(file=name)
+        response = self.download(upload_id, url='/download/offload/%s/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected/%s/my%%20file%%20%%231.part'
+                         % os.path.dirname(name))
+
+    def test_incomplete(self):
+        upload_id = self.upload('/upload/', self.data, 1000)
+        self.assertEqual(self.download(upload_id).status_code, 400)
+
+    def test_partial(self):
+        response = self.post_chunk('/upload/', self.data[:1000], 0, 3000)
+        upload_id = response.json()['upload_id']
+        url = '/download/partial/%s/'
+        response = self.download(upload_id, url=url)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 0-999/3000')
+        self.assertEqual(response['Cache-Control'], 'no-store')
+        self.assertEqual(b''.join(response.streaming_content),
+                         self.data[:1000])
+
+        response = self.download(upload_id, 'bytes=500-1999', url=url)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 500-999/3000')
+        # Not received yet
+        response = self.download(upload_id, 'bytes=1000-', url=url)
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */3000')
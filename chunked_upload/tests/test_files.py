@@ -0,0 +1,196 @@
+import errno
+import hashlib
+import os
+import tempfile
+from unittest import mock
+
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.test import override_settings
+
+from chunked_upload import files
+from chunked_upload.models import ChunkedUpload
+from chunked_upload.views import ChunkedUploadView
+
+from .base import UploadTestCase, random_data
+
+
+class PreallocationTests(UploadTestCase):
+
+    def temporary_file(self):
+        file_obj = tempfile.TemporaryFile()
+        self.addCleanup(file_obj.close)
+        file_obj.write(b'x' * 100)
+        return file_obj
+
+    def test_preallocate(self):
+        file_obj = self.temporary_file()
+        files.preallocate(file_obj, 1000)
+        self.assertEqual(os.fstat(file_obj.fileno()).st_size, 1000)
+
+    def test_preallocate_keep_size(self):
+        file_obj = self.temporary_file()
+        files.preallocate(file_obj, 1000, keep_size=True)
+        self.assertEqual(os.fstat(file_obj.fileno()).st_size, 100)
+
+    def test_preallocated_upload(self):
+        data = random_data(3000)
+        with mock.patch.object(ChunkedUpload, 'preallocate',
+                               autospec=True,
+                               side_effect=ChunkedUpload.preallocate) as spy:
+            upload_id = self.upload('/preallocated/', data, 1000)
+        chunked_upload = self.get_upload(upload_id)
+        spy.assert_called_once_with(mock.ANY, 3000, keep_size=True)
+        # Chunks are still appended at the end of the file
+        self.assertEqual(os.path.getsize(chunked_upload.file.path), 3000)
+        response = self.complete(upload_id, data)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.read_file(self.get_upload(upload_id)), data)
+
+    def test_large_upload_not_preallocated(self):
+        data = random_data(3000)
+        with mock.patch.object(ChunkedUploadView, 'max_preallocate', 2000), \
+                mock.patch.object(ChunkedUpload, 'preallocate') as spy:
+            self.upload('/preallocated/', data, 1000)
+            self.post_chunk('/unordered/', data[1000:2000], 1000, 3000)
+        spy.assert_not_called()
+
+    def test_no_space(self):
+        paths = []
+
+        def preallocate(chunked_upload, size, keep_size=False):
+            paths.append(chunked_upload.file.path)
+            self.assertTrue(os.path.exists(paths[-1]))
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+
+        data = random_data(3000)
+        with mock.patch.object(ChunkedUpload, 'preallocate', autospec=True,
+                               side_effect=preallocate):
+            for response in [
+                    self.post_chunk('/preallocated/', data[:1000], 0, 3000),
+                    self.post_chunk('/unordered/', data[1000:2000], 1000,
+                                    3000)]:
+                self.assertEqual(response.status_code, 507, response.content)
+        self.assertEqual(len(paths), 2)
+        # The files aren't left behind
+        for path in paths:
+            self.assertFalse(os.path.exists(path))
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_data_of_failed_write_discarded(self):
+        data = random_data(2000)
+        response = self.post_chunk('/preallocated/', data[:1000], 0, 2000)
+        upload_id = response.json()['upload_id']
+        path = self.get_upload(upload_id).file.path
+        # Left by a failed write
+        with open(path, 'ab') as file_obj:
+            file_obj.write(b'x' * 1500)
+        response = self.post_chunk('/preallocated/', data[1000:1500], 1000,
+                                   2000, upload_id)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(os.path.getsize(path), 1500)
+
+
+class WriteChunkTests(UploadTestCase):
+
+    def temporary_uploaded_file(self, data):
+        chunk = TemporaryUploadedFile('file.bin', 'application/octet-stream',
+                                      len(data), None)
+        self.addCleanup(chunk.close)
+        chunk.write(data)
+        chunk.flush()
+        return chunk
+
+    def spy_kernel_copy(self):
+        """
+        Records the number of bytes copied by each `kernel_copy` call.
+        """
+        copied = []
+        kernel_copy = files.kernel_copy
+
+        def spy(src, dst):
+            copied.append(kernel_copy(src, dst))
+            return copied[-1]
+
+        patcher = mock.patch.object(files, 'kernel_copy', spy)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return copied
+
+    def write_chunk(self, data):
+        """
+        Writes `data` from a temporary uploaded file after 100 bytes of a
+        file, with an md5 hasher. Returns the content of the file and the
+        digest.
+        """
+        file_obj = tempfile.TemporaryFile()
+        self.addCleanup(file_obj.close)
+        file_obj.write(b'x' * 100)
+        md5_hasher = hashlib.md5()
+        written = files.write_chunk(self.temporary_uploaded_file(data),
+                                    file_obj, hashers=[md5_hasher],
+                                    buffer_size=256)
+        self.assertEqual(written, len(data))
+        file_obj.seek(0)
+        return file_obj.read(), md5_hasher.hexdigest()
+
+    def test_kernel_copy(self):
+        data = random_data(1000)
+        copied = self.spy_kernel_copy()
+        content, digest = self.write_chunk(data)
+        self.assertEqual(copied, [1000])
+        self.assertEqual(content, b'x' * 100 + data)
+        self.assertEqual(digest, hashlib.md5(data).hexdigest())
+
+    def test_partial_kernel_copy(self):
+        def copy(src_fd, dst_fd, src_offset, dst_offset, count):
+            if src_offset:
+                return 0  # The rest is written from user space
+            return files._sendfile(src_fd, dst_fd, src_offset, dst_offset,
+                                   min(count, 300))
+
+        data = random_data(1000)
+        with mock.patch.object(files, '_kernel_copy_methods',
+                               return_value=[copy]):
+            content, digest = self.write_chunk(data)
+        self.assertEqual(content, b'x' * 100 + data)
+        self.assertEqual(digest, hashlib.md5(data).hexdigest())
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=0)
+    def test_upload_of_temporary_files(self):
+        # Chunks are spooled to temporary files
+        data = random_data(3000)
+        copied = self.spy_kernel_copy()
+        upload_id = self.upload('/upload/', data, 1000)
+        self.assertEqual(copied, [1000] * 3)
+        # The md5 is checked
+        response = self.complete(upload_id, data)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.read_file(self.get_upload(upload_id)), data)
+
+
+class ChunkWrittenTests(UploadTestCase):
+
+    def test_fsync(self):
+        file_obj = tempfile.TemporaryFile()
+        self.addCleanup(file_obj.close)
+        file_obj.write(b'x' * 100)
+        with mock.patch.object(files, 'FSYNC', 'chunk'), \
+                mock.patch.object(files, 'sync_file') as sync_file:
+            files.chunk_written(file_obj, 0)
+        sync_file.assert_called_once_with(file_obj)
+        with mock.patch.object(files, 'sync_file') as sync_file:
+            files.chunk_written(file_obj, 0)
+        sync_file.assert_not_called()
+
+    def test_drop_cache(self):
+        if not hasattr(os, 'posix_fadvise'):
+            self.skipTest('posix_fadvise is not available')
+        file_obj = tempfile.TemporaryFile()
+        self.addCleanup(file_obj.close)
+        file_obj.seek(10)
+        file_obj.write(b'x' * 100)
+        with mock.patch.object(files, 'DROP_CACHE', True), \
+                mock.patch('os.posix_fadvise') as fadvise:
+            files.chunk_written(file_obj, 10)
+        fadvise.assert_called_once_with(file_obj.fileno(), 10, 100,
+                                        os.POSIX_FADV_DONTNEED)
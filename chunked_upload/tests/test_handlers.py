@@ -0,0 +1,66 @@
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from chunked_upload.handlers import WrittenChunk
+from chunked_upload.models import AbstractChunkedUpload
+from chunked_upload.views import ChunkedUploadView
+
+from .base import UploadTestCase, random_data
+
+
+class ChunkedUploadHandlerTests(UploadTestCase):
+
+    def test_chunks_written_into_file(self):
+        data = random_data(3000)
+        response = self.post_chunk('/direct/', data[:1000], 0, 3000)
+        upload_id = response.json()['upload_id']
+        with mock.patch.object(AbstractChunkedUpload, 'append_chunk',
+                               side_effect=AssertionError('Copied')):
+            for start in (1000, 2000):
+                response = self.post_chunk(
+                    '/direct/', data[start:start + 1000], start, 3000,
+                    upload_id, query=True)
+                self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['offset'], 3000)
+        chunked_upload = self.get_upload(upload_id)
+        self.assertEqual(self.read_file(chunked_upload), data)
+        response = self.complete(upload_id, data)
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_written_chunk_passed_to_view(self):
+        data = random_data(2000)
+        upload_id = self.upload('/direct/', data[:1000], 1000)
+        chunks = []
+        add_chunk = ChunkedUploadView.add_chunk
+
+        def record(view, request, chunked_upload, chunk, **kwargs):
+            chunks.append(chunk)
+            return add_chunk(view, request, chunked_upload, chunk, **kwargs)
+
+        with mock.patch.object(ChunkedUploadView, 'add_chunk', record):
+            self.post_chunk('/direct/', data[1000:], 1000, 2000, upload_id,
+                            query=True)
+        self.assertIsInstance(chunks[0], WrittenChunk)
+
+    def test_offset_mismatch_left_to_view(self):
+        data = random_data(2000)
+        response = self.post_chunk('/direct/', data[:1000], 0, 2000)
+        upload_id = response.json()['upload_id']
+        response = self.post_chunk('/direct/', data[1000:1500], 1500, 2000,
+                                   upload_id, query=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['offset'], 1000)
+        chunked_upload = self.get_upload(upload_id)
+        self.assertEqual(self.read_file(chunked_upload), data[:1000])
+
+    def test_checksum_verified(self):
+        data = random_data(2000)
+        response = self.post_chunk('/direct/', data[:1000], 0, 2000)
+        upload_id = response.json()['upload_id']
+        response = self.client.post(
+            '/direct/?upload_id=%s&checksum=%s' % (upload_id, '0' * 32),
+            {'file': SimpleUploadedFile('file.bin', data[1000:])},
+            HTTP_CONTENT_RANGE='bytes 1000-1999/2000')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get_upload(upload_id).offset, 1000)
@@ -0,0 +1,53 @@
+import hashlib
+from unittest import mock
+
+from chunked_upload import hashers
+from chunked_upload.hashers import ResumableMD5, is_resumable_md5_available
+from chunked_upload.models import ChunkedUpload
+
+from .base import UploadTestCase, random_data
+
+
+class ResumableMD5Tests(UploadTestCase):
+
+    def setUp(self):
+        super(ResumableMD5Tests, self).setUp()
+        if not is_resumable_md5_available():
+            self.skipTest('libcrypto is not available')
+
+    def test_resumed_state(self):
+        data = random_data(1000)
+        hasher = ResumableMD5()
+        hasher.update(data[:333])
+        hasher = ResumableMD5(state=hasher.state)
+        self.assertEqual(hasher.length, 333)
+        hasher.update(data[333:])
+        self.assertEqual(hasher.hexdigest(), hashlib.md5(data).hexdigest())
+
+    def test_invalid_state(self):
+        with self.assertRaises(ValueError):
+            ResumableMD5(state=b'\0' * 10)
+
+    def test_unexpected_layout(self):
+        with mock.patch.object(hashers, '_self_test', return_value=False):
+            self.assertIsNone(hashers._load_libcrypto())
+
+
+class LazyLoadingTests(UploadTestCase):
+
+    def test_not_loaded_if_disabled(self):
+        with mock.patch.object(hashers, '_loaded', False), \
+                mock.patch.object(hashers, '_libcrypto', None), \
+                mock.patch('chunked_upload.models.INCREMENTAL_MD5', False):
+            self.assertIsNone(ChunkedUpload().get_md5_hasher())
+            self.assertFalse(hashers._loaded)
+
+    def test_md5_without_libcrypto(self):
+        data = random_data(3000)
+        with mock.patch.object(hashers, '_loaded', True), \
+                mock.patch.object(hashers, '_libcrypto', None):
+            upload_id = self.upload('/upload/', data, 1000)
+            chunked_upload = self.get_upload(upload_id)
+            self.assertIsNone(chunked_upload.md5_state)
+            response = self.complete(upload_id, data)
+        self.assertEqual(response.status_code, 200, response.content)
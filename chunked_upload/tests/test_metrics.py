@@ -0,0 +1,103 @@
+from unittest import mock
+
+from chunked_upload import metrics
+from chunked_upload.metrics import (ERROR, SUCCESS, PrometheusMetrics,
+                                    StatsdMetrics, measure)
+from chunked_upload.signals import phase_finished
+
+from .base import UploadTestCase, random_data
+
+
+class PhaseFinishedTests(UploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.phases = []
+        phase_finished.connect(self.receiver)
+        self.addCleanup(phase_finished.disconnect, self.receiver)
+
+    def receiver(self, sender, phase, duration, size, upload_id, outcome,
+                 **kwargs):
+        self.phases.append((phase, size, upload_id, outcome))
+        self.assertGreaterEqual(duration, 0)
+
+    def test_phases(self):
+        data = random_data(2000)
+        upload_id = self.upload('/upload/', data, 1000)
+        self.complete(upload_id, data)
+        phases = {phase for phase, size, _, outcome in self.phases
+                  if outcome == SUCCESS}
+        self.assertLessEqual({'request', 'parse', 'lookup', 'append', 'save',
+                              'assemble', 'md5_check', 'on_completion'},
+                             phases)
+        appends = [(size, phase_upload_id)
+                   for phase, size, phase_upload_id, _ in self.phases
+                   if phase == 'append']
+        self.assertEqual(appends, [(1000, upload_id), (1000, upload_id)])
+
+    def test_error(self):
+        data = random_data(2000)
+        upload_id = self.upload('/upload/', data[:1000], 1000)
+        del self.phases[:]
+        response = self.post_chunk('/upload/', data[1000:], 500, 2000,
+                                   upload_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(('request', ERROR),
+                      [(phase, outcome)
+                       for phase, _, _, outcome in self.phases])
+
+    def test_disabled(self):
+        phase_finished.disconnect(self.receiver)
+        self.assertIs(measure(None, 'request'), metrics._null_measure)
+
+
+class PrometheusMetricsTests(UploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.metrics = PrometheusMetrics(buckets=[0.1, 1])
+        for patcher in (mock.patch.object(metrics, 'METRICS',
+                                          PrometheusMetrics),
+                        mock.patch.object(metrics, '_metrics', self.metrics)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_render(self):
+        self.metrics.record('append', 0.5, size=1000)
+        self.metrics.record('append', 2, size=500, outcome=ERROR)
+        text = self.metrics.render()
+        self.assertIn('chunked_upload_phase_duration_seconds_bucket{'
+                      'phase="append",outcome="success",le="0.1"} 0', text)
+        self.assertIn('chunked_upload_phase_duration_seconds_bucket{'
+                      'phase="append",outcome="success",le="1.0"} 1', text)
+        self.assertIn('chunked_upload_phase_duration_seconds_count{'
+                      'phase="append",outcome="error"} 1', text)
+        self.assertIn('chunked_upload_phase_bytes_total{'
+                      'phase="append",outcome="success"} 1000', text)
+
+    def test_view(self):
+        self.upload('/upload/', random_data(1000), 1000)
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'phase="append",outcome="success"} 1000',
+                      response.content)
+
+    def test_view_disabled(self):
+        with mock.patch.object(metrics, '_metrics', None), \
+                mock.patch.object(metrics, 'METRICS', None):
+            response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 404)
+
+
+class StatsdMetricsTests(UploadTestCase):
+
+    def test_lines(self):
+        backend = StatsdMetrics(prefix='uploads')
+        self.addCleanup(backend.socket.close)
+        self.assertEqual(backend.get_lines('append', 0.25, 1000, SUCCESS),
+                         ['uploads.append.success:250.000|ms',
+                          'uploads.append.bytes:1000|c'])
+        backend.tags = True
+        self.assertEqual(backend.get_lines('save', 0.001, None, ERROR),
+                         ['uploads.duration:1.000|ms|#phase:save,'
+                          'outcome:error'])
@@ -0,0 +1,34 @@
+import sys
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from chunked_upload.models import StoredChunk
+
+
+class MigrationTests(TestCase):
+
+    def makemigrations(self):
+        out = StringIO()
+        call_command('makemigrations', 'chunked_upload', check=True,
+                     dry_run=True, stdout=out)
+        return out.getvalue()
+
+    def test_no_changes(self):
+        self.assertIn('No changes detected', self.makemigrations())
+
+    def test_chunk_store_path_setting(self):
+        # As with CHUNKED_UPLOAD_CHUNK_STORE_PATH = 'elsewhere/chunks'
+        # (re-importing the migrations so they read the setting again).
+        path = 'elsewhere/chunks'
+        migrations = [name for name in sys.modules
+                      if name.startswith('chunked_upload.migrations.')]
+        with mock.patch('chunked_upload.settings.CHUNK_STORE_PATH', path), \
+                mock.patch.dict(sys.modules), \
+                mock.patch.object(StoredChunk._meta.get_field('file'),
+                                  'upload_to', path):
+            for name in migrations:
+                del sys.modules[name]
+            self.assertIn('No changes detected', self.makemigrations())
@@ -0,0 +1,57 @@
+from unittest import mock
+
+from django.utils.http import parse_http_date
+
+from chunked_upload import response as response_module
+
+from .base import UploadTestCase, random_data
+
+
+class AckModeTests(UploadTestCase):
+
+    def test_default(self):
+        response = self.post_chunk('/upload/', random_data(1000), 0, 2000)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()),
+                         {'upload_id', 'offset', 'expires'})
+
+    def test_json(self):
+        data = random_data(2000)
+        response = self.post_chunk('/ack/json/', data[:1000], 0, 2000)
+        self.assertEqual(response.status_code, 200)
+        ack = response.json()
+        chunked_upload = self.get_upload(ack['upload_id'])
+        self.assertEqual(ack['offset'], 1000)
+        # Same data without orjson
+        with mock.patch.object(response_module, 'orjson', None):
+            response = self.post_chunk('/ack/json/', data[1000:], 1000, 2000,
+                                       ack['upload_id'])
+        self.assertEqual(response.json(), {
+            'upload_id': chunked_upload.upload_id, 'offset': 2000,
+            'expires': ack['expires']})
+
+    def test_headers(self):
+        data = random_data(2000)
+        response = self.post_chunk('/ack/headers/', data[:1000], 0, 2000)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response.content, b'')
+        self.assertNotIn('Content-Type', response)
+        chunked_upload = self.get_upload(response['Upload-Id'])
+        self.assertEqual(response['Upload-Offset'], '1000')
+        self.assertEqual(parse_http_date(response['Upload-Expires']),
+                         int(chunked_upload.expires_on.timestamp()))
+        self.assertNotIn('Upload-Received-Ranges', response)
+
+    def test_headers_received_ranges(self):
+        data = random_data(3000)
+        response = self.post_chunk('/ack/headers/unordered/', data[2000:],
+                                   2000, 3000)
+        response = self.post_chunk('/ack/headers/unordered/', data[:1000], 0,
+                                   3000, response['Upload-Id'])
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response['Upload-Received-Ranges'],
+                         '0-999,2000-2999')
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            response_module.ack_response(mock.Mock(), 'xml')
@@ -0,0 +1,104 @@
+import hashlib
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import Client
+from django.utils.http import parse_http_date
+
+from .base import UploadTestCase, random_data
+
+
+class UploadStateTests(UploadTestCase):
+
+    def start_upload(self, data, url='/upload/', client=None):
+        response = self.post_chunk(url, data[:1000], 0, len(data),
+                                   client=client)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['upload_id']
+
+    def test_get(self):
+        data = random_data(3000)
+        upload_id = self.start_upload(data)
+        response = self.client.get('/upload/%s/' % upload_id)
+        self.assertEqual(response.status_code, 200)
+        state = response.json()
+        self.assertEqual(state['upload_id'], upload_id)
+        self.assertEqual(state['status'], 'uploading')
+        self.assertEqual(state['offset'], 1000)
+        self.assertEqual(state['total_size'], 3000)
+        self.assertEqual(state['received_ranges'], [[0, 1000]])
+        self.assertEqual(state['filename'], 'file.bin')
+        if state['md5'] is not None:  # If libcrypto is available
+            self.assertEqual(state['md5'],
+                             hashlib.md5(data[:1000]).hexdigest())
+        self.assertEqual(response['Upload-Offset'], '1000')
+        self.assertEqual(response['Cache-Control'], 'no-store')
+
+    def test_head(self):
+        upload_id = self.start_upload(random_data(3000))
+        response = self.client.head('/upload/%s/' % upload_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Upload-Offset'], '1000')
+        self.assertEqual(
+            parse_http_date(response['Upload-Expires']),
+            int(self.get_upload(upload_id).expires_on.timestamp()))
+
+    def test_not_found(self):
+        other = get_user_model().objects.create_user('other')
+        client = Client()
+        client.force_login(other)
+        upload_id = self.start_upload(random_data(2000), client=client)
+        for url in ('/upload/missing/', '/upload/%s/' % upload_id):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 404)
+
+    def test_several(self):
+        first = self.start_upload(random_data(2000))
+        second = self.start_upload(random_data(3000))
+        response = self.client.get('/upload/?upload_id=%s,missing'
+                                   '&upload_id=%s' % (first, second))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(sorted(state['upload_id']
+                                for state in data['uploads']),
+                         sorted([first, second]))
+        self.assertEqual(data['missing'], ['missing'])
+
+    def test_in_progress(self):
+        data = random_data(2000)
+        complete_id = self.upload('/upload/', data, 1000)
+        self.complete(complete_id, data)
+        in_progress_id = self.start_upload(data)
+        response = self.client.get('/upload/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([state['upload_id']
+                          for state in response.json()['uploads']],
+                         [in_progress_id])
+
+    def test_cached_state(self):
+        self.use_state_cache(write_back_interval=3600)
+        data = random_data(3000)
+        upload_id = self.start_upload(data)
+        self.post_chunk('/upload/', data[1000:2000], 1000, 3000, upload_id)
+        self.assertEqual(self.get_upload(upload_id).offset, 1000)
+        response = self.client.get('/upload/%s/' % upload_id)
+        self.assertEqual(response.json()['offset'], 2000)
+
+    def test_not_throttled(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        # Reaches the max number of uploads in progress
+        upload_id = self.start_upload(random_data(2000),
+                                      url='/throttled/uploads/')
+        for url in ('/throttled/uploads/', '/throttled/uploads/batch/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+        response = self.client.head('/throttled/uploads/')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/throttled/uploads/?upload_id=%s'
+                                   % upload_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.post_chunk('/throttled/uploads/', random_data(1000), 0,
+                            2000).status_code, 429)
@@ -0,0 +1,106 @@
+import time
+from unittest import mock
+
+from django.core.cache import caches
+
+from chunked_upload.models import ChunkedUpload
+from chunked_upload.state import CacheLock, cache_lock
+from chunked_upload.views import ChunkedUploadCompleteView
+
+from .base import UploadTestCase, random_data
+
+
+class StateCacheTests(UploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.state_cache = self.use_state_cache(write_back_interval=3600)
+
+    def test_write_back(self):
+        data = random_data(3000)
+        response = self.post_chunk('/upload/', data[:1000], 0, 3000)
+        upload_id = response.json()['upload_id']
+        response = self.post_chunk('/upload/', data[1000:2000], 1000, 3000,
+                                   upload_id)
+        self.assertEqual(response.json()['offset'], 2000)
+        # Only cached
+        self.assertEqual(self.get_upload(upload_id).offset, 1000)
+        cached = self.state_cache.get(ChunkedUpload, upload_id)
+        self.assertEqual(cached.offset, 2000)
+
+        # Written back with the last chunk
+        self.post_chunk('/upload/', data[2000:], 2000, 3000, upload_id)
+        self.assertEqual(self.get_upload(upload_id).offset, 3000)
+        response = self.complete(upload_id, data)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.read_file(self.get_upload(upload_id)), data)
+
+    def test_flush(self):
+        data = random_data(2000)
+        response = self.post_chunk('/upload/', data[:1000], 0, 3000)
+        upload_id = response.json()['upload_id']
+        self.post_chunk('/upload/', data[1000:], 1000, 3000, upload_id)
+        self.state_cache.flush(ChunkedUpload, upload_id)
+        self.assertEqual(self.get_upload(upload_id).offset, 2000)
+        self.assertIsNone(self.state_cache.get(ChunkedUpload, upload_id))
+
+    def test_lost_lock(self):
+        data = random_data(2000)
+        response = self.post_chunk('/upload/', data[:1000], 0, 3000)
+        upload_id = response.json()['upload_id']
+        with mock.patch.object(CacheLock, 'refresh', return_value=False):
+            response = self.post_chunk('/upload/', data[1000:], 1000, 3000,
+                                       upload_id)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.get_upload(upload_id).offset, 1000)
+        # The chunk can be sent again
+        response = self.post_chunk('/upload/', data[1000:], 1000, 3000,
+                                   upload_id)
+        self.assertEqual(response.json()['offset'], 2000)
+
+    def test_locked_while_completed(self):
+        self.state_cache.lock_wait = 0.1
+        data = random_data(2000)
+        upload_id = self.upload('/upload/', data, 1000)
+        responses = []
+        verify = ChunkedUploadCompleteView.verify
+
+        def append_while_verified(view, *args, **kwargs):
+            responses.append(self.post_chunk('/upload/', data[1000:], 1000,
+                                             2000, upload_id))
+            return verify(view, *args, **kwargs)
+
+        with mock.patch.object(ChunkedUploadCompleteView, 'verify',
+                               append_while_verified):
+            response = self.complete(upload_id, data)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(responses[0].status_code, 409)
+        self.assertIsNone(self.state_cache.get(ChunkedUpload, upload_id))
+        response = self.post_chunk('/upload/', data[1000:], 1000, 2000,
+                                   upload_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/upload/%s/' % upload_id).json()[
+            'status'], 'complete')
+
+
+class CacheLockTests(UploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache = caches['default']
+        self.cache.clear()
+
+    def test_kept_alive(self):
+        with cache_lock(self.cache, 'lock', 0.3, 0, keep_alive=True) as lock:
+            time.sleep(0.6)
+            self.assertTrue(lock.is_held())
+        self.assertIsNone(self.cache.get('lock'))
+
+    def test_expired(self):
+        with cache_lock(self.cache, 'lock', 0.1, 0) as lock:
+            time.sleep(0.2)
+            self.assertFalse(lock.refresh())
+            # Acquired by someone else meanwhile
+            with cache_lock(self.cache, 'lock', 10, 0):
+                self.assertFalse(lock.is_held())
+            self.assertFalse(lock.refresh())
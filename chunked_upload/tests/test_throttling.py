@@ -0,0 +1,88 @@
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import Client
+
+from chunked_upload import throttling
+from chunked_upload.throttling import get_user
+
+from .base import UploadTestCase, random_data
+
+
+class ThrottleTests(UploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+
+    def assertThrottled(self, response):
+        self.assertEqual(response.status_code, 429, response.content)
+        self.assertEqual(response['Retry-After'],
+                         str(response.json()['retry_after']))
+
+    def test_byte_rate(self):
+        now = time.time()
+        data = random_data(1000)
+        with mock.patch.object(throttling.time, 'time', return_value=now):
+            responses = [self.post_chunk('/throttled/rate/', data, 0, 1000)
+                         for _ in range(5)]
+        # Bursts of up to 5000 bytes (with the multipart encoding)
+        self.assertEqual([response.status_code for response in responses],
+                         [200] * 4 + [429])
+        self.assertThrottled(responses[-1])
+        # Refilled
+        with mock.patch.object(throttling.time, 'time',
+                               return_value=now + 2):
+            response = self.post_chunk('/throttled/rate/', data, 0, 1000)
+        self.assertEqual(response.status_code, 200)
+
+    def test_byte_rate_per_user(self):
+        data = random_data(4000)
+        response = self.post_chunk('/throttled/rate/', data, 0, 4000)
+        self.assertEqual(response.status_code, 200)
+        self.assertThrottled(
+            self.post_chunk('/throttled/rate/', data, 0, 4000))
+        # Throttled per user
+        other = get_user_model().objects.create_user('other')
+        client = Client()
+        client.force_login(other)
+        response = self.post_chunk('/throttled/rate/', data, 0, 4000,
+                                   client=client)
+        self.assertEqual(response.status_code, 200)
+
+    def test_concurrent_uploads(self):
+        data = random_data(2000)
+        response = self.post_chunk('/throttled/uploads/', data[:1000], 0,
+                                   2000)
+        upload_id = response.json()['upload_id']
+        self.assertThrottled(
+            self.post_chunk('/throttled/uploads/', data[:1000], 0, 2000))
+        # The upload in progress can go on
+        response = self.post_chunk('/throttled/uploads/', data[1000:], 1000,
+                                   2000, upload_id)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.complete(upload_id, data)
+        response = self.post_chunk('/throttled/uploads/', data[:1000], 0,
+                                   2000)
+        self.assertEqual(response.status_code, 200)
+
+    def test_staged_bytes(self):
+        data = random_data(6000)
+        response = self.post_chunk('/throttled/staged/', data[:2000], 0,
+                                   6000)
+        upload_id = response.json()['upload_id']
+        response = self.post_chunk('/throttled/staged/', data[2000:4000],
+                                   2000, 6000, upload_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertThrottled(self.post_chunk(
+            '/throttled/staged/', data[4000:], 4000, 6000, upload_id))
+
+    def test_get_user(self):
+        request = mock.Mock(user=self.user)
+        self.assertEqual(get_user(request), self.user)
+        request.user = mock.Mock(is_authenticated=lambda: False)  # Django <2
+        self.assertIsNone(get_user(request))
+        self.assertIsNone(get_user(mock.Mock(spec=[])))
@@ -0,0 +1,62 @@
+import base64
+
+from chunked_upload.constants import COMPLETE, UPLOADING
+
+from . import views
+from .base import UploadTestCase, random_data
+
+
+class TusViewTests(UploadTestCase):
+
+    def setUp(self):
+        super(TusViewTests, self).setUp()
+        views.completed.clear()
+
+    def create(self, length, filename='file.bin'):
+        return self.client.post(
+            '/tus/', HTTP_TUS_RESUMABLE='1.0.0', HTTP_UPLOAD_LENGTH=str(length),
+            HTTP_UPLOAD_METADATA='filename %s' % base64.b64encode(
+                filename.encode()).decode())
+
+    def patch(self, upload_id, data, offset):
+        return self.client.patch(
+            '/tus/%s/' % upload_id, data,
+            content_type='application/offset+octet-stream',
+            HTTP_TUS_RESUMABLE='1.0.0', HTTP_UPLOAD_OFFSET=str(offset))
+
+    def get_upload_id(self, response):
+        return response['Location'].rsplit('=', 1)[1]
+
+    def test_upload(self):
+        data = random_data(3000)
+        response = self.create(len(data))
+        self.assertEqual(response.status_code, 201)
+        upload_id = self.get_upload_id(response)
+        self.assertEqual(self.get_upload(upload_id).status, UPLOADING)
+        for offset in (0, 1000, 2000):
+            response = self.patch(upload_id, data[offset:offset + 1000],
+                                  offset)
+            self.assertEqual(response.status_code, 204, response.content)
+            self.assertEqual(response['Upload-Offset'], str(offset + 1000))
+        chunked_upload = self.get_upload(upload_id)
+        self.assertEqual(chunked_upload.status, COMPLETE)
+        self.assertEqual(chunked_upload.filename, 'file.bin')
+        self.assertEqual(self.read_file(chunked_upload), data)
+        self.assertEqual(views.completed, [upload_id])
+
+    def test_offset_mismatch(self):
+        response = self.create(2000)
+        upload_id = self.get_upload_id(response)
+        response = self.patch(upload_id, random_data(1000), 1000)
+        self.assertEqual(response.status_code, 409)
+
+    def test_empty_upload_completed_on_creation(self):
+        response = self.create(0)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['Upload-Offset'], '0')
+        upload_id = self.get_upload_id(response)
+        chunked_upload = self.get_upload(upload_id)
+        self.assertEqual(chunked_upload.status, COMPLETE)
+        self.assertIsNotNone(chunked_upload.completed_on)
+        self.assertEqual(self.read_file(chunked_upload), b'')
+        self.assertEqual(views.completed, [upload_id])
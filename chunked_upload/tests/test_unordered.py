@@ -0,0 +1,93 @@
+import json
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models import QuerySet
+
+from chunked_upload.constants import COMPLETE
+from chunked_upload.models import AbstractChunkedUpload
+
+from .base import UploadTestCase, random_data
+
+
+class OutOfOrderTests(UploadTestCase):
+
+    def record_events(self):
+        """
+        Patches the row locks and positional writes to record their order.
+        """
+        events = []
+        select_for_update = QuerySet.select_for_update
+        write_chunk_at = AbstractChunkedUpload.write_chunk_at
+
+        def lock(queryset, *args, **kwargs):
+            events.append('lock')
+            return select_for_update(queryset, *args, **kwargs)
+
+        def write(chunked_upload, *args, **kwargs):
+            events.append('write')
+            return write_chunk_at(chunked_upload, *args, **kwargs)
+
+        for target, name, patch in ((QuerySet, 'select_for_update', lock),
+                                    (AbstractChunkedUpload, 'write_chunk_at',
+                                     write)):
+            patcher = mock.patch.object(target, name, patch)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return events
+
+    def test_chunks_in_any_order(self):
+        data = random_data(3000)
+        response = self.post_chunk('/unordered/', data[2000:], 2000, 3000)
+        upload_id = response.json()['upload_id']
+        self.assertEqual(response.json()['received_ranges'], [[2000, 3000]])
+        response = self.post_chunk('/unordered/', data[:1000], 0, 3000,
+                                   upload_id)
+        self.assertEqual(response.json()['offset'], 1000)
+        response = self.complete(upload_id, data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['missing_ranges'], [[1000, 2000]])
+        self.post_chunk('/unordered/', data[1000:2000], 1000, 3000, upload_id)
+        response = self.complete(upload_id, data)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.read_file(self.get_upload(upload_id)), data)
+
+    def test_chunk_written_once_locked(self):
+        data = random_data(2000)
+        response = self.post_chunk('/unordered/', data[1000:], 1000, 2000)
+        upload_id = response.json()['upload_id']
+        events = self.record_events()
+        self.post_chunk('/unordered/', data[:1000], 0, 2000, upload_id)
+        self.assertEqual(events, ['lock', 'write'])
+
+    def test_batch_chunks_written_once_locked(self):
+        data = random_data(2000)
+        response = self.post_chunk('/unordered/', data[1000:], 1000, 2000)
+        upload_id = response.json()['upload_id']
+        events = self.record_events()
+        response = self.client.post('/oobatch/', {
+            'chunks': json.dumps([{'file': 'c0', 'upload_id': upload_id,
+                                   'content_range': 'bytes 0-999/2000'}]),
+            'c0': SimpleUploadedFile('file.bin', data[:1000])})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['chunks'][0]['offset'], 2000)
+        self.assertEqual(events, ['lock', 'write'])
+
+    def test_late_chunk_rejected(self):
+        data = random_data(2000)
+        upload_id = None
+        for start in (1000, 0):
+            response = self.post_chunk('/unordered/',
+                                       data[start:start + 1000], start, 2000,
+                                       upload_id)
+            upload_id = response.json()['upload_id']
+        response = self.complete(upload_id, data)
+        self.assertEqual(response.status_code, 200, response.content)
+        events = self.record_events()
+        response = self.post_chunk('/unordered/', random_data(1000), 0, 2000,
+                                   upload_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('write', events)
+        chunked_upload = self.get_upload(upload_id)
+        self.assertEqual(chunked_upload.status, COMPLETE)
+        self.assertEqual(self.read_file(chunked_upload), data)
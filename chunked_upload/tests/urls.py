@@ -0,0 +1,51 @@
+from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
+
+from chunked_upload.handlers import ChunkedUploadHandler
+from chunked_upload.throttling import (ByteRateThrottle,
+                                       ConcurrentUploadsThrottle,
+                                       StagedBytesThrottle)
+from chunked_upload.views import (
+    AsyncChunkedUploadCompleteView, AsyncChunkedUploadView,
+    ChunkedUploadBatchView, ChunkedUploadDedupView,
+    ChunkedUploadDownloadView, ChunkedUploadMetricsView,
+    ChunkedUploadStatusView, ChunkedUploadView)
+
+from .views import BackgroundCompleteView, CompleteView, TusView
+
+urlpatterns = [
+    path('upload/', ChunkedUploadView.as_view()),
+    path('upload/<str:upload_id>/', ChunkedUploadView.as_view()),
+    path('direct/', csrf_exempt(ChunkedUploadView.as_view(
+        upload_handler_class=ChunkedUploadHandler))),
+    path('unordered/', ChunkedUploadView.as_view(allow_out_of_order=True)),
+    path('ack/json/', ChunkedUploadView.as_view(ack_mode='json')),
+    path('ack/headers/', ChunkedUploadView.as_view(ack_mode='headers')),
+    path('ack/headers/unordered/', ChunkedUploadView.as_view(
+        ack_mode='headers', allow_out_of_order=True)),
+    path('preallocated/', ChunkedUploadView.as_view(preallocate=True)),
+    path('throttled/rate/', ChunkedUploadView.as_view(throttles=[
+        (ByteRateThrottle, {'rate': 1000, 'burst': 5000})])),
+    path('throttled/uploads/', ChunkedUploadView.as_view(throttles=[
+        (ConcurrentUploadsThrottle, {'max_uploads': 1})])),
+    path('throttled/uploads/batch/', ChunkedUploadBatchView.as_view(
+        throttles=[(ConcurrentUploadsThrottle, {'max_uploads': 1})])),
+    path('throttled/staged/', ChunkedUploadView.as_view(throttles=[
+        (StagedBytesThrottle, {'max_bytes': 5000, 'scope': 'global'})])),
+    path('async/', AsyncChunkedUploadView.as_view()),
+    path('async/complete/', AsyncChunkedUploadCompleteView.as_view()),
+    path('batch/', ChunkedUploadBatchView.as_view()),
+    path('oobatch/', ChunkedUploadBatchView.as_view(allow_out_of_order=True)),
+    path('dedup/', ChunkedUploadDedupView.as_view()),
+    path('complete/', CompleteView.as_view()),
+    path('complete/background/', BackgroundCompleteView.as_view()),
+    path('status/<str:upload_id>/', ChunkedUploadStatusView.as_view()),
+    path('download/<str:upload_id>/', ChunkedUploadDownloadView.as_view()),
+    path('download/partial/<str:upload_id>/',
+         ChunkedUploadDownloadView.as_view(allow_incomplete=True)),
+    path('download/offload/<str:upload_id>/',
+         ChunkedUploadDownloadView.as_view(offload_header='X-Accel-Redirect')),
+    path('metrics/', ChunkedUploadMetricsView.as_view()),
+    path('tus/', TusView.as_view()),
+    path('tus/<str:upload_id>/', TusView.as_view()),
+]
@@ -0,0 +1,38 @@
+"""
+Views of the test project.
+"""
+from chunked_upload.completion import BaseCompletionExecutor, complete_upload
+from chunked_upload.views import (ChunkedUploadCompleteView,
+                                  ChunkedUploadTusView)
+
+completed = []
+
+
+class CompleteView(ChunkedUploadCompleteView):
+    """
+    Records the uploads completed.
+    """
+
+    def on_completion(self, uploaded_file, request):
+        completed.append(uploaded_file.chunked_upload.upload_id)
+        return {'size': uploaded_file.size}
+
+
+class TusView(ChunkedUploadTusView):
+
+    def on_completion(self, uploaded_file, request):
+        completed.append(uploaded_file.chunked_upload.upload_id)
+
+
+class ImmediateCompletionExecutor(BaseCompletionExecutor):
+    """
+    Completes uploads right away (once the transaction is committed).
+    """
+
+    def submit(self, *args):
+        complete_upload(*args)
+
+
+class BackgroundCompleteView(CompleteView):
+    completion_executor = ('chunked_upload.tests.views.'
+                           'ImmediateCompletionExecutor')
@@ -0,0 +1,195 @@
+"""
+Throttles limiting the uploads of the users (or of everyone), checked by
+`ChunkedUploadBaseView.check_permissions` (see `CHUNKED_UPLOAD_THROTTLES`).
+
+A throttle is any class whose instances have a `check(request, view)` method
+raising `UploadThrottled` (responded with 429 and a Retry-After header) if
+the request has to wait. Their state is kept in the cache
+`CHUNKED_UPLOAD_THROTTLE_CACHE`, shared by the workers (the cache backend
+must implement `add()` atomically across processes, e.g. Redis or
+Memcached).
+"""
+import math
+import time
+
+from django.core.cache import caches
+from django.db.models import Sum
+from django.utils import timezone
+
+from .constants import UPLOADING
+from .exceptions import UploadThrottled
+from .settings import THROTTLE_CACHE
+from .state import cache_lock
+# Not circular: the views import the throttles lazily (`import_string`)
+from .views import is_authenticated
+
+
+def get_request_size(request):
+    size = request.META.get('CONTENT_LENGTH', '')
+    return int(size) if size.isdigit() else 0
+
+
+def get_user(request):
+    user = getattr(request, 'user', None)
+    if user is None or not is_authenticated(user):
+        return None
+    return user
+
+
+class BaseThrottle(object):
+    """
+    Base throttle, applied per user (`scope` "user", the IP address of
+    anonymous requests) or to all the requests (`scope` "global").
+    Subclasses must implement `check()`.
+    """
+
+    key_prefix = 'chunked_upload:throttle:'
+
+    def __init__(self, scope='user', cache=THROTTLE_CACHE):
+        if scope not in ('user', 'global'):
+            raise ValueError('Invalid throttle scope: %r' % scope)
+        self.scope = scope
+        self.cache = caches[cache]
+
+    def get_ident(self, request):
+        """
+        Returns the identifier of the requests throttled together.
+        """
+        if self.scope == 'global':
+            return 'global'
+        user = get_user(request)
+        if user is not None:
+            return 'user:%s' % user.pk
+        return 'ip:%s' % request.META.get('REMOTE_ADDR', '')
+
+    def get_key(self, request):
+        return '%s%s:%s' % (self.key_prefix, type(self).__name__,
+                            self.get_ident(request))
+
+    def check(self, request, view):
+        """
+        Raises `UploadThrottled` if the request has to wait.
+        """
+        raise NotImplementedError
+
+
+class ByteRateThrottle(BaseThrottle):
+    """
+    Limits the rate of the data sent (the Content-Length of the requests) to
+    `rate` bytes per second, with bursts of up to `burst` bytes (`rate` by
+    default), with a token bucket. A request larger than `burst` is let
+    through when the bucket is full (so `burst` should be at least the size
+    of a chunk).
+    """
+
+    # Seconds the bucket is locked at most, and waited for at most
+    lock_timeout = 5
+    lock_wait = 5
+
+    def __init__(self, rate, burst=None, **kwargs):
+        super(ByteRateThrottle, self).__init__(**kwargs)
+        self.rate = rate
+        self.burst = burst or rate
+
+    def check(self, request, view):
+        size = get_request_size(request)
+        if not size:
+            return
+        key = self.get_key(request)
+        with cache_lock(self.cache, key + ':lock', self.lock_timeout,
+                        self.lock_wait, detail='Throttle is locked'):
+            now = time.time()
+            tokens, updated_at = self.cache.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            needed = min(size, self.burst)
+            if tokens < needed:
+                raise UploadThrottled(
+                    wait=int(math.ceil((needed - tokens) / self.rate)))
+            # May go below 0 (requests larger than `burst`)
+            tokens -= size
+            self.cache.set(key, (tokens, now),
+                           int((self.burst - tokens) / self.rate) + 60)
+
+
+class ConcurrentUploadsThrottle(BaseThrottle):
+    """
+    Limits the number of uploads in progress (not expired) to
+    `max_uploads`: requests starting a new upload (see
+    `ChunkedUploadBaseView.starts_upload`) are throttled for `retry_after`
+    seconds once it's reached. Anonymous requests aren't throttled per user.
+    """
+
+    def __init__(self, max_uploads, retry_after=60, **kwargs):
+        super(ConcurrentUploadsThrottle, self).__init__(**kwargs)
+        self.max_uploads = max_uploads
+        self.retry_after = retry_after
+
+    def check(self, request, view):
+        if not view.starts_upload(request):
+            return
+        queryset = get_in_progress_uploads(self, request, view)
+        if queryset is not None and queryset.count() >= self.max_uploads:
+            raise UploadThrottled(
+                wait=self.retry_after,
+                detail='Too many uploads in progress (max %i)'
+                       % self.max_uploads)
+
+
+class StagedBytesThrottle(BaseThrottle):
+    """
+    Limits the total size of the data of the uploads in progress (the sum of
+    their `offset`) to `max_bytes`: requests which would exceed it are
+    throttled for `retry_after` seconds. The sum is cached for
+    `cache_timeout` seconds (and increased with the size of the requests let
+    through meanwhile). Anonymous requests aren't throttled per user.
+    """
+
+    def __init__(self, max_bytes, retry_after=60, cache_timeout=10,
+                 **kwargs):
+        super(StagedBytesThrottle, self).__init__(**kwargs)
+        self.max_bytes = max_bytes
+        self.retry_after = retry_after
+        self.cache_timeout = cache_timeout
+
+    def get_staged_bytes(self, request, view):
+        key = self.get_key(request)
+        staged = self.cache.get(key)
+        if staged is None:
+            queryset = get_in_progress_uploads(self, request, view)
+            if queryset is None:
+                return None
+            staged = queryset.aggregate(staged=Sum('offset'))['staged'] or 0
+            self.cache.add(key, staged, self.cache_timeout)
+        return staged
+
+    def check(self, request, view):
+        size = get_request_size(request)
+        if not size:
+            return
+        staged = self.get_staged_bytes(request, view)
+        if staged is None:
+            return
+        if staged + size > self.max_bytes:
+            raise UploadThrottled(
+                wait=self.retry_after,
+                detail='Too much data in uploads in progress (max %i bytes)'
+                       % self.max_bytes)
+        try:
+            self.cache.incr(self.get_key(request), size)
+        except ValueError:  # Expired meanwhile
+            pass
+
+
+def get_in_progress_uploads(throttle, request, view):
+    """
+    Returns the uploads in progress throttled together with the request (by
+    `throttle`), or `None` if it can't be throttled per user.
+    """
+    queryset = view.model.objects.filter(status=UPLOADING,
+                                         expires_on__gt=timezone.now())
+    if throttle.scope == 'global':
+        return queryset
+    user = get_user(request)
+    if user is None or not hasattr(view.model, view.user_field_name):
+        return None
+    return queryset.filter(**{view.user_field_name: user})
@@ -1,15 +1,38 @@
+import base64
+import errno
+import json
+import logging
+import mimetypes
 import re
+import time
+from contextlib import contextmanager
+from urllib.parse import quote
 
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import (Http404, HttpResponse, FileResponse,
+                         StreamingHttpResponse)
 from django.views.generic import View
 from django.shortcuts import get_object_or_404
-from django.core.files.base import ContentFile
 from django.utils import timezone
+from django.utils.http import http_date
+from django.utils.module_loading import import_string
 
-from .settings import MAX_BYTES
-from .models import ChunkedUpload
-from .response import Response
-from .constants import http_status, COMPLETE
-from .exceptions import ChunkedUploadError
+from .settings import (MAX_BYTES, CHECKSUM_ALGORITHM, COMPLETION_EXECUTOR,
+                       PREALLOCATE, MAX_PREALLOCATE, THROTTLES, ACK_MODE)
+from .models import ChunkedUpload, StoredChunk
+from .response import Response, error_response, ack_response
+from .constants import (http_status, UPLOADING, COMPLETE, PROCESSING, FAILED,
+                        STATUS_NAMES)
+from .exceptions import ChunkedUploadError, ChunkChecksumError
+from .handlers import WrittenChunk
+from .files import FileRange, read_file
+from .executor import run_in_executor
+from .completion import get_completion_executor
+from .state import get_state_cache
+from .metrics import measure, get_metrics, PrometheusMetrics, ERROR
+
+logger = logging.getLogger(__name__)
 
 
 def is_authenticated(user):
@@ -18,6 +41,11 @@ def is_authenticated(user):
     return user.is_authenticated  # Django >=2.0
 
 
+def get_content_length(request):
+    size = request.META.get('CONTENT_LENGTH', '')
+    return int(size) if size.isdigit() else None
+
+
 class ChunkedUploadBaseView(View):
     """
     Base view for the rest of chunked upload views.
@@ -26,6 +54,11 @@ class ChunkedUploadBaseView(View):
     # Has to be a ChunkedUpload subclass
     model = ChunkedUpload
     user_field_name = 'user'  # the field name that point towards the AUTH_USER in ChunkedUpload class or its subclasses
+    # Max number of uploads whose state is reported by a GET request
+    max_state_uploads = 100
+    # Throttles checked by `check_permissions`, as (class or dotted path,
+    # options) pairs (see `CHUNKED_UPLOAD_THROTTLES`)
+    throttles = THROTTLES
 
     def get_queryset(self, request):
         """
@@ -50,6 +83,25 @@ class ChunkedUploadBaseView(View):
         """
         return {}
 
+    def get_status_data(self, chunked_upload, request):
+        """
+        Data reporting the status of an upload (and the result of its
+        completion, if processed in the background).
+        """
+        data = {
+            'upload_id': chunked_upload.upload_id,
+            'status': STATUS_NAMES[chunked_upload.status],
+            'offset': chunked_upload.offset,
+            'total_size': chunked_upload.total_size,
+        }
+        result = chunked_upload.get_completion_result()
+        if chunked_upload.status in (UPLOADING, FAILED):
+            # Error of the completion (retried if still "uploading")
+            data.update(result or {})
+        elif result is not None:
+            data['result'] = result
+        return data
+
     def pre_save(self, chunked_upload, request, new=False):
         """
         Placeholder method for calling before saving an object.
@@ -74,9 +126,20 @@ class ChunkedUploadBaseView(View):
         Wraps save() method.
         """
         new = chunked_upload.id is None
-        self.pre_save(chunked_upload, self.request, new=new)
-        self.save(chunked_upload, self.request, new=new)
-        self.post_save(chunked_upload, self.request, new=new)
+        with measure(type(self), 'save', upload_id=chunked_upload.upload_id):
+            self.pre_save(chunked_upload, self.request, new=new)
+            self.save(chunked_upload, self.request, new=new)
+            self.post_save(chunked_upload, self.request, new=new)
+
+    def _on_completion(self, chunked_upload, request):
+        """
+        Wraps on_completion() method.
+        """
+        with measure(type(self), 'on_completion',
+                     size=chunked_upload.total_size,
+                     upload_id=chunked_upload.upload_id):
+            return self.on_completion(chunked_upload.get_uploaded_file(),
+                                      request)
 
     def check_permissions(self, request):
         """
@@ -87,6 +150,33 @@ class ChunkedUploadBaseView(View):
                 status=http_status.HTTP_403_FORBIDDEN,
                 detail='Authentication credentials were not provided'
             )
+        self.check_throttles(request)
+
+    def get_throttles(self):
+        """
+        Returns the instances of the `throttles`.
+        """
+        throttles = []
+        for throttle_class, options in self.throttles:
+            if isinstance(throttle_class, str):
+                throttle_class = import_string(throttle_class)
+            throttles.append(throttle_class(**options))
+        return throttles
+
+    def check_throttles(self, request):
+        """
+        Checks the request against the `throttles`, raising `UploadThrottled`
+        (429) if it has to wait.
+        """
+        for throttle in self.get_throttles():
+            throttle.check(request, self)
+
+    def starts_upload(self, request):
+        """
+        Whether the request starts a new upload (see
+        `ConcurrentUploadsThrottle`), only POST requests can.
+        """
+        return False
 
     def _post(self, request, *args, **kwargs):
         raise NotImplementedError
@@ -95,11 +185,108 @@ class ChunkedUploadBaseView(View):
         """
         Handle POST requests.
         """
+        with measure(type(self), 'request',
+                     size=get_content_length(request)) as measured:
+            try:
+                self.check_permissions(request)
+                response = self._post(request, *args, **kwargs)
+            except ChunkedUploadError as error:
+                response = error_response(error)
+            if response.status_code >= 400:
+                measured.set(outcome=ERROR)
+            return response
+
+    def get_upload_state(self, chunked_upload, request):
+        """
+        State of an upload, for clients resuming it: its status, offset,
+        expiration, received ranges and the checksums of the data received
+        (computed without reading the file, `None` if not available).
+        """
+        data = self.get_status_data(chunked_upload, request)
+        hasher = chunked_upload.get_md5_hasher()
+        data.update({
+            'filename': chunked_upload.filename,
+            'expires': chunked_upload.expires_on,
+            'received_ranges': chunked_upload.get_received_ranges(),
+            'checksum_algorithm': chunked_upload.checksum_algorithm,
+            'md5': hasher.hexdigest() if hasher is not None else None,
+            'composite_checksum': chunked_upload.composite_checksum,
+        })
+        return data
+
+    def get_uploads(self, request, upload_ids=None):
+        """
+        Returns the uploads `upload_ids` (those found), or the uploads in
+        progress of the user if `None`, with their cached state (if any, see
+        `CHUNKED_UPLOAD_STATE_CACHE`).
+        """
+        queryset = self.get_queryset(request)
+        if upload_ids is None:
+            queryset = queryset.filter(
+                status=UPLOADING, expires_on__gt=timezone.now()
+            ).order_by('created_on')[:self.max_state_uploads]
+        else:
+            queryset = queryset.filter(upload_id__in=upload_ids)
+        uploads = list(queryset)
+        state_cache = get_state_cache()
+        if state_cache is not None and uploads:
+            cached = state_cache.get_many(
+                self.model, [upload.upload_id for upload in uploads])
+            uploads = [cached.get(upload.upload_id, upload)
+                       for upload in uploads]
+        return uploads
+
+    def get(self, request, *args, **kwargs):
+        """
+        Handle GET (and HEAD) requests, reporting the state of uploads (see
+        `get_upload_state`), so clients can resume them without sending
+        data: the upload `upload_id` (URL keyword argument, the offset and
+        expiration are also in the Upload-Offset and Upload-Expires headers),
+        the uploads `upload_id` (query string parameters, repeated or
+        comma-separated), or the uploads in progress of the user.
+        """
         try:
             self.check_permissions(request)
-            return self._post(request, *args, **kwargs)
+            upload_id = kwargs.get('upload_id')
+            if upload_id:
+                uploads = self.get_uploads(request, [upload_id])
+                if not uploads:
+                    raise Http404('No upload matches the given query.')
+                chunked_upload = uploads[0]
+                response = Response(
+                    self.get_upload_state(chunked_upload, request),
+                    status=http_status.HTTP_200_OK)
+                response['Upload-Offset'] = chunked_upload.offset
+                response['Upload-Expires'] = http_date(
+                    chunked_upload.expires_on.timestamp())
+            else:
+                upload_ids = [upload_id
+                              for value in request.GET.getlist('upload_id')
+                              for upload_id in value.split(',') if upload_id]
+                if len(upload_ids) > self.max_state_uploads:
+                    raise ChunkedUploadError(
+                        status=http_status.HTTP_400_BAD_REQUEST,
+                        detail='Too many uploads (max %i)'
+                               % self.max_state_uploads)
+                if not upload_ids and not (
+                        hasattr(self.model, self.user_field_name)
+                        and hasattr(request, 'user')
+                        and is_authenticated(request.user)):
+                    raise ChunkedUploadError(
+                        status=http_status.HTTP_400_BAD_REQUEST,
+                        detail="'upload_id' is required")
+                uploads = self.get_uploads(request, upload_ids or None)
+                found = {upload.upload_id for upload in uploads}
+                response = Response({
+                    'uploads': [self.get_upload_state(upload, request)
+                                for upload in uploads],
+                    'missing': [upload_id for upload_id in upload_ids
+                                if upload_id not in found],
+                }, status=http_status.HTTP_200_OK)
         except ChunkedUploadError as error:
-            return Response(error.data, status=error.status_code)
+            response = error_response(error)
+        response['Cache-Control'] = 'no-store'
+        return response
 
 
 class ChunkedUploadView(ChunkedUploadBaseView):
@@ -109,6 +296,9 @@ class ChunkedUploadView(ChunkedUploadBaseView):
     """
 
     field_name = 'file'
+    # Optional field with the checksum of the chunk (see `checksum_algorithm`
+    # in the model). If sent, the chunk is verified before being accepted
+    checksum_field_name = 'checksum'
     content_range_header = 'HTTP_CONTENT_RANGE'
     content_range_pattern = re.compile(
         r'^bytes (?P<start>\d+)-(?P<end>\d+)/(?P<total>\d+)$'
@@ -118,6 +308,29 @@ class ChunkedUploadView(ChunkedUploadBaseView):
     # content-range header is not found. Default is False to match Jquery File
     # Upload behavior (doesn't send header if the file is smaller than chunk)
     fail_if_no_header = False
+    offset_mismatch_status = http_status.HTTP_400_BAD_REQUEST
+    # If `allow_out_of_order` is True, chunks may be sent in any order (and
+    # in parallel, once the upload was created by the first request). They
+    # are written at their position in the file, preallocated with the total
+    # size in the Content-Range header
+    allow_out_of_order = False
+    # Upload handler inserted before the default ones, e.g.
+    # `chunked_upload.handlers.ChunkedUploadHandler` to write chunks straight
+    # into the upload file (requires sending `upload_id` in the query string).
+    # Note CsrfViewMiddleware reads the request body before the view is
+    # called, so the handler is only used if the view is csrf_exempt
+    upload_handler_class = None
+    # If `preallocate` is True, the file of a new upload is preallocated with
+    # the total size in the Content-Range header (see
+    # `CHUNKED_UPLOAD_PREALLOCATE`)
+    preallocate = PREALLOCATE
+    # Max size of the files preallocated, `None` means no limit (see
+    # `CHUNKED_UPLOAD_MAX_PREALLOCATE`)
+    max_preallocate = MAX_PREALLOCATE
+    # How chunks are acknowledged: `None` (the data of `get_response_data`),
+    # 'json' (the same data, pre-serialized) or 'headers' (204 No Content,
+    # with the data in headers). See `CHUNKED_UPLOAD_ACK_MODE`
+    ack_mode = ACK_MODE
 
     def get_extra_attrs(self, request):
         """
@@ -139,6 +352,10 @@ class ChunkedUploadView(ChunkedUploadBaseView):
 
         return self.max_bytes
 
+    def starts_upload(self, request):
+        return request.method == 'POST' and not (
+            request.GET.get('upload_id') or request.POST.get('upload_id'))
+
     def create_chunked_upload(self, save=False, **attrs):
         """
         Creates new chunked upload instance. Called if no 'upload_id' is
@@ -146,7 +363,7 @@ class ChunkedUploadView(ChunkedUploadBaseView):
         """
         chunked_upload = self.model(**attrs)
         # file starts empty
-        chunked_upload.file.save(name='tmp', content=ContentFile(''), save=save)
+        chunked_upload.create_file(save=save)
         return chunked_upload
 
     def is_valid_chunked_upload(self, chunked_upload):
@@ -157,38 +374,37 @@ class ChunkedUploadView(ChunkedUploadBaseView):
             raise ChunkedUploadError(status=http_status.HTTP_410_GONE,
                                      detail='Upload has expired')
         error_msg = 'Upload has already been marked as "%s"'
-        if chunked_upload.status == COMPLETE:
-            raise ChunkedUploadError(status=http_status.HTTP_400_BAD_REQUEST,
-                                     detail=error_msg % 'complete')
+        if chunked_upload.status != UPLOADING:
+            raise ChunkedUploadError(
+                status=http_status.HTTP_400_BAD_REQUEST,
+                detail=error_msg % STATUS_NAMES[chunked_upload.status])
 
     def get_response_data(self, chunked_upload, request):
         """
         Data for the response. Should return a dictionary-like object.
         """
-        return {
+        data = {
             'upload_id': chunked_upload.upload_id,
             'offset': chunked_upload.offset,
             'expires': chunked_upload.expires_on
         }
+        if self.allow_out_of_order:
+            data['received_ranges'] = chunked_upload.get_received_ranges()
+        return data
 
-    def _post(self, request, *args, **kwargs):
-        chunk = request.FILES.get(self.field_name)
-        if chunk is None:
-            raise ChunkedUploadError(status=http_status.HTTP_400_BAD_REQUEST,
-                                     detail='No chunk file was submitted')
-        self.validate(request)
-
-        upload_id = request.POST.get('upload_id')
-        if upload_id:
-            chunked_upload = get_object_or_404(self.get_queryset(request),
-                                               upload_id=upload_id)
-            self.is_valid_chunked_upload(chunked_upload)
-        else:
-            attrs = {'filename': chunk.name}
-            attrs.update(self.get_extra_attrs(request))
-            chunked_upload = self.create_chunked_upload(save=False, **attrs)
+    def get_content_range(self, request, size):
+        """
+        Returns the (start, end, total) values of the Content-Range header.
+        `size` is the size of the chunk, used when there is no header.
+        """
+        return self.parse_content_range(
+            request.META.get(self.content_range_header, ''), size)
 
-        content_range = request.META.get(self.content_range_header, '')
+    def parse_content_range(self, content_range, size):
+        """
+        Returns the (start, end, total) values of the Content-Range header
+        value `content_range`.
+        """
         match = self.content_range_pattern.match(content_range)
         if match:
             start = int(match.group('start'))
@@ -200,9 +416,15 @@ class ChunkedUploadView(ChunkedUploadBaseView):
         else:
             # Use the whole size when HTTP_CONTENT_RANGE is not provided
             start = 0
-            end = chunk.size - 1
-            total = chunk.size
+            end = size - 1
+            total = size
+        return start, end, total
 
+    def check_chunk(self, request, chunked_upload, start, end, total, size):
+        """
+        Check if a chunk of `size` bytes for the range `start`-`end` (of
+        `total` bytes) can be appended to the chunked upload.
+        """
         chunk_size = end - start + 1
         max_bytes = self.get_max_bytes(request)
 
@@ -211,17 +433,545 @@ class ChunkedUploadView(ChunkedUploadBaseView):
                 status=http_status.HTTP_400_BAD_REQUEST,
                 detail='Size of file exceeds the limit (%s bytes)' % max_bytes
             )
-        if chunked_upload.offset != start:
-            raise ChunkedUploadError(status=http_status.HTTP_400_BAD_REQUEST,
+        if self.allow_out_of_order:
+            if end >= total or (chunked_upload.total_size is not None
+                                and total != chunked_upload.total_size):
+                raise ChunkedUploadError(
+                    status=http_status.HTTP_400_BAD_REQUEST,
+                    detail='Invalid Content-Range header')
+        elif chunked_upload.offset != start:
+            raise ChunkedUploadError(status=self.offset_mismatch_status,
                                      detail='Offsets do not match',
                                      offset=chunked_upload.offset)
-        if chunk.size != chunk_size:
+        if size != chunk_size:
             raise ChunkedUploadError(status=http_status.HTTP_400_BAD_REQUEST,
                                      detail="File size doesn't match headers")
 
-        chunked_upload.append_chunk(chunk, chunk_size=chunk_size, save=False)
+    def preallocate_file(self, chunked_upload, size):
+        """
+        Preallocates the file of a new upload receiving chunks in order (the
+        first one of `size` bytes), if `preallocate`.
+        """
+        if (self.preallocate and not self.allow_out_of_order
+                and chunked_upload.total_size > size):
+            self.preallocate_upload(chunked_upload, keep_size=True)
+
+    def preallocate_upload(self, chunked_upload, keep_size=False):
+        """
+        Preallocates the file of a new upload with its total size, unless
+        larger than `max_preallocate`. If there isn't enough space, the file
+        is deleted and a 507 error is raised.
+        """
+        total = chunked_upload.total_size
+        if self.max_preallocate is not None and total > self.max_preallocate:
+            return
+        try:
+            chunked_upload.preallocate(total, keep_size=keep_size)
+        except OSError as error:
+            if error.errno not in (errno.ENOSPC, errno.EDQUOT):
+                raise
+            chunked_upload.assembler.delete()
+            raise ChunkedUploadError(
+                status=http_status.HTTP_507_INSUFFICIENT_STORAGE,
+                detail='Not enough storage space for the upload')
 
+    def write_chunk_at(self, request, chunked_upload, chunk, start, checksum):
+        """
+        Writes a chunk received out of order at its position in the file,
+        and saves the chunked upload (which must be locked, so it can't be
+        completed meanwhile). Returns the saved instance.
+        """
+        if chunked_upload.id is None:
+            self.preallocate_upload(chunked_upload)
+        size, digest = chunked_upload.write_chunk_at(chunk, start,
+                                                     checksum=checksum)
+        chunked_upload.chunk_written(size, checksum=checksum, digest=digest,
+                                     save=False, start=start)
         self._save(chunked_upload)
+        return chunked_upload
+
+    def _post(self, request, *args, **kwargs):
+        with measure(type(self), 'parse', size=get_content_length(request)):
+            chunk = request.FILES.get(self.field_name)
+        if chunk is None:
+            raise ChunkedUploadError(status=http_status.HTTP_400_BAD_REQUEST,
+                                     detail='No chunk file was submitted')
+        self.validate(request)
+
+        upload_id = request.POST.get('upload_id') or request.GET.get('upload_id')
+        written = isinstance(chunk, WrittenChunk)
+        state_cache = get_state_cache()
+        if (state_cache is not None and upload_id and not written
+                and not self.allow_out_of_order):
+            # Appends are serialized by a lock in the cache instead
+            with state_cache.lock(upload_id) as lock:
+                with measure(type(self), 'lookup', upload_id=upload_id):
+                    chunked_upload = self.get_cached_chunked_upload(
+                        request, upload_id, state_cache)
+                self.is_valid_chunked_upload(chunked_upload)
+                chunked_upload = self.add_chunk(request, chunked_upload, chunk,
+                                                state_cache=state_cache,
+                                                lock=lock)
+            return self.get_ack_response(chunked_upload, request)
+
+        with transaction.atomic():
+            if written:
+                if chunk.chunked_upload.upload_id != upload_id:
+                    raise ChunkedUploadError(
+                        status=http_status.HTTP_400_BAD_REQUEST,
+                        detail="'upload_id' does not match")
+                # Already fetched (locked and written into) by the handler
+                chunked_upload = chunk.chunked_upload
+                self.is_valid_chunked_upload(chunked_upload)
+            elif upload_id:
+                # Appends are serialized per upload: concurrent requests wait
+                # for the lock, and then fail the offset check (or write
+                # their chunk, if out of order). Chunks are only written
+                # once the upload is locked and checked, so they can't
+                # modify the file of an upload completed meanwhile
+                queryset = self.get_queryset(request).select_for_update()
+                with measure(type(self), 'lookup', upload_id=upload_id):
+                    chunked_upload = get_object_or_404(queryset,
+                                                       upload_id=upload_id)
+                self.is_valid_chunked_upload(chunked_upload)
+            else:
+                attrs = {'filename': chunk.name}
+                attrs.update(self.get_extra_attrs(request))
+                chunked_upload = self.create_chunked_upload(save=False, **attrs)
+            chunked_upload = self.add_chunk(request, chunked_upload, chunk)
+
+        return self.get_ack_response(chunked_upload, request)
+
+    def get_ack_response(self, chunked_upload, request):
+        """
+        Response acknowledging a chunk added to the chunked upload (see
+        `ack_mode`).
+        """
+        if self.ack_mode is None:
+            return Response(self.get_response_data(chunked_upload, request),
+                            status=http_status.HTTP_200_OK)
+        received_ranges = None
+        if self.allow_out_of_order:
+            received_ranges = chunked_upload.get_received_ranges()
+        return ack_response(chunked_upload, self.ack_mode,
+                            received_ranges=received_ranges)
+
+    def add_chunk(self, request, chunked_upload, chunk, state_cache=None,
+                  lock=None):
+        """
+        Checks `chunk` and adds it to the chunked upload, which is saved (or
+        only cached, if its state is kept in `state_cache`, under `lock`).
+        Returns the saved instance.
+        """
+        start, end, total = self.get_content_range(request, chunk.size)
+        self.check_chunk(request, chunked_upload, start, end, total,
+                         chunk.size)
+        if chunked_upload.total_size is None:
+            chunked_upload.total_size = total
+            self.preallocate_file(chunked_upload, chunk.size)
+
+        checksum = (request.POST.get(self.checksum_field_name)
+                    or request.GET.get(self.checksum_field_name) or None)
+        if self.allow_out_of_order:
+            return self.write_chunk_at(request, chunked_upload, chunk, start,
+                                       checksum)
+        if isinstance(chunk, WrittenChunk):
+            chunked_upload.chunk_written(
+                chunk.size, md5_hasher=chunk.md5_hasher,
+                checksum=checksum, digest=chunk.digest, save=False)
+        else:
+            chunked_upload.append_chunk(chunk, chunk_size=chunk.size,
+                                        save=False, checksum=checksum)
+        if state_cache is None:
+            self._save(chunked_upload)
+        else:
+            self.save_state(chunked_upload, state_cache, lock)
+        return chunked_upload
+
+    def get_cached_chunked_upload(self, request, upload_id, state_cache):
+        """
+        Returns the upload `upload_id`, with its cached state if any. The
+        database is only read if it isn't cached, or to check the access to
+        uploads of other users (see `get_queryset`).
+        """
+        chunked_upload = state_cache.get(self.model, upload_id)
+        if chunked_upload is None:
+            chunked_upload = get_object_or_404(self.get_queryset(request),
+                                               upload_id=upload_id)
+            # Just read from the database
+            chunked_upload._state_saved_at = time.time()
+            return chunked_upload
+        owner_id = None
+        if hasattr(self.model, self.user_field_name):
+            owner_id = getattr(chunked_upload, self.model._meta.get_field(
+                self.user_field_name).attname)
+        user = getattr(request, 'user', None)
+        if owner_id is None or user is None or user.pk != owner_id:
+            queryset = self.get_queryset(request)
+            if not queryset.filter(pk=chunked_upload.pk).exists():
+                raise Http404('No upload matches the given query.')
+        return chunked_upload
+
+    def save_state(self, chunked_upload, state_cache, lock):
+        """
+        Caches the state of the chunked upload, and saves it if it's time to
+        write it back to the database (or the upload is complete). Raises a
+        409 `ChunkedUploadError` instead if `lock` was lost meanwhile (e.g.
+        the process was paused), since another request may have appended to
+        the upload.
+        """
+        lock.check(detail='Upload lock was lost, the chunk was not saved')
+        if state_cache.needs_write_back(chunked_upload):
+            self._save(chunked_upload)
+            chunked_upload._state_saved_at = time.time()
+        state_cache.set(chunked_upload)
+
+    def post(self, request, *args, **kwargs):
+        if (self.upload_handler_class is not None
+                and not hasattr(request, '_files')):
+            request.upload_handlers.insert(
+                0, self.upload_handler_class(request, view=self))
+            # The handler locks the upload while the request is parsed, the
+            # lock is held until the view is done with it
+            with transaction.atomic():
+                return super(ChunkedUploadView, self).post(
+                    request, *args, **kwargs)
+        return super(ChunkedUploadView, self).post(request, *args, **kwargs)
+
+
+class ChunkedUploadBatchView(ChunkedUploadView):
+    """
+    Uploads several chunks, of one or more uploads, with a single request
+    (saving the per request overhead for small chunks). The `chunks` field
+    lists them as JSON, with the name of the file field of each chunk, its
+    `upload_id` (a new upload is started if omitted), `content_range` (like
+    the Content-Range header) and optional `checksum`::
+
+        [{"file": "chunk0", "upload_id": "...",
+          "content_range": "bytes 0-99999/300000"}, ...]
+
+    The chunks of each upload are checked and appended in order of their
+    range, and the upload is saved once. The response lists the result of
+    each chunk (the response data of `ChunkedUploadView`, or the error
+    `detail`, with its `status`), in the order of `chunks`.
+    """
+
+    chunks_field_name = 'chunks'
+
+    def get_chunk_entries(self, request):
+        """
+        Returns the chunks listed in the request, as dicts with their
+        `index`, `chunk` (uploaded file), `upload_id`, `start`, `end`,
+        `total` and `checksum`.
+        """
+        try:
+            listed = json.loads(request.POST.get(self.chunks_field_name, ''))
+        except ValueError:
+            listed = None
+        if not isinstance(listed, list) or not listed:
+            raise ChunkedUploadError(
+                status=http_status.HTTP_400_BAD_REQUEST,
+                detail="Invalid '%s' field" % self.chunks_field_name)
+        entries = []
+        for index, item in enumerate(listed):
+            chunk = (request.FILES.get(item.get('file'))
+                     if isinstance(item, dict) else None)
+            if chunk is None:
+                raise ChunkedUploadError(
+                    status=http_status.HTTP_400_BAD_REQUEST,
+                    detail='No chunk file was submitted', index=index)
+            start, end, total = self.parse_content_range(
+                item.get('content_range') or '', chunk.size)
+            entries.append({
+                'index': index,
+                'chunk': chunk,
+                'upload_id': item.get('upload_id') or None,
+                'start': start,
+                'end': end,
+                'total': total,
+                'checksum': item.get('checksum') or None,
+            })
+        return entries
+
+    def starts_upload(self, request):
+        if request.method != 'POST':
+            return False
+        try:
+            listed = json.loads(request.POST.get(self.chunks_field_name, ''))
+        except ValueError:
+            return False
+        return isinstance(listed, list) and any(
+            isinstance(item, dict) and not item.get('upload_id')
+            for item in listed)
+
+    def add_chunks(self, request, chunked_upload, entries):
+        """
+        Checks and appends (or writes, if out of order) the chunks of
+        `entries` to the chunked upload, without saving it. Returns the
+        entries of the chunks added, and the errors of the others by index.
+        """
+        added, errors = [], {}
+        for entry in sorted(entries, key=lambda entry: entry['start']):
+            chunk = entry['chunk']
+            try:
+                self.check_chunk(request, chunked_upload, entry['start'],
+                                 entry['end'], entry['total'], chunk.size)
+                if chunked_upload.total_size is None:
+                    chunked_upload.total_size = entry['total']
+                    self.preallocate_file(chunked_upload, chunk.size)
+                if self.allow_out_of_order:
+                    if chunked_upload.id is None and not added:
+                        self.preallocate_upload(chunked_upload)
+                    entry['written'] = chunked_upload.write_chunk_at(
+                        chunk, entry['start'], checksum=entry['checksum'])
+                else:
+                    chunked_upload.append_chunk(
+                        chunk, chunk_size=chunk.size, save=False,
+                        checksum=entry['checksum'])
+            except ChunkedUploadError as error:
+                errors[entry['index']] = error
+            else:
+                added.append(entry)
+        return added, errors
+
+    def process_upload(self, request, upload_id, entries):
+        """
+        Adds the chunks of `entries` to the upload `upload_id` (or to a new
+        upload if `None`), saving it once. Returns the saved instance (or
+        `None` if nothing was saved) and the errors of the chunks by index.
+        """
+        state_cache = get_state_cache()
+        if upload_id is None:
+            attrs = {'filename': entries[0]['chunk'].name}
+            attrs.update(self.get_extra_attrs(request))
+            chunked_upload = self.create_chunked_upload(save=False, **attrs)
+            added, errors = self.add_chunks(request, chunked_upload, entries)
+            if self.allow_out_of_order:
+                added = self.register_chunks(chunked_upload, added, errors)
+            if not added:
+                chunked_upload.assembler.delete()
+                return None, errors
+            self._save(chunked_upload)
+            return chunked_upload, errors
+
+        if state_cache is not None and not self.allow_out_of_order:
+            with state_cache.lock(upload_id) as lock:
+                chunked_upload = self.get_cached_chunked_upload(
+                    request, upload_id, state_cache)
+                self.is_valid_chunked_upload(chunked_upload)
+                added, errors = self.add_chunks(request, chunked_upload,
+                                                entries)
+                if added:
+                    self.save_state(chunked_upload, state_cache, lock)
+            return chunked_upload, errors
+
+        queryset = self.get_queryset(request)
+        with transaction.atomic():
+            # Chunks are only written once the upload is locked and checked
+            chunked_upload = get_object_or_404(queryset.select_for_update(),
+                                               upload_id=upload_id)
+            self.is_valid_chunked_upload(chunked_upload)
+            added, errors = self.add_chunks(request, chunked_upload, entries)
+            if self.allow_out_of_order:
+                added = self.register_chunks(chunked_upload, added, errors)
+            if added:
+                self._save(chunked_upload)
+        return chunked_upload, errors
+
+    def register_chunks(self, chunked_upload, added, errors):
+        """
+        Registers the chunks written out of order by `add_chunks`, adding
+        the errors (checksum mismatches) to `errors`. Returns the entries of
+        the chunks registered.
+        """
+        registered = []
+        for entry in added:
+            size, digest = entry['written']
+            try:
+                chunked_upload.chunk_written(
+                    size, checksum=entry['checksum'], digest=digest,
+                    save=False, start=entry['start'])
+            except ChunkedUploadError as error:
+                errors[entry['index']] = error
+            else:
+                registered.append(entry)
+        return registered
+
+    def _post(self, request, *args, **kwargs):
+        self.validate(request)
+        entries = self.get_chunk_entries(request)
+
+        # Chunks grouped by upload, in order of appearance
+        uploads = {}
+        for entry in entries:
+            key = entry['upload_id'] or ('new', entry['index'])
+            uploads.setdefault(key, []).append(entry)
+
+        results = [None] * len(entries)
+        for key, upload_entries in uploads.items():
+            upload_id = key if isinstance(key, str) else None
+            try:
+                chunked_upload, errors = self.process_upload(
+                    request, upload_id, upload_entries)
+            except Http404:
+                error = ChunkedUploadError(status=http_status.HTTP_404_NOT_FOUND,
+                                           detail='Upload not found')
+                errors = {entry['index']: error for entry in upload_entries}
+            except ChunkedUploadError as error:
+                errors = {entry['index']: error for entry in upload_entries}
+            for entry in upload_entries:
+                error = errors.get(entry['index'])
+                if error is not None:
+                    result = dict(error.data, status=error.status_code)
+                else:
+                    result = dict(self.get_response_data(chunked_upload,
+                                                         request),
+                                  status=http_status.HTTP_200_OK)
+                results[entry['index']] = result
+
+        return Response({'chunks': results}, status=http_status.HTTP_200_OK)
+
+
+class ChunkedUploadDedupView(ChunkedUploadView):
+    """
+    Uploads files whose chunks are deduplicated, across uploads, in the chunk
+    store (see `StoredChunk`):
+
+    1. The client sends the `chunks` of the file (JSON list of their sha256
+       hex digest and size, in order) and its `filename`. The chunks already
+       stored are referenced, and the response lists the `missing` ones.
+    2. The client sends each missing chunk (`file` field) with its `digest`
+       and the `upload_id`.
+    3. The upload is completed with `ChunkedUploadCompleteView`, which puts
+       the file together from the stored chunks.
+    """
+
+    chunks_field_name = 'chunks'
+    digest_field_name = 'digest'
+    digest_pattern = re.compile(r'^[0-9a-f]{64}$')
+
+    def get_response_data(self, chunked_upload, request):
+        data = super(ChunkedUploadDedupView, self).get_response_data(
+            chunked_upload, request)
+        data['missing'] = chunked_upload.get_missing_chunks()
+        return data
+
+    def get_chunk_manifest(self, request):
+        """
+        Returns the list of [digest, size] of the chunks of the file.
+        """
+        try:
+            manifest = json.loads(request.POST.get(self.chunks_field_name, ''))
+        except ValueError:
+            manifest = None
+        if (not isinstance(manifest, list) or not manifest or not all(
+                isinstance(item, list) and len(item) == 2
+                and isinstance(item[0], str)
+                and self.digest_pattern.match(item[0])
+                and isinstance(item[1], int) and item[1] > 0
+                for item in manifest)):
+            raise ChunkedUploadError(
+                status=http_status.HTTP_400_BAD_REQUEST,
+                detail="Invalid '%s' field" % self.chunks_field_name)
+        return manifest
+
+    def get_owned_chunks(self, request, chunked_upload):
+        """
+        Digests of the stored chunks referenced by the other uploads of the
+        user, which can be referenced without being sent. Other chunks have
+        to be sent (and verified) even if stored, so an upload can't
+        reference data its client doesn't have (e.g. knowing its digest).
+        """
+        user = getattr(request, 'user', None)
+        if (not hasattr(self.model, self.user_field_name) or user is None
+                or not is_authenticated(user)):
+            return set()
+        owned = set()
+        chunk_refs = self.model.objects.filter(
+            **{self.user_field_name: user}
+        ).exclude(chunk_refs='').exclude(pk=chunked_upload.pk).values_list(
+            'chunk_refs', flat=True)
+        for refs in chunk_refs.iterator():
+            owned.update(json.loads(refs))
+        return owned
+
+    def set_chunk_manifest(self, request, chunked_upload):
+        """
+        Sets the manifest of the upload, and references the chunks already
+        stored for the user (see `get_owned_chunks`).
+        """
+        manifest = self.get_chunk_manifest(request)
+        if chunked_upload.chunk_manifest:
+            if manifest != chunked_upload.get_chunk_manifest():
+                raise ChunkedUploadError(
+                    status=http_status.HTTP_400_BAD_REQUEST,
+                    detail="Chunks don't match the upload")
+            return
+        if chunked_upload.offset:
+            raise ChunkedUploadError(
+                status=http_status.HTTP_400_BAD_REQUEST,
+                detail='Upload is not deduplicated')
+        total = sum(size for digest, size in manifest)
+        max_bytes = self.get_max_bytes(request)
+        if max_bytes is not None and total > max_bytes:
+            raise ChunkedUploadError(
+                status=http_status.HTTP_400_BAD_REQUEST,
+                detail='Size of file exceeds the limit (%s bytes)' % max_bytes
+            )
+        chunked_upload.chunk_manifest = json.dumps(manifest)
+        chunked_upload.total_size = total
+        owned = self.get_owned_chunks(request, chunked_upload)
+        chunked_upload.add_chunk_refs(StoredChunk.reference([
+            digest for digest in chunked_upload.get_missing_chunks()
+            if digest in owned]))
+
+    def store_chunk(self, request, chunked_upload, chunk):
+        """
+        Stores a missing chunk of the upload.
+        """
+        digest = (request.POST.get(self.digest_field_name) or '').lower()
+        sizes = dict((d, size) for d, size
+                     in chunked_upload.get_chunk_manifest())
+        if digest not in sizes:
+            raise ChunkedUploadError(
+                status=http_status.HTTP_400_BAD_REQUEST,
+                detail='Chunk is not part of the upload')
+        if digest in chunked_upload.get_chunk_refs():
+            return  # Sent again
+        if chunk.size != sizes[digest]:
+            raise ChunkedUploadError(status=http_status.HTTP_400_BAD_REQUEST,
+                                     detail="File size doesn't match headers")
+        StoredChunk.store(chunk, digest)
+        chunked_upload.add_chunk_refs([digest])
+
+    def _post(self, request, *args, **kwargs):
+        self.validate(request)
+        chunk = request.FILES.get(self.field_name)
+        upload_id = request.POST.get('upload_id') or request.GET.get('upload_id')
+
+        with transaction.atomic():
+            if upload_id:
+                queryset = self.get_queryset(request).select_for_update()
+                chunked_upload = get_object_or_404(queryset, upload_id=upload_id)
+                self.is_valid_chunked_upload(chunked_upload)
+            elif chunk is None:
+                attrs = {'filename': request.POST.get('filename', '')}
+                attrs.update(self.get_extra_attrs(request))
+                chunked_upload = self.create_chunked_upload(save=False, **attrs)
+            else:
+                raise ChunkedUploadError(
+                    status=http_status.HTTP_400_BAD_REQUEST,
+                    detail="'upload_id' is required")
+
+            if chunk is None:
+                self.set_chunk_manifest(request, chunked_upload)
+            else:
+                if not chunked_upload.chunk_manifest:
+                    raise ChunkedUploadError(
+                        status=http_status.HTTP_400_BAD_REQUEST,
+                        detail='Upload is not deduplicated')
+                self.store_chunk(request, chunked_upload, chunk)
+            self._save(chunked_upload)
 
         return Response(self.get_response_data(chunked_upload, request),
                         status=http_status.HTTP_200_OK)
@@ -236,6 +986,14 @@ class ChunkedUploadCompleteView(ChunkedUploadBaseView):
     # I wouldn't recommend to turn off the md5 check, unless is really
     # impacting your performance. Proceed at your own risk.
     do_md5_check = True
+    # Field with the checksum of the whole file (see `checksum_algorithm` in
+    # the model). If sent, it's verified instead of the md5
+    checksum_field_name = 'checksum'
+    # Executor (dotted path, see `chunked_upload.completion`) verifying and
+    # processing (`process_completion`) the upload in the background. If
+    # set, the upload is marked as "processing" and the server responds 202
+    # right away. Its status is reported by `ChunkedUploadStatusView`
+    completion_executor = COMPLETION_EXECUTOR
 
     def on_completion(self, uploaded_file, request):
         """
@@ -248,8 +1006,8 @@ class ChunkedUploadCompleteView(ChunkedUploadBaseView):
         """
         if chunked_upload.status == COMPLETE:
             error_msg = "Upload has already been marked as complete"
-            return ChunkedUploadError(status=http_status.HTTP_400_BAD_REQUEST,
-                                      detail=error_msg)
+            raise ChunkedUploadError(status=http_status.HTTP_400_BAD_REQUEST,
+                                     detail=error_msg)
 
     def md5_check(self, chunked_upload, md5):
         """
@@ -259,12 +1017,128 @@ class ChunkedUploadCompleteView(ChunkedUploadBaseView):
             raise ChunkedUploadError(status=http_status.HTTP_400_BAD_REQUEST,
                                      detail='md5 checksum does not match')
 
+    def checksum_check(self, chunked_upload, checksum):
+        """
+        Verify if checksum sent by client matches the uploaded data.
+        """
+        if not chunked_upload.verify_checksum(checksum):
+            raise ChunkedUploadError(status=http_status.HTTP_400_BAD_REQUEST,
+                                     detail='checksum does not match')
+
+    def verify(self, chunked_upload, md5=None, checksum=None):
+        """
+        Assembles the file and verifies its checksum (or md5).
+        """
+        if chunked_upload.chunk_manifest:
+            # Deduplicated upload, see `ChunkedUploadDedupView`
+            chunked_upload.append_stored_chunks()
+        size, upload_id = chunked_upload.total_size, chunked_upload.upload_id
+        with measure(type(self), 'assemble', size=size, upload_id=upload_id):
+            chunked_upload.assemble()
+        if checksum:
+            with measure(type(self), 'checksum_check', size=size,
+                         upload_id=upload_id):
+                self.checksum_check(chunked_upload, checksum)
+        elif self.do_md5_check:
+            with measure(type(self), 'md5_check', size=size,
+                         upload_id=upload_id):
+                self.md5_check(chunked_upload, md5)
+
+    def process_completion(self, chunked_upload, md5=None, checksum=None):
+        """
+        Verifies and completes an upload marked as "processing", in the
+        background (`request` is `None`). The data returned by
+        `on_completion` (if any) is saved as the result of the upload. If the
+        verification fails, the upload is marked as "uploading" again (so it
+        can be completed again, like when completed within the request) with
+        the error as its result. If `on_completion` fails, the upload is
+        marked as "failed".
+        """
+        status, result = COMPLETE, None
+        try:
+            try:
+                self.verify(chunked_upload, md5=md5, checksum=checksum)
+            except ChunkedUploadError as error:
+                status, result = UPLOADING, error.data
+            else:
+                # Rolled back if it fails, so the upload can still be saved
+                with transaction.atomic():
+                    result = self._on_completion(chunked_upload, None)
+        except ChunkedUploadError as error:
+            status, result = FAILED, error.data
+        except Exception:
+            logger.exception('Processing of upload %s failed',
+                             chunked_upload.upload_id)
+            status, result = FAILED, {'detail': 'Upload processing failed'}
+        finally:
+            chunked_upload.file.close()
+        chunked_upload.status = status
+        if status == COMPLETE:
+            chunked_upload.completed_on = timezone.now()
+        chunked_upload.completion_result = (
+            json.dumps(result, cls=DjangoJSONEncoder)
+            if result is not None else '')
+        self._save(chunked_upload)
+
+    def submit_completion(self, chunked_upload, md5=None, checksum=None):
+        """
+        Marks the upload as "processing" and submits it to the
+        `completion_executor` (once the transaction is committed).
+        """
+        chunked_upload.status = PROCESSING
+        chunked_upload.processing_on = timezone.now()
+        chunked_upload.completion_result = ''
+        self._save(chunked_upload)
+        view_path = '%s.%s' % (self.__module__, type(self).__qualname__)
+        executor = get_completion_executor(self.completion_executor)
+        transaction.on_commit(lambda: executor.submit(
+            view_path, chunked_upload.upload_id, md5 or None,
+            checksum or None))
+
+    @contextmanager
+    def lock_cached_state(self, upload_id):
+        """
+        Writes back the cached state of the upload (if any, see
+        `CHUNKED_UPLOAD_STATE_CACHE`), so it's read from the database, and
+        holds its lock in the cache until the block is done: chunks appended
+        to cached uploads don't take the row lock, they wait until the
+        upload is no longer "uploading" (and are then rejected).
+        """
+        state_cache = get_state_cache()
+        if state_cache is None:
+            yield
+            return
+        with state_cache.lock(upload_id) as lock:
+            state_cache.flush(self.model, upload_id, lock=lock)
+            yield
+
+    def check_completion(self, request, chunked_upload):
+        """
+        Checks the upload can be completed (only once: it must be
+        "uploading", or "processing" for too long, see
+        `CHUNKED_UPLOAD_PROCESSING_TIMEOUT`).
+        """
+        self.validate(request)
+        self.is_valid_chunked_upload(chunked_upload)
+        if (chunked_upload.status != UPLOADING
+                and not chunked_upload.processing_stale):
+            raise ChunkedUploadError(
+                status=http_status.HTTP_400_BAD_REQUEST,
+                detail='Upload has already been marked as "%s"'
+                       % STATUS_NAMES[chunked_upload.status])
+        missing_ranges = chunked_upload.missing_ranges
+        if missing_ranges:
+            raise ChunkedUploadError(status=http_status.HTTP_400_BAD_REQUEST,
+                                     detail='Upload is incomplete',
+                                     missing_ranges=missing_ranges)
+
     def _post(self, request, *args, **kwargs):
         upload_id = request.POST.get('upload_id')
         md5 = request.POST.get('md5')
+        checksum = request.POST.get(self.checksum_field_name)
 
         error_msg = None
-        if self.do_md5_check:
+        if self.do_md5_check and not checksum:
             if not upload_id or not md5:
                 error_msg = "Both 'upload_id' and 'md5' are required"
         elif not upload_id:
@@ -273,18 +1147,570 @@ class ChunkedUploadCompleteView(ChunkedUploadBaseView):
             raise ChunkedUploadError(status=http_status.HTTP_400_BAD_REQUEST,
                                      detail=error_msg)
 
-        chunked_upload = get_object_or_404(self.get_queryset(request),
-                                           upload_id=upload_id)
+        queryset = self.get_queryset(request)
+        if self.completion_executor is not None:
+            with self.lock_cached_state(upload_id), transaction.atomic():
+                # Only one request marks the upload as "processing"
+                chunked_upload = get_object_or_404(
+                    queryset.select_for_update(), upload_id=upload_id)
+                self.check_completion(request, chunked_upload)
+                self.submit_completion(chunked_upload, md5=md5,
+                                       checksum=checksum)
+            return Response(self.get_status_data(chunked_upload, request),
+                            status=http_status.HTTP_202_ACCEPTED)
 
-        self.validate(request)
-        self.is_valid_chunked_upload(chunked_upload)
-        if self.do_md5_check:
-            self.md5_check(chunked_upload, md5)
+        with self.lock_cached_state(upload_id), transaction.atomic():
+            # Locked while it's verified, so no chunk can be written into the
+            # file meanwhile
+            with measure(type(self), 'lookup', upload_id=upload_id):
+                chunked_upload = get_object_or_404(
+                    queryset.select_for_update(), upload_id=upload_id)
+            self.check_completion(request, chunked_upload)
+            try:
+                self.verify(chunked_upload, md5=md5, checksum=checksum)
+            except ChunkedUploadError as error:
+                # The state of the assembler (saved by `assemble`) is kept
+                failure = error
+            else:
+                failure = None
+                chunked_upload.status = COMPLETE
+                chunked_upload.completed_on = timezone.now()
+                chunked_upload.completion_result = ''
+                self._save(chunked_upload)
+        if failure is not None:
+            raise failure
+        self._on_completion(chunked_upload, request)
+
+        return Response(self.get_response_data(chunked_upload, request),
+                        status=http_status.HTTP_200_OK)
+
+
+class ChunkedUploadDownloadView(ChunkedUploadBaseView):
+    """
+    Downloads the file of a complete upload, with support of (single) byte
+    ranges. With `allow_incomplete`, the data already received of uploads
+    in progress can be read too (e.g. to check the header of the file early),
+    within the ranges received.
+    The upload is identified by the `upload_id` URL keyword argument or query
+    string parameter.
+    """
+
+    http_method_names = ['get', 'head', 'options']
+    range_pattern = re.compile(r'^bytes=(?P<start>\d*)-(?P<end>\d*)$')
+    # If `allow_incomplete` is True, uploads in progress can be read
+    allow_incomplete = False
+    # Send the file as an attachment (Content-Disposition header)
+    as_attachment = False
+    # Header offloading the sending of complete local files to the web
+    # server: 'X-Accel-Redirect' (nginx, with the URL `offload_prefix` +
+    # the name of the file, of an internal location serving the storage) or
+    # 'X-Sendfile' (Apache, lighttpd, with the path of the file). Otherwise,
+    # local files are sent with `os.sendfile` by the WSGI servers supporting
+    # it (`wsgi.file_wrapper`, e.g. gunicorn)
+    offload_header = None
+    offload_prefix = '/protected/'
+
+    def check_readable(self, chunked_upload):
+        """
+        Checks the data of the chunked upload can be read.
+        """
+        if chunked_upload.status == COMPLETE:
+            return
+        if chunked_upload.status == UPLOADING and self.allow_incomplete:
+            if chunked_upload.expired:
+                raise ChunkedUploadError(status=http_status.HTTP_410_GONE,
+                                         detail='Upload has expired')
+            return
+        raise ChunkedUploadError(
+            status=http_status.HTTP_400_BAD_REQUEST,
+            detail='Upload is "%s"' % STATUS_NAMES[chunked_upload.status])
+
+    def get_range(self, request, size):
+        """
+        Returns the (start, end) byte positions (inclusive) of the Range
+        header, for a file of `size` bytes, or `None` if there is no (valid)
+        header. Multiple ranges aren't supported, the whole file is sent.
+        """
+        match = self.range_pattern.match(request.META.get('HTTP_RANGE', ''))
+        if not match or not (match.group('start') or match.group('end')):
+            return None
+        if match.group('start'):
+            start = int(match.group('start'))
+            end = size - 1
+            if match.group('end'):
+                if int(match.group('end')) < start:
+                    return None
+                end = min(end, int(match.group('end')))
+        else:  # Last bytes
+            start = max(0, size - int(match.group('end')))
+            end = size - 1
+        if start > end:
+            self.range_not_satisfiable(size)
+        return start, end
+
+    def range_not_satisfiable(self, size):
+        error = ChunkedUploadError(
+            status=http_status.HTTP_416_RANGE_NOT_SATISFIABLE,
+            detail='Range not satisfiable')
+        error.headers = {'Content-Range': 'bytes */%s' % size}
+        raise error
+
+    def get_offload_response(self, chunked_upload):
+        """
+        Response offloading the sending of the file to the web server (which
+        handles the Range header itself).
+        """
+        response = HttpResponse(content_type=self.get_content_type(
+            chunked_upload))
+        if self.offload_header.lower() == 'x-sendfile':
+            response[self.offload_header] = chunked_upload.file.path
+        else:
+            # A URL, so names with e.g. spaces or '#' are quoted
+            response[self.offload_header] = (
+                self.offload_prefix + quote(chunked_upload.file.name))
+        if self.as_attachment:
+            response['Content-Disposition'] = (
+                "attachment; filename*=utf-8''%s"
+                % quote(chunked_upload.filename))
+        return response
+
+    def get_content_type(self, chunked_upload):
+        return (mimetypes.guess_type(chunked_upload.filename)[0]
+                or 'application/octet-stream')
 
+    def iter_data(self, chunked_upload, start, size):
+        """
+        Returns an iterator of the `size` bytes of data of the chunked upload
+        from `start`.
+        """
+        try:
+            # Reads the data written by the assembler (e.g. decompressed)
+            return chunked_upload.assembler.read(start, size)
+        except NotImplementedError:
+            if chunked_upload.status != COMPLETE:
+                raise ChunkedUploadError(
+                    status=http_status.HTTP_400_BAD_REQUEST,
+                    detail='Data of the upload cannot be read until it is '
+                           'complete')
+        return self.iter_file(chunked_upload, start, size)
+
+    def iter_file(self, chunked_upload, start, size):
+        file_obj = chunked_upload.assembler.open()
+        try:
+            file_obj.seek(start)
+            for data in read_file(file_obj, size):
+                yield data
+        finally:
+            file_obj.close()
+
+    def get_file_response(self, request, chunked_upload):
+        """
+        Response with the data of the chunked upload (in the Range of the
+        request, if any).
+        """
+        complete = chunked_upload.status == COMPLETE
+        local = chunked_upload.assembler.local
+        if complete and local and self.offload_header:
+            return self.get_offload_response(chunked_upload)
+
+        received = chunked_upload.get_received_ranges()
+        if complete:
+            size = chunked_upload.offset
+        elif chunked_upload.total_size is not None:
+            size = chunked_upload.total_size
+        else:
+            size = received[-1][1] if received else 0
+        byte_range = self.get_range(request, size)
+        if byte_range is not None:
+            start, end = byte_range
+        else:
+            start, end = 0, size - 1
+        if not complete:
+            # Only the data received can be read
+            for range_start, range_end in received:
+                if range_start <= start < range_end:
+                    end = min(end, range_end - 1)
+                    break
+            else:
+                self.range_not_satisfiable(chunked_upload.total_size or '*')
+        length = end - start + 1
+
+        if local:
+            file_obj = open(chunked_upload.file.path, mode='rb', buffering=0)
+            response = FileResponse(FileRange(file_obj, start, length),
+                                    as_attachment=self.as_attachment,
+                                    filename=chunked_upload.filename)
+        else:
+            response = StreamingHttpResponse(
+                self.iter_data(chunked_upload, start, length),
+                content_type=self.get_content_type(chunked_upload))
+            if self.as_attachment:
+                response['Content-Disposition'] = (
+                    "attachment; filename*=utf-8''%s"
+                    % quote(chunked_upload.filename))
+        response['Content-Length'] = length
+        response['Accept-Ranges'] = 'bytes'
+        if byte_range is not None or not complete:
+            response.status_code = http_status.HTTP_206_PARTIAL_CONTENT
+            response['Content-Range'] = 'bytes %i-%i/%s' % (
+                start, end, size if complete else
+                chunked_upload.total_size or '*')
+        if not complete:
+            response['Cache-Control'] = 'no-store'
+        return response
+
+    def get(self, request, *args, **kwargs):
+        """
+        Handle GET (and HEAD) requests.
+        """
+        try:
+            self.check_permissions(request)
+            upload_id = (kwargs.get('upload_id')
+                         or request.GET.get('upload_id'))
+            chunked_upload = get_object_or_404(self.get_queryset(request),
+                                               upload_id=upload_id)
+            self.check_readable(chunked_upload)
+            return self.get_file_response(request, chunked_upload)
+        except ChunkedUploadError as error:
+            return error_response(error)
+
+
+class ChunkedUploadStatusView(ChunkedUploadBaseView):
+    """
+    Reports the status of an upload (e.g. completed in the background, see
+    `ChunkedUploadCompleteView.completion_executor`): "uploading",
+    "processing", "complete" (with the `result` of `on_completion`, if any)
+    or "failed" (with the error `detail`).
+    The upload is identified by the `upload_id` URL keyword argument or query
+    string parameter.
+    """
+
+    http_method_names = ['get', 'head', 'options']
+
+    def get(self, request, *args, **kwargs):
+        """
+        Handle GET requests.
+        """
+        try:
+            self.check_permissions(request)
+            upload_id = (kwargs.get('upload_id')
+                         or request.GET.get('upload_id'))
+            chunked_upload = get_object_or_404(self.get_queryset(request),
+                                               upload_id=upload_id)
+            response = Response(self.get_status_data(chunked_upload, request),
+                                status=http_status.HTTP_200_OK)
+        except ChunkedUploadError as error:
+            response = error_response(error)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+
+class ChunkedUploadMetricsView(View):
+    """
+    Exposes the metrics of the `PrometheusMetrics` backend (see
+    `CHUNKED_UPLOAD_METRICS`) to Prometheus. Responds 404 if another backend
+    (or none) is used. Restrict the access to it in the URLconf (e.g. to the
+    internal network).
+    """
+
+    http_method_names = ['get', 'head', 'options']
+
+    def get(self, request, *args, **kwargs):
+        """
+        Handle GET requests.
+        """
+        metrics = get_metrics()
+        if not isinstance(metrics, PrometheusMetrics):
+            raise Http404('Prometheus metrics are not enabled.')
+        return HttpResponse(metrics.render(),
+                            content_type='text/plain; version=0.0.4; '
+                                         'charset=utf-8')
+
+
+class AsyncChunkedUploadView(ChunkedUploadView):
+    """
+    Async version of `ChunkedUploadView`, for ASGI deployments. The request is
+    processed (calling the same hook methods) in a bounded thread pool (see
+    `CHUNKED_UPLOAD_ASYNC_MAX_WORKERS`), so concurrent uploads don't hold a
+    thread each while they wait for it.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        """
+        Handle POST requests.
+        """
+        return await run_in_executor(
+            super(AsyncChunkedUploadView, self).post, request, *args, **kwargs)
+
+    async def get(self, request, *args, **kwargs):
+        """
+        Handle GET (and HEAD) requests.
+        """
+        return await run_in_executor(
+            super(AsyncChunkedUploadView, self).get, request, *args, **kwargs)
+
+
+class AsyncChunkedUploadCompleteView(ChunkedUploadCompleteView):
+    """
+    Async version of `ChunkedUploadCompleteView` (see
+    `AsyncChunkedUploadView`). `on_completion` is called in the thread pool
+    too.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        """
+        Handle POST requests.
+        """
+        return await run_in_executor(
+            super(AsyncChunkedUploadCompleteView, self).post, request, *args,
+            **kwargs)
+
+    async def get(self, request, *args, **kwargs):
+        """
+        Handle GET (and HEAD) requests.
+        """
+        return await run_in_executor(
+            super(AsyncChunkedUploadCompleteView, self).get, request, *args,
+            **kwargs)
+
+
+class ChunkedUploadTusView(ChunkedUploadView):
+    """
+    Uploads large files sending the chunks as the raw request body, instead
+    of multipart form data, so they can be written into the file while they
+    are read from the request.
+    Implements the core of the tus resumable upload protocol
+    (https://tus.io/protocols/resumable-upload) with the creation, checksum
+    and expiration extensions: uploads are created with a POST request with
+    the `Upload-Length` header, and chunks are sent with PATCH requests with
+    the `Upload-Offset` header. PUT requests with a `Content-Range` header are
+    accepted as well.
+    The upload is identified by the `upload_id` URL keyword argument or query
+    string parameter. Method `on_completion` is called once all the data has
+    been received.
+    """
+
+    http_method_names = ['post', 'patch', 'put', 'head', 'options']
+    tus_version = '1.0.0'
+    tus_extensions = ('creation', 'checksum', 'expiration')
+    content_type = 'application/offset+octet-stream'
+    offset_mismatch_status = http_status.HTTP_409_CONFLICT
+
+    def on_completion(self, uploaded_file, request):
+        """
+        Placeholder method to define what to do when upload is complete.
+        """
+
+    def get_upload_url(self, chunked_upload, request):
+        """
+        URL of the upload, returned in the `Location` header when created.
+        """
+        return request.build_absolute_uri(
+            '?upload_id=%s' % chunked_upload.upload_id)
+
+    def get_chunked_upload(self, request, *args, lock=False, **kwargs):
+        upload_id = kwargs.get('upload_id') or request.GET.get('upload_id')
+        queryset = self.get_queryset(request)
+        if lock:
+            queryset = queryset.select_for_update()
+        return get_object_or_404(queryset, upload_id=upload_id)
+
+    def get_metadata(self, request):
+        """
+        Returns the decoded values of the `Upload-Metadata` header.
+        """
+        metadata = {}
+        for pair in request.META.get('HTTP_UPLOAD_METADATA', '').split(','):
+            key, _, value = pair.strip().partition(' ')
+            if not key:
+                continue
+            try:
+                metadata[key] = base64.b64decode(value).decode('utf-8')
+            except ValueError:
+                raise ChunkedUploadError(
+                    status=http_status.HTTP_400_BAD_REQUEST,
+                    detail='Invalid Upload-Metadata header')
+        return metadata
+
+    def get_checksum(self, request, chunked_upload):
+        """
+        Returns the (hex) checksum in the `Upload-Checksum` header, if any.
+        """
+        header = request.META.get('HTTP_UPLOAD_CHECKSUM')
+        if not header:
+            return None
+        try:
+            algorithm, value = header.split(' ', 1)
+            checksum = base64.b64decode(value, validate=True).hex()
+        except ValueError:
+            raise ChunkedUploadError(status=http_status.HTTP_400_BAD_REQUEST,
+                                     detail='Invalid Upload-Checksum header')
+        if algorithm != chunked_upload.checksum_algorithm:
+            raise ChunkedUploadError(status=http_status.HTTP_400_BAD_REQUEST,
+                                     detail='Unsupported checksum algorithm')
+        return checksum
+
+    def get_upload_headers(self, chunked_upload):
+        headers = {
+            'Upload-Offset': chunked_upload.offset,
+            'Upload-Expires': http_date(chunked_upload.expires_on.timestamp()),
+        }
+        if chunked_upload.total_size is not None:
+            headers['Upload-Length'] = chunked_upload.total_size
+        return headers
+
+    def mark_complete(self, chunked_upload):
+        """
+        Assembles the file of an upload whose data has all been received,
+        and marks it as complete (without saving it).
+        """
+        chunked_upload.assemble(save=False)
         chunked_upload.status = COMPLETE
         chunked_upload.completed_on = timezone.now()
+
+    def tus_response(self, status, headers=None):
+        response = HttpResponse(status=status)
+        for name, value in (headers or {}).items():
+            response[name] = value
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            version = request.META.get('HTTP_TUS_RESUMABLE')
+            if (request.method != 'OPTIONS' and version is not None
+                    and version != self.tus_version):
+                response = self.tus_response(
+                    http_status.HTTP_412_PRECONDITION_FAILED,
+                    {'Tus-Version': self.tus_version})
+            else:
+                response = super(ChunkedUploadTusView, self).dispatch(
+                    request, *args, **kwargs)
+        except ChunkedUploadError as error:
+            response = error_response(error)
+        response['Tus-Resumable'] = self.tus_version
+        return response
+
+    def options(self, request, *args, **kwargs):
+        headers = {
+            'Tus-Version': self.tus_version,
+            'Tus-Extension': ','.join(self.tus_extensions),
+            'Tus-Checksum-Algorithm': CHECKSUM_ALGORITHM,
+        }
+        max_bytes = self.get_max_bytes(request)
+        if max_bytes is not None:
+            headers['Tus-Max-Size'] = max_bytes
+        return self.tus_response(http_status.HTTP_204_NO_CONTENT, headers)
+
+    def head(self, request, *args, **kwargs):
+        self.check_permissions(request)
+        chunked_upload = self.get_chunked_upload(request, *args, **kwargs)
+        if chunked_upload.expired:
+            raise ChunkedUploadError(status=http_status.HTTP_410_GONE,
+                                     detail='Upload has expired')
+        response = self.tus_response(http_status.HTTP_200_OK,
+                                     self.get_upload_headers(chunked_upload))
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def starts_upload(self, request):
+        return request.method == 'POST'
+
+    def _post(self, request, *args, **kwargs):
+        self.validate(request)
+        length = request.META.get('HTTP_UPLOAD_LENGTH', '')
+        if not length.isdigit():
+            raise ChunkedUploadError(status=http_status.HTTP_400_BAD_REQUEST,
+                                     detail='Upload-Length header is required')
+        total = int(length)
+        max_bytes = self.get_max_bytes(request)
+        if max_bytes is not None and total > max_bytes:
+            raise ChunkedUploadError(
+                status=http_status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail='Size of file exceeds the limit (%s bytes)' % max_bytes
+            )
+
+        attrs = {'filename': self.get_metadata(request).get('filename', '')}
+        attrs.update(self.get_extra_attrs(request))
+        chunked_upload = self.create_chunked_upload(save=False, **attrs)
+        chunked_upload.total_size = total
+        # Empty files are complete already (no PATCH request is sent)
+        complete = total == 0
+        if complete:
+            self.mark_complete(chunked_upload)
         self._save(chunked_upload)
-        self.on_completion(chunked_upload.get_uploaded_file(), request)
+        if complete:
+            self._on_completion(chunked_upload, request)
 
-        return Response(self.get_response_data(chunked_upload, request),
-                        status=http_status.HTTP_200_OK)
+        headers = self.get_upload_headers(chunked_upload)
+        headers['Location'] = self.get_upload_url(chunked_upload, request)
+        return self.tus_response(http_status.HTTP_201_CREATED, headers)
+
+    def patch(self, request, *args, **kwargs):
+        """
+        Handle PATCH (and PUT) requests.
+        """
+        self.check_permissions(request)
+        return self._patch(request, *args, **kwargs)
+
+    put = patch
+
+    def _patch(self, request, *args, **kwargs):
+        if (request.method == 'PATCH'
+                and request.content_type != self.content_type):
+            raise ChunkedUploadError(
+                status=http_status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail='Content-Type must be %s' % self.content_type)
+        self.validate(request)
+
+        # Appends are serialized per upload (see ChunkedUploadView._post)
+        with transaction.atomic():
+            chunked_upload = self.get_chunked_upload(request, *args, lock=True,
+                                                     **kwargs)
+            return self._append(request, chunked_upload)
+
+    def _append(self, request, chunked_upload):
+        self.is_valid_chunked_upload(chunked_upload)
+
+        size = request.META.get('CONTENT_LENGTH', '')
+        if not size.isdigit():
+            raise ChunkedUploadError(status=http_status.HTTP_411_LENGTH_REQUIRED,
+                                     detail='Content-Length header is required')
+        size = int(size)
+        if self.content_range_header in request.META:
+            start, end, total = self.get_content_range(request, size)
+        else:
+            offset = request.META.get('HTTP_UPLOAD_OFFSET', '')
+            if not offset.isdigit():
+                raise ChunkedUploadError(
+                    status=http_status.HTTP_400_BAD_REQUEST,
+                    detail='Upload-Offset header is required')
+            start = int(offset)
+            end = start + size - 1
+            total = chunked_upload.total_size
+            if total is None:
+                total = end + 1
+        self.check_chunk(request, chunked_upload, start, end, total, size)
+        if chunked_upload.total_size is None:
+            chunked_upload.total_size = total
+        if end >= chunked_upload.total_size:
+            raise ChunkedUploadError(
+                status=http_status.HTTP_400_BAD_REQUEST,
+                detail='Chunk exceeds the size of the file')
+
+        checksum = self.get_checksum(request, chunked_upload)
+        try:
+            # The request body is read (and written into the file) in blocks
+            chunked_upload.append_chunk(request, save=False, checksum=checksum)
+        except ChunkChecksumError as error:
+            error.status_code = http_status.HTTP_460_CHECKSUM_MISMATCH
+            raise
+
+        complete = chunked_upload.offset == chunked_upload.total_size
+        if complete:
+            self.mark_complete(chunked_upload)
+        self._save(chunked_upload)
+        if complete:
+            self._on_completion(chunked_upload, request)
+
+        return self.tus_response(http_status.HTTP_204_NO_CONTENT,
+                                 self.get_upload_headers(chunked_upload))
@@ -0,0 +1,26 @@
+"""
+Runs the tests of chunked_upload with pytest (see `runtests.py`), in a test
+database created for the session.
+"""
+import os
+
+import django
+import pytest
+
+
+def pytest_configure(config):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE',
+                          'chunked_upload.tests.settings')
+    django.setup()
+
+
+@pytest.fixture(scope='session', autouse=True)
+def django_test_environment():
+    from django.test.utils import (setup_databases, setup_test_environment,
+                                   teardown_databases,
+                                   teardown_test_environment)
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    yield
+    teardown_databases(old_config, verbosity=0)
+    teardown_test_environment()
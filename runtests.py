@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+"""
+Runs the tests of chunked_upload, e.g.::
+
+    python runtests.py
+    python runtests.py chunked_upload.tests.test_views
+"""
+import os
+import sys
+
+import django
+from django.conf import settings
+from django.test.utils import get_runner
+
+
+def main():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE',
+                          'chunked_upload.tests.settings')
+    django.setup()
+    runner = get_runner(settings)(verbosity=1)
+    failures = runner.run_tests(sys.argv[1:] or ['chunked_upload.tests'])
+    sys.exit(bool(failures))
+
+
+if __name__ == '__main__':
+    main()